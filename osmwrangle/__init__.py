@@ -0,0 +1,34 @@
+"""
+Auditing, cleaning and export of OpenStreetMap (OSM) XML data for a SQL database.
+
+Importing the package has no side effects: the pipeline is run from data.py or from the
+command line (python -m osmwrangle --help). Optional dependencies (cerberus, pyarrow) and the heavier
+standard library modules (multiprocessing) are only imported when they are used.
+"""
+
+from .parse import OSMElement, get_element, set_parser_backend
+from .compression import CompressingWriter, DecompressingReader, open_osm
+from .pbf import PBFReader, is_pbf, set_pbf_workers
+from .sample import sample_osm
+from .audit import (AuditEngine, AuditReport, AuditVisitor, TagCountVisitor, KeyTypeVisitor,
+                    UserVisitor, StreetVisitor, ZipVisitor, StateVisitor, audit_map, print_report)
+from .contributors import (ContributorStats, CountMinSketch, HyperLogLog, IntSet,
+                           contributor_stats)
+from .tagkeys import TagKeyClassifier, get_classifier
+from .fix import CleaningRules, fix_element, fix_osm
+from .shape import (shape_element, NODE_FIELDS, NODE_TAGS_FIELDS, WAY_FIELDS, WAY_TAGS_FIELDS,
+                    WAY_NODES_FIELDS, WAY_GEOMETRY_FIELDS)
+from .geometry import NodeIndex, build_node_index, way_geometry
+from .spatial import SpatialIndex, SpatialQuery
+from .tagindex import TagIndex
+from .validate import (CompiledValidator, ValidationError, compile_schema, get_validator,
+                       validate_element)
+from .export import (UnicodeDictWriter, TableWriter, process_map, process_map_parallel,
+                     write_elements)
+from .pipeline import process_map_pipelined
+from .checkpoint import process_map_checkpointed
+from .quarantine import Quarantine, set_quarantine_max_rate
+from .database import SQLiteSink, process_map_sqlite
+from .columnar import ColumnarSink, process_map_columnar
+from .incremental import apply_osc, apply_extract
+from .metrics import Metrics, StdoutSink, JSONLinesSink, NullSink, get_metrics, set_metrics
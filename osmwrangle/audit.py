@@ -0,0 +1,409 @@
+"""
+Data exploration and auditing of OSM files.
+"""
+
+import pprint
+import random
+import re
+import xml.etree.cElementTree as ET
+from collections import defaultdict
+
+from .contributors import TOP_N, ContributorStats, print_contributors
+from .parse import get_element
+from .tagkeys import LOWER, LOWER_COLON, PROBLEMCHARS, get_classifier
+
+# Data exploration:
+
+#
+# Iterative parsing to generate a dictionary of the various node names:
+# Code adapted from: Udacity OSM SQL Case Study Slide 3
+#
+
+def count_tags(filename):
+
+    tags={}
+
+    for event, elem in ET.iterparse(filename, events=("start",)):
+
+        if elem.tag in tags.keys():
+            tags[elem.tag] += 1
+        else:
+            tags[elem.tag] = 1
+
+    return tags
+
+#
+# Iterative parsing to generate a dictionary of the count of 4 tag categories:
+# Code adapted from: Udacity OSM SQL Case Study Slide 6
+#
+
+"""
+four tag categories were provided / defined by Udacity case study:
+
+  "lower", for tags that contain only lowercase letters and are valid,
+  "lower_colon", for otherwise valid tags with a colon in their names,
+  "problemchars", for tags with problematic characters, and
+  "other", for other tags that do not fall into the other three categories.
+"""
+
+lower, lower_colon, problemchars = LOWER, LOWER_COLON, PROBLEMCHARS
+
+# The category of each distinct key is only worked out once (see tagkeys.py):
+
+KEY_CLASSIFIER = get_classifier()
+
+def count_key(k, category, keys, samples=None):
+    keys[category] += 1
+
+# Random number allows a certain percent of 'other' tags to be printed (or collected,
+# when a samples list is passed in):
+
+    if category == 'other' and random.randint(1,100) <= 2:
+        if samples is None:
+            print k
+        else:
+            samples.append(k)
+
+def key_type(element, keys, samples=None):
+
+    if element.tag == "tag":
+
+        k = element.attrib['k']
+        count_key(k, KEY_CLASSIFIER.classify(k)[0], keys, samples)
+
+    return keys
+
+def process_keys(filename):
+    keys = {"lower": 0, "lower_colon": 0, "problemchars": 0, "other": 0}
+
+    print "Sample 'other' tags, randomly (2%) selected:"
+    print "\n"
+
+    for _, element in ET.iterparse(filename):
+        keys = key_type(element, keys)
+
+    print "\n"
+    print "Count of the four Tag Categories:"
+    print "\n"
+    print keys
+    return keys
+
+#
+# Iterative parsing to generate a count of the number of unique contributng users:
+# Code adapted from: Udacity OSM SQL Case Study Slide 7
+#
+
+def get_user(element):
+    if element.get('uid'):
+        uid = element.attrib['uid']
+        return uid
+
+def process_users(filename):
+    users = set()
+    for _, element in ET.iterparse(filename):
+
+        uid = get_user(element)
+        if uid:
+            users.add(uid)
+
+    return users
+
+
+# Data auditing:
+
+# Auditing steps to identify problematic streets, zips and state values:
+# Code adapted from: Udacity OSM SQL Case Study Slide 10
+
+# (a) Check for problematic street type names:
+
+street_type_re = re.compile(r'\b\S+\.?$', re.IGNORECASE)
+
+# expected provides a list of expected street types; list adjusted based on initial audit results
+expected = ["Street", "Avenue", "Boulevard", "Drive", "Court", "Place", "Square", "Lane", "Road",
+            "Trail", "Parkway", "Commons", "Circle", "Highway", "Loop", "Terrace", "Way", "Mall"]
+
+def audit_street_type(street_types, street_name):
+    m = street_type_re.search(street_name)
+    if m:
+        street_type = m.group()
+        if street_type not in expected:
+            street_types[street_type].add(street_name)
+
+def is_street_name(elem):
+    return (elem.attrib['k'] == "addr:street")
+
+def audit_street(osmfile):
+    osm_file = open(osmfile, "r")
+    street_types = defaultdict(set)
+    for event, elem in ET.iterparse(osm_file, events=("start",)):
+
+        if elem.tag == "node" or elem.tag == "way":
+            for tag in elem.iter("tag"):
+                if is_street_name(tag):
+                    audit_street_type(street_types, tag.attrib['v'])
+    osm_file.close()
+    return street_types
+
+# (b) Check for problematic zip codes:
+
+def is_zip_code(elem):
+    return (elem.attrib['k'] == "addr:postcode")
+
+def audit_zip(osmfile):
+    osm_file = open(osmfile, "r")
+    prob_zip = set()
+    for event, elem in ET.iterparse(osm_file, events=("start",)):
+
+        if elem.tag == "node" or elem.tag == "way":
+            for tag in elem.iter("tag"):
+                if is_zip_code(tag):
+
+                    if len(tag.attrib['v']) != 5:
+                        prob_zip.add(tag.attrib['v'])
+                    elif tag.attrib['v'][0:2] != '96':
+                        prob_zip.add(tag.attrib['v'])
+    osm_file.close()
+    return prob_zip
+
+# (c) Check for problematic state values (all should equal 'HI'):
+
+def is_state(elem):
+    return (elem.attrib['k'] == "addr:state")
+
+def audit_state(osmfile):
+    osm_file = open(osmfile, "r")
+    prob_state = set()
+    for event, elem in ET.iterparse(osm_file, events=("start",)):
+
+        if elem.tag == "node" or elem.tag == "way":
+            for tag in elem.iter("tag"):
+                if is_state(tag):
+
+                    if tag.attrib['v'] != 'HI':
+                        prob_state.add(tag.attrib['v'])
+    osm_file.close()
+    return prob_state
+
+# Single-pass audit engine:
+
+"""
+Each of the exploration / auditing functions above re-parses the whole OSM file. The
+AuditEngine runs any number of registered visitors over one streaming get_element pass
+instead, and collects their results into a single AuditReport.
+
+A visitor is any object with a 'name' attribute, a visit(element) method, called once per
+top level element, and a result() method. Note that, unlike count_tags, the tag counts only
+cover the top level elements yielded by get_element and their children (the 'osm' root and
+'bounds' elements are not counted).
+"""
+
+class AuditVisitor(object):
+    """Base class for a check run by AuditEngine"""
+
+    name = None
+
+    def visit(self, element):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+class TagCountVisitor(AuditVisitor):
+    """Count every element tag (node, way, tag, nd, ...), as count_tags does"""
+
+    name = 'tag_counts'
+
+    def __init__(self):
+        self.tags = defaultdict(int)
+
+    def visit(self, element):
+        for elem in element.iter():
+            self.tags[elem.tag] += 1
+
+    def result(self):
+        return dict(self.tags)
+
+class KeyTypeVisitor(AuditVisitor):
+    """Count the four tag key categories of the tags of each element, classified in one go"""
+
+    name = 'key_types'
+
+    def __init__(self):
+        self.keys = {"lower": 0, "lower_colon": 0, "problemchars": 0, "other": 0}
+        self.samples = []
+
+    def visit(self, element):
+        keys = [tag.attrib['k'] for tag in element.iter('tag')]
+        if keys:
+            for k, key_class in zip(keys, KEY_CLASSIFIER.classify_keys(keys)):
+                count_key(k, key_class[0], self.keys, self.samples)
+
+    def result(self):
+        return self.keys
+
+class UserVisitor(AuditVisitor):
+    """Collect the set of unique contributing user ids (audit_map counts them with the
+    contributors.ContributorStats visitor instead, in bounded memory)"""
+
+    name = 'users'
+
+    def __init__(self):
+        self.users = set()
+
+    def visit(self, element):
+        uid = get_user(element)
+        if uid:
+            self.users.add(uid)
+
+    def result(self):
+        return self.users
+
+class AddrTagVisitor(AuditVisitor):
+    """Base class for the visitors auditing the tags of node and way elements"""
+
+    def visit(self, element):
+        if element.tag == "node" or element.tag == "way":
+            for tag in element.iter("tag"):
+                self.visit_tag(tag)
+
+    def visit_tag(self, tag):
+        raise NotImplementedError
+
+class StreetVisitor(AddrTagVisitor):
+    """Same check as audit_street"""
+
+    name = 'street_types'
+
+    def __init__(self):
+        self.street_types = defaultdict(set)
+
+    def visit_tag(self, tag):
+        if is_street_name(tag):
+            audit_street_type(self.street_types, tag.attrib['v'])
+
+    def result(self):
+        return dict(self.street_types)
+
+class ZipVisitor(AddrTagVisitor):
+    """Same check as audit_zip"""
+
+    name = 'zip_codes'
+
+    def __init__(self):
+        self.prob_zip = set()
+
+    def visit_tag(self, tag):
+        if is_zip_code(tag):
+            if len(tag.attrib['v']) != 5 or tag.attrib['v'][0:2] != '96':
+                self.prob_zip.add(tag.attrib['v'])
+
+    def result(self):
+        return self.prob_zip
+
+class StateVisitor(AddrTagVisitor):
+    """Same check as audit_state"""
+
+    name = 'states'
+
+    def __init__(self):
+        self.prob_state = set()
+
+    def visit_tag(self, tag):
+        if is_state(tag):
+            if tag.attrib['v'] != 'HI':
+                self.prob_state.add(tag.attrib['v'])
+
+    def result(self):
+        return self.prob_state
+
+class AuditReport(dict):
+    """Results of an AuditEngine run, keyed by visitor name (also available as attributes)"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class AuditEngine(object):
+    """Run all registered visitors over a single get_element pass"""
+
+    def __init__(self, visitors=None):
+        self.visitors = []
+        for visitor in (visitors or []):
+            self.register(visitor)
+
+    def register(self, visitor):
+        self.visitors.append(visitor)
+        return visitor
+
+    def run(self, osm_file, tags=('node', 'way', 'relation')):
+        visitors = self.visitors
+        for element in get_element(osm_file, tags=tags):
+            for visitor in visitors:
+                visitor.visit(element)
+
+        report = AuditReport()
+        for visitor in visitors:
+            report[visitor.name] = visitor.result()
+        return report
+
+def audit_map(osm_file, top_n=TOP_N):
+    """Run all of the exploration and auditing checks over osm_file in a single pass"""
+
+    key_types = KeyTypeVisitor()
+    contributors = ContributorStats(top_n)
+    engine = AuditEngine([TagCountVisitor(), key_types, contributors,
+                          StreetVisitor(), ZipVisitor(), StateVisitor()])
+    report = engine.run(osm_file)
+    report['other_samples'] = key_types.samples
+    # the unique user ids, as an IntSet (see contributors.py)
+    report['users'] = contributors.users.ids
+    return report
+
+def print_report(report):
+    """Print the results of audit_map"""
+
+    print "DATA EXPLORATION:"
+    print "-----------------"
+    print "Tag Type Counts for File:"
+    print "\n"
+    print report.tag_counts
+    print '\n'
+
+    print "Sample 'other' tags, randomly (2%) selected:"
+    print "\n"
+    for sample in report.other_samples:
+        print sample
+    print "\n"
+    print "Count of the four Tag Categories:"
+    print "\n"
+    print report.key_types
+    print '\n'
+
+    print "Number of Unique User IDs:"
+    print "\n"
+    print len(report.users)
+    print "\n"
+
+    print "Contributors:"
+    print "\n"
+    print_contributors(report.contributors)
+    print "\n"
+
+    print "DATA AUDITING:"
+    print "--------------"
+    print "Possible problematic street types:"
+    print "\n"
+    pprint.pprint(report.street_types)
+    print "\n"
+
+    print "Possible problematic zip codes:"
+    print "\n"
+    print report.zip_codes
+
+    print "\n"
+    print "Possible problematic state values:"
+    print "\n"
+    print report.states
+    print "\n"
@@ -0,0 +1,159 @@
+"""
+Benchmark harness for the export pipeline.
+
+Each stage runs in its own forked process over the whole file, so that its peak RSS can be
+measured on its own. Stages build on each other, and every stage is timed both in total and
+minus the stage it builds on:
+
+  parse     get_element over all nodes, ways and relations
+  fix       parse + fix_element
+  shape     parse + shape_element (which includes fix_element)
+  validate  shape + validate_element with the compiled schema
+  cerberus  shape + validate_element with cerberus (only if requested)
+  write     shape + writing the .csv files (process_map, without validation)
+
+The results (seconds, elements/sec, MB/sec and peak RSS per stage) can be saved as JSON, and two
+result files compared with compare_results. Synthetic input files can be made with
+osmwrangle.synthetic.generate_osm.
+"""
+
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from timeit import default_timer as timer
+
+from .export import process_map, EXPORT_ELEMENTS
+from .fix import fix_element
+from .parse import get_element
+from .shape import shape_element
+from .validate import validate_element, get_validator
+
+# stage => stage it builds on
+BENCH_STAGES = [('parse', None),
+                ('fix', 'parse'),
+                ('shape', 'parse'),
+                ('validate', 'shape'),
+                ('cerberus', 'shape'),
+                ('write', 'shape')]
+
+def run_stage(stage, osm_file):
+    """Run one stage over osm_file; return the number of elements processed"""
+
+    n = 0
+    if stage == 'write':
+        tmp_dir = tempfile.mkdtemp(prefix='osm_bench_')
+        try:
+            process_map(osm_file, validate=False, out_dir=tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+
+    validator = None
+    if stage in ('validate', 'cerberus'):
+        validator = get_validator(use_cerberus=stage == 'cerberus')
+
+    for element in get_element(osm_file, tags=EXPORT_ELEMENTS):
+        if stage == 'fix':
+            fix_element(element)
+        elif stage != 'parse':
+            el = shape_element(element)
+            if validator is not None:
+                validate_element(el, validator)
+        n += 1
+    return n
+
+def stage_child(stage, osm_file, conn):
+    """Forked process: run a stage with stdout silenced and send back its measurements"""
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    try:
+        start = timer()
+        n = run_stage(stage, osm_file)
+        seconds = timer() - start
+        conn.send({'seconds': seconds, 'elements': n,
+                   'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+    except Exception as e:
+        conn.send({'error': repr(e)})
+    finally:
+        conn.close()
+
+def measure_stage(stage, osm_file):
+    import multiprocessing
+
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=stage_child, args=(stage, osm_file, child))
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    if 'error' in result:
+        raise Exception("Benchmark stage '{0}' failed: {1}".format(stage, result['error']))
+    return result
+
+def benchmark(osm_file, stages=None, cerberus=False):
+    """Benchmark the pipeline stages over osm_file; return the results as a dict"""
+
+    stages = stages or [stage for stage, _ in BENCH_STAGES if cerberus or stage != 'cerberus']
+    size_mb = os.path.getsize(osm_file) / (1024.0 * 1024.0)
+    results = {'file': os.path.abspath(osm_file),
+               'size_mb': round(size_mb, 3),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'stages': {}}
+
+    elements = None
+    for stage, base in BENCH_STAGES:
+        if stage not in stages:
+            continue
+        result = measure_stage(stage, osm_file)
+        elements = result.pop('elements') or elements
+        if base in results['stages']:
+            result['stage_seconds'] = result['seconds'] - results['stages'][base]['seconds']
+        else:
+            result['stage_seconds'] = result['seconds']
+        if elements:
+            result['elements_per_sec'] = elements / result['seconds']
+        result['mb_per_sec'] = size_mb / result['seconds']
+        results['stages'][stage] = result
+
+    results['elements'] = elements
+    return results
+
+def print_results(results):
+    print "Benchmark of {0} ({1} MB, {2} elements)".format(results['file'], results['size_mb'],
+                                                          results['elements'])
+    print "{0:<10}{1:>10}{2:>12}{3:>14}{4:>10}{5:>14}".format(
+        'stage', 'seconds', 'stage secs', 'elements/sec', 'MB/sec', 'peak RSS MB')
+    for stage, _ in BENCH_STAGES:
+        if stage in results['stages']:
+            r = results['stages'][stage]
+            print "{0:<10}{1:>10.2f}{2:>12.2f}{3:>14.0f}{4:>10.2f}{5:>14.1f}".format(
+                stage, r['seconds'], r['stage_seconds'], r.get('elements_per_sec', 0),
+                r['mb_per_sec'], r['peak_rss_kb'] / 1024.0)
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_results(old, new):
+    """Print the change in MB/sec and peak RSS per stage between two benchmark results"""
+
+    print "{0:<10}{1:>12}{2:>12}{3:>10}{4:>12}{5:>12}".format(
+        'stage', 'old MB/sec', 'new MB/sec', 'speedup', 'old RSS MB', 'new RSS MB')
+    for stage, _ in BENCH_STAGES:
+        if stage in old['stages'] and stage in new['stages']:
+            o, n = old['stages'][stage], new['stages'][stage]
+            print "{0:<10}{1:>12.2f}{2:>12.2f}{3:>9.2f}x{4:>12.1f}{5:>12.1f}".format(
+                stage, o['mb_per_sec'], n['mb_per_sec'], n['mb_per_sec'] / o['mb_per_sec'],
+                o['peak_rss_kb'] / 1024.0, n['peak_rss_kb'] / 1024.0)
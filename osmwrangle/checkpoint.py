@@ -0,0 +1,242 @@
+"""
+Checkpointed export: a long export that stops part way can resume from its last checkpoint.
+"""
+
+import json
+import os
+import re
+from itertools import islice
+
+from . import metrics
+from .compression import compression_of
+from .export import (CSV_BUFFER_SIZE, EXPORT_ELEMENTS, ShardReader, TableWriter, export_tables,
+                     open_csv, root_end_offset, write_shaped)
+from .geometry import NodeIndex, NODE_INDEX_PATH
+from .parse import get_element
+from .pbf import PBFReader, is_pbf
+from .quarantine import Quarantine, QUARANTINE_PATH, report_quarantine
+from .validate import get_validator
+
+# ================================================== #
+#      Checkpointed Export: Resumable process_map    #
+# ================================================== #
+
+"""
+process_map_checkpointed writes the same .csv files as process_map, and every CHECKPOINT_EVERY
+elements records a checkpoint at CHECKPOINT_PATH, next to the .csv files:
+
+- the size and modification time of the OSM file,
+- where to read the OSM file from again: the offset of the parser in an XML file, or the offset
+  of the block being exported in a PBF file,
+- the last element written (type and id), and the number of elements written, and
+- the size of each .csv file, once the rows of all those elements have been flushed to it (and
+  of the quarantine file, with quarantine=True), and
+- with geometry=True, the number of nodes in the node index (see geometry.py), and whether it
+  was finished by the first way.
+
+The checkpoint is written to a temporary file and renamed, so it is always complete. If an
+export stops (killed, out of memory, or an element failing validation), running it again on the
+same, unchanged OSM file resumes from the checkpoint: the .csv files are truncated to the sizes
+recorded, the OSM file is read again from the offset recorded, the elements up to and including
+the last one written are skipped, and the export carries on. A failure late in a long run then
+costs at most the elements since the last checkpoint. The checkpoint is removed once the export
+completes.
+
+The XML parsers read ahead of the elements they return, so the element after the last one
+written can start before the parser offset: the export searches back from it (CHECKPOINT_SEARCH
+bytes at a time, then twice as many...) for the start tag of the last element written, and
+parses from there. A PBF file is read again from the start of the block of the last element
+written.
+
+Resuming seeks in the OSM file and truncates the .csv files, so neither can be bz2 / gzip
+compressed (a PBF file is compressed block by block, which is fine). The files of the node index
+are append only and sorted by id, so they are truncated the same way. The spatial and tag
+indexes have no such resume point (the tag index is only written at the end of an export, and
+the spatial index is filed by the offsets of the rows in the .csv files as they are written),
+so checkpointed exports do not build them.
+"""
+
+CHECKPOINT_PATH = "export.checkpoint"  # Parameter: checkpoint file name (in the export's out_dir)
+CHECKPOINT_EVERY = 100000              # Parameter: elements between checkpoints
+CHECKPOINT_SEARCH = 1 << 20            # bytes first searched back for the last element written
+
+def input_signature(file_in):
+    """The size and modification time of the OSM file, which a checkpoint has to match"""
+
+    stat = os.stat(file_in)
+    return [stat.st_size, stat.st_mtime]
+
+def load_checkpoint(path, file_in):
+    """The checkpoint saved at path, or None if there is none, or if it is not for file_in as it
+    is now"""
+
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state['input'] != input_signature(file_in):
+        return None
+    return state
+
+def save_checkpoint(path, state):
+    """Save a checkpoint, replacing the previous one in a single step"""
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp_path, path)
+
+def reopen_csv(path, size):
+    """Open a .csv file of an interrupted export to carry on writing it, truncated to size"""
+
+    if not os.path.exists(path) or os.path.getsize(path) < size:
+        raise Exception("'{0}' is shorter than at the last checkpoint: remove {1} to export from "
+                        "the start".format(path, CHECKPOINT_PATH))
+    f = open(path, 'r+b', CSV_BUFFER_SIZE)
+    f.truncate(size)
+    f.seek(size)
+    return f
+
+def element_start(osm_file, tag, element_id, before):
+    """The offset of the start tag of an element of an XML file, searching back from before"""
+
+    start_tag = re.compile(r'<{0}\s[^>]*?\bid=["\']{1}["\']'.format(tag, re.escape(element_id)))
+    size = CHECKPOINT_SEARCH
+    while True:
+        start = max(0, before - size)
+        osm_file.seek(start)
+        matches = list(start_tag.finditer(osm_file.read(before - start)))
+        if matches:
+            return start + matches[-1].start()
+        if start == 0:
+            raise Exception("The {0} {1} of the checkpoint is not in the OSM file".format(
+                tag, element_id))
+        size *= 2
+
+def open_input(file_in, state):
+    """A reader of the OSM file from the offset of a checkpoint, and its elements after the last
+    element of the checkpoint"""
+
+    last = state['element']
+    if is_pbf(file_in):
+        reader = PBFReader(file_in, state['offset'])
+    elif last is None:
+        reader = open(file_in, 'rb')
+    else:
+        with open(file_in, 'rb') as osm_file:
+            start = element_start(osm_file, last[0], last[1], state['offset'])
+            end = root_end_offset(osm_file, os.path.getsize(file_in))
+        reader = ShardReader(file_in, start, end)
+    elements = get_element(reader, tags=EXPORT_ELEMENTS)
+    if last is not None:
+        elements = skip_through(elements, last[0], last[1])
+    return reader, elements
+
+def skip_through(elements, tag, element_id):
+    """The elements after the element with tag and element_id"""
+
+    for element in elements:
+        if element.tag == tag and element.attrib['id'] == element_id:
+            return elements
+    raise Exception("The {0} {1} of the checkpoint is not in the OSM file".format(tag, element_id))
+
+def track(elements, state):
+    """Pass the elements on, keeping the last one (and the count) in the checkpoint state"""
+
+    m = metrics.METRICS
+    for element in elements:
+        state['element'] = [element.tag, element.attrib['id']]
+        state['elements'] += 1
+        if m.timing:
+            m.counters['elements.' + element.tag] += 1
+        yield element
+
+def process_map_checkpointed(file_in, validate, use_cerberus=False, out_dir='.',
+                             every=CHECKPOINT_EVERY, quarantine=False, geometry=False):
+    """Export file_in to the same csv(s) as process_map, with a checkpoint every `every`
+    elements, resuming from the checkpoint of an earlier export that did not complete"""
+
+    if compression_of(file_in):
+        raise Exception("'{0}' is compressed: a checkpointed export seeks in the OSM file, so it "
+                        "needs it uncompressed (or as .osm.pbf)".format(file_in))
+
+    checkpoint_path = os.path.join(out_dir, CHECKPOINT_PATH)
+    quarantine_path = os.path.join(out_dir, QUARANTINE_PATH)
+    index_path = os.path.join(out_dir, NODE_INDEX_PATH)
+    tables = export_tables(geometry)
+    paths = [os.path.join(out_dir, path) for path, _ in tables]
+
+    m = metrics.METRICS
+    if m.timing:
+        m.start(os.path.getsize(file_in))
+
+    state = load_checkpoint(checkpoint_path, file_in)
+    if state is None:
+        state = {'input': input_signature(file_in), 'offset': 0, 'element': None, 'elements': 0,
+                 'quarantine': None, 'geometry': geometry, 'node_index': None}
+        files = [open_csv(path) for path in paths]
+        for f, (_, fields) in zip(files, tables):
+            TableWriter(f, fields).writeheader()
+        node_index = NodeIndex(index_path, mode='w') if geometry else None
+    else:
+        if state.get('geometry', False) != geometry:
+            raise Exception("The checkpoint at '{0}' is of an export {1} geometry: remove it to "
+                            "export from the start".format(
+                                checkpoint_path, 'with' if state.get('geometry') else 'without'))
+        m.emit('resume', elements=state['elements'], offset=state['offset'])
+        files = [reopen_csv(path, size) for path, size in zip(paths, state['outputs'])]
+        node_index = None
+        if geometry:
+            count, finished = state['node_index']
+            node_index = NodeIndex(index_path, mode='a', count=count)
+            if finished:
+                node_index.finish()
+
+    dead_letters = None
+    if quarantine:
+        dead_letters = Quarantine(quarantine_path, state.get('quarantine'))
+    reader = None
+    try:
+        validator = get_validator(use_cerberus) if validate is True else None
+        writers = [TableWriter(f, fields) for f, (_, fields) in zip(files, tables)]
+        reader, elements = open_input(file_in, state)
+        elements = track(elements, state)
+        while True:
+            done = state['elements']
+            # write_shaped writes all the rows of the elements it is given before it returns
+            write_shaped(islice(elements, every), writers, validator, node_index,
+                         quarantine=dead_letters)
+            if state['elements'] == done:
+                break
+
+            if isinstance(reader, PBFReader):
+                state['offset'] = reader.block_offset
+            else:
+                state['offset'] = reader.tell()
+            for f in files:
+                f.flush()
+            state['outputs'] = [f.tell() for f in files]
+            if dead_letters is not None:
+                dead_letters.flush()
+                state['quarantine'] = dead_letters.tell()
+            if node_index is not None:
+                if node_index.writable:
+                    node_index.flush()
+                state['node_index'] = [node_index.count, not node_index.writable]
+            save_checkpoint(checkpoint_path, state)
+            m.emit('checkpoint', elements=state['elements'], offset=state['offset'])
+            m.progress(state['offset'])
+    finally:
+        if reader is not None:
+            reader.close()
+        for f in files:
+            f.close()
+        if dead_letters is not None:
+            dead_letters.close()
+        if node_index is not None:
+            node_index.close()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if quarantine:
+        report_quarantine(quarantine_path)
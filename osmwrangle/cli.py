@@ -0,0 +1,344 @@
+"""
+Command line interface: runs the chosen pipeline stage over the chosen files.
+
+    python -m osmwrangle sample honolulu.osm -o sample.osm --mode reservoir --size 5000
+    python -m osmwrangle audit sample.osm
+    python -m osmwrangle contributors planet-extract.osm.pbf --top 20 --approximate
+    python -m osmwrangle fix sample.osm -o fixed.osm
+    python -m osmwrangle export sample.osm --validate --processes 4
+    python -m osmwrangle export honolulu.osm --pipeline process
+    python -m osmwrangle export sample.osm --sqlite honolulu.db --geometry
+    python -m osmwrangle export honolulu.osm --spatial
+    python -m osmwrangle query --bbox 21.30 -157.86 21.31 -157.85 --ways --tags
+    python -m osmwrangle query --nearest 21.3069 -157.8583 --key amenity --value cafe -n 3
+    python -m osmwrangle export honolulu.osm --tag-index
+    python -m osmwrangle tags amenity=restaurant addr:postcode=96815 --element node
+    python -m osmwrangle tags addr:street --values
+    python -m osmwrangle export sample.osm --columnar parquet --compression zstd
+    python -m osmwrangle export honolulu.osm.bz2 --compression gz
+    python -m osmwrangle export honolulu.osm --progress --metrics metrics.jsonl
+    python -m osmwrangle --parser expat export honolulu.osm
+    python -m osmwrangle export honolulu.osm.pbf --processes 4
+    python -m osmwrangle export planet-extract.osm.pbf --checkpoint --out-dir extract
+    python -m osmwrangle export honolulu.osm --validate --quarantine --max-error-rate 0.001
+    python -m osmwrangle --pbf-workers 4 audit honolulu.osm.pbf
+    python -m osmwrangle update honolulu.db --osc changes.osc
+    python -m osmwrangle generate synthetic.osm --size-mb 100
+    python -m osmwrangle bench synthetic.osm -o results.json --compare old_results.json
+"""
+
+import argparse
+import os
+import pprint
+
+from . import parse, pbf, sample
+
+def run_sample(args):
+    sample.sample_osm(args.osm_file, args.output, mode=args.mode, k=args.k, size=args.size,
+                      grid=args.grid, closed=args.closed, seed=args.seed,
+                      cache_dir=None if args.no_cache else sample.SAMPLE_CACHE_DIR)
+
+def run_audit(args):
+    from .audit import audit_map, print_report
+
+    for osm_file in args.osm_files:
+        print osm_file
+        print '\n'
+        print_report(audit_map(osm_file))
+
+def run_contributors(args):
+    from .contributors import contributor_stats, print_contributors
+
+    for osm_file in args.osm_files:
+        print osm_file
+        print '\n'
+        print_contributors(contributor_stats(osm_file, args.top, exact=not args.approximate))
+
+def run_fix(args):
+    from .fix import fix_osm
+
+    fix_osm(args.osm_file, args.output)
+
+def setup_metrics(args):
+    """Replace the default metrics (fix events printed, no timing) as asked on the command line"""
+
+    from .metrics import Metrics, StdoutSink, JSONLinesSink, set_metrics
+
+    if args.metrics:
+        sink = JSONLinesSink(args.metrics)
+    else:
+        sink = StdoutSink(fixes=not args.quiet)
+    metrics = Metrics(sink, timing=args.progress or bool(args.metrics))
+    set_metrics(metrics)
+    return metrics
+
+def run_export(args):
+    metrics = setup_metrics(args)
+    if args.max_error_rate is not None:
+        from .quarantine import set_quarantine_max_rate
+        set_quarantine_max_rate(args.max_error_rate)
+    if args.sqlite:
+        from .database import process_map_sqlite
+        if (args.processes > 1 or args.pipeline or args.checkpoint or args.spatial or
+                args.tag_index or args.out_dir != '.' or args.compression or
+                args.compression_level is not None):
+            raise Exception("SQLite exports load one database, one element at a time, next to "
+                            "which any other file is written (no --processes, --pipeline, "
+                            "--checkpoint, --spatial, --tag-index, --out-dir or --compression)")
+        process_map_sqlite(args.osm_file, args.sqlite, args.validate, args.cerberus,
+                           geometry=args.geometry, quarantine=args.quarantine)
+    elif args.columnar:
+        from .columnar import process_map_columnar
+        if (args.processes > 1 or args.pipeline or args.checkpoint or args.spatial or
+                args.tag_index):
+            raise Exception("Columnar exports are written one element at a time, without "
+                            "indexes (no --processes, --pipeline, --checkpoint, --spatial or "
+                            "--tag-index)")
+        process_map_columnar(args.osm_file, args.validate, args.cerberus, out_dir=args.out_dir,
+                             fmt=args.columnar, compression=args.compression,
+                             compression_level=args.compression_level, geometry=args.geometry,
+                             quarantine=args.quarantine)
+    elif args.checkpoint:
+        from .checkpoint import process_map_checkpointed, CHECKPOINT_EVERY
+        if (args.processes > 1 or args.pipeline or args.spatial or args.tag_index or
+                args.compression):
+            raise Exception("Checkpointed exports write plain .csv files only, one element at a "
+                            "time (no --processes, --pipeline, --spatial, --tag-index or "
+                            "--compression)")
+        process_map_checkpointed(args.osm_file, args.validate, args.cerberus,
+                                 out_dir=args.out_dir,
+                                 every=args.checkpoint_every or CHECKPOINT_EVERY,
+                                 quarantine=args.quarantine, geometry=args.geometry)
+    elif args.processes > 1:
+        from .export import process_map_parallel
+        if args.pipeline:
+            raise Exception("Parallel exports run a whole export per shard, so they are not "
+                            "pipelined (no --pipeline with --processes)")
+        process_map_parallel(args.osm_file, args.validate, processes=args.processes,
+                             use_cerberus=args.cerberus, out_dir=args.out_dir,
+                             geometry=args.geometry, spatial=args.spatial,
+                             tag_index=args.tag_index, compression=args.compression,
+                             compression_level=args.compression_level,
+                             quarantine=args.quarantine)
+    elif args.pipeline:
+        from .pipeline import process_map_pipelined
+        if args.spatial:
+            raise Exception("The spatial index needs the rows' file offsets, so it is not built "
+                            "by pipelined exports")
+        process_map_pipelined(args.osm_file, args.validate, args.cerberus, out_dir=args.out_dir,
+                              geometry=args.geometry, tag_index=args.tag_index,
+                              workers=args.pipeline, compression=args.compression,
+                              compression_level=args.compression_level,
+                              quarantine=args.quarantine)
+    else:
+        from .export import process_map
+        process_map(args.osm_file, args.validate, args.cerberus, out_dir=args.out_dir,
+                    geometry=args.geometry, spatial=args.spatial, tag_index=args.tag_index,
+                    compression=args.compression, compression_level=args.compression_level,
+                    quarantine=args.quarantine)
+    metrics.finish()
+
+def run_query(args):
+    from .spatial import SpatialQuery
+
+    query = SpatialQuery(args.out_dir)
+    try:
+        if args.nearest:
+            for meters, node in query.nearest(args.nearest[0], args.nearest[1], key=args.key,
+                                              value=args.value, n=args.n):
+                print "{0:.1f} m".format(meters)
+                pprint.pprint(node)
+        else:
+            pprint.pprint(query.nodes_in_bbox(*args.bbox, tags=args.tags))
+            if args.ways:
+                pprint.pprint(query.ways_in_bbox(*args.bbox, tags=args.tags))
+    finally:
+        query.close()
+
+def run_update(args):
+    from .incremental import apply_osc, apply_extract
+
+    metrics = setup_metrics(args)
+    if args.osc:
+        counts = apply_osc(args.osc, args.db, args.validate, args.cerberus)
+    else:
+        counts = apply_extract(args.osm, args.db, args.validate, args.cerberus)
+    metrics.finish()
+    print "Created: {create}, modified: {modify}, deleted: {delete}".format(**counts)
+
+def run_tags(args):
+    from .tagindex import TagIndex, TAG_INDEX_PATH
+
+    with TagIndex(os.path.join(args.out_dir, TAG_INDEX_PATH)) as index:
+        for tag in args.tags:
+            k, _, value = tag.partition('=')
+            value = value or None
+            if args.values:
+                counts = index.value_counts(k, element=args.element)
+                print "{0}: {1} distinct values".format(k, len(counts))
+                for value, n in sorted(counts.iteritems(), key=lambda (v, n): (-n, v)):
+                    if isinstance(value, unicode):
+                        value = value.encode('utf-8')
+                    print "  {0} {1}".format(n, value)
+            else:
+                for element in [args.element] if args.element else ['node', 'way', 'relation']:
+                    ids = index.ids(k, value, element)
+                    print "{0} {1}: {2} {3}s".format(k, value or '*', len(ids), element)
+                    if ids and not args.count:
+                        print '  ' + ' '.join(str(element_id) for element_id in ids)
+
+def run_generate(args):
+    from .synthetic import generate_osm
+
+    counts = generate_osm(args.output, args.size_mb, seed=args.seed)
+    print "Nodes: {node}, ways: {way}, relations: {relation}".format(**counts)
+
+def run_bench(args):
+    from .bench import benchmark, print_results, save_results, load_results, compare_results
+
+    results = benchmark(args.osm_file, stages=args.stages, cerberus=args.cerberus)
+    print_results(results)
+    if args.output:
+        save_results(results, args.output)
+    if args.compare:
+        print '\n'
+        compare_results(load_results(args.compare), results)
+
+def add_metrics_arguments(p):
+    p.add_argument('--progress', action='store_true',
+                   help='time each stage and report progress with an ETA')
+    p.add_argument('--metrics', metavar='JSONL',
+                   help='write fixes, progress and stage timings to a JSON lines file')
+    p.add_argument('--quiet', action='store_true', help='do not print the fixes')
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='osmwrangle', description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--parser', choices=sorted(parse.PARSER_BACKENDS),
+                        default=parse.PARSER_BACKEND,
+                        help='XML parser backend (lxml needs the lxml package)')
+    parser.add_argument('--pbf-workers', type=int, default=pbf.PBF_WORKERS,
+                        help='processes decoding the blocks of .osm.pbf input')
+    stages = parser.add_subparsers(title='stages')
+
+    p = stages.add_parser('sample', help='write a sample of an OSM file')
+    p.add_argument('osm_file')
+    p.add_argument('-o', '--output', default='sample.osm')
+    p.add_argument('--mode', choices=['every_k', 'reservoir', 'grid'], default=sample.SAMPLE_MODE)
+    p.add_argument('-k', type=int, default=sample.SAMPLE_K, help='take every k-th element (every_k)')
+    p.add_argument('--size', type=int, default=sample.SAMPLE_SIZE,
+                   help='sample size (reservoir) or nodes per grid cell (grid)')
+    p.add_argument('--grid', type=int, default=sample.SAMPLE_GRID, help='grid rows and columns (grid)')
+    p.add_argument('--closed', action='store_true', help='add the missing nodes of sampled ways')
+    p.add_argument('--seed', type=int, default=sample.SAMPLE_SEED)
+    p.add_argument('--no-cache', action='store_true', help='always regenerate the sample')
+    p.set_defaults(func=run_sample)
+
+    p = stages.add_parser('audit', help='explore and audit OSM files')
+    p.add_argument('osm_files', nargs='+')
+    p.set_defaults(func=run_audit)
+
+    p = stages.add_parser('contributors', help='count the users and changesets of OSM files')
+    p.add_argument('osm_files', nargs='+')
+    p.add_argument('--top', type=int, default=10, help='top users and changesets to report')
+    p.add_argument('--approximate', action='store_true',
+                   help='only estimate the unique users and changesets, in fixed memory')
+    p.set_defaults(func=run_contributors)
+
+    p = stages.add_parser('fix', help='write a copy of an OSM file with street / zip / state fixes')
+    p.add_argument('osm_file')
+    p.add_argument('-o', '--output', required=True)
+    p.set_defaults(func=run_fix)
+
+    p = stages.add_parser('export', help='fix, shape and export an OSM file to .csv or SQLite')
+    p.add_argument('osm_file', help='OSM file (.osm, bz2 / gzip compressed .osm.bz2 / .osm.gz, '
+                                    'or .osm.pbf)')
+    p.add_argument('--validate', action='store_true', help='validate each element against schema.py')
+    p.add_argument('--cerberus', action='store_true', help='validate with cerberus (slow)')
+    p.add_argument('--processes', type=int, default=1, help='export in parallel shards')
+    p.add_argument('--pipeline', choices=['thread', 'process'],
+                   help='run the parse, shape and write stages concurrently, in threads or processes')
+    p.add_argument('--sqlite', metavar='DB', help='load into a SQLite database instead of .csv')
+    p.add_argument('--columnar', choices=['parquet', 'arrow'],
+                   help='write typed columnar files instead of .csv (needs pyarrow)')
+    p.add_argument('--compression',
+                   help='compression codec: gz or bz2 for .csv files, snappy (default), gzip, '
+                        'brotli, zstd... for Parquet files (Arrow files are not compressed)')
+    p.add_argument('--compression-level', type=int, help='compression level')
+    p.add_argument('--out-dir', default='.', help='directory for the output files')
+    p.add_argument('--geometry', action='store_true',
+                   help='index the node coordinates and add bbox, centroid and length to the ways')
+    p.add_argument('--spatial', action='store_true',
+                   help='also build a tile index of the .csv rows for the query stage '
+                        '(implies --geometry)')
+    p.add_argument('--tag-index', action='store_true',
+                   help='also build an inverted tag index for the tags stage')
+    p.add_argument('--checkpoint', action='store_true',
+                   help='record checkpoints as the .csv files are written, and resume from the '
+                        'last one if an earlier export did not complete')
+    p.add_argument('--checkpoint-every', type=int, metavar='N',
+                   help='elements between checkpoints (default: 100000)')
+    p.add_argument('--quarantine', action='store_true',
+                   help='write the elements that fail fixing, shaping or validation to '
+                        'quarantine.jsonl and carry on, instead of stopping the export')
+    p.add_argument('--max-error-rate', type=float, metavar='RATE',
+                   help='with --quarantine, abort if more than this fraction of the elements '
+                        'fail (default: 0.01)')
+    add_metrics_arguments(p)
+    p.set_defaults(func=run_export)
+
+    p = stages.add_parser('query', help='query an export with a tile index (export --spatial)')
+    p.add_argument('--out-dir', default='.', help='directory of the exported files')
+    where = p.add_mutually_exclusive_group(required=True)
+    where.add_argument('--bbox', nargs=4, type=float,
+                       metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'),
+                       help='the nodes (and ways) in a bounding box')
+    where.add_argument('--nearest', nargs=2, type=float, metavar=('LAT', 'LON'),
+                       help='the nodes nearest to a point with a tag (see --key and --value)')
+    p.add_argument('--ways', action='store_true', help='also the ways overlapping the bbox')
+    p.add_argument('--tags', action='store_true', help='with the tags of each node / way')
+    p.add_argument('--key', default='amenity', help='tag key of the nearest nodes')
+    p.add_argument('--value', help='tag value of the nearest nodes (default: any)')
+    p.add_argument('-n', type=int, default=1, help='number of nearest nodes')
+    p.set_defaults(func=run_query)
+
+    p = stages.add_parser('tags', help='look up tags in an export with a tag index (export --tag-index)')
+    p.add_argument('tags', nargs='+', metavar='KEY[=VALUE]')
+    p.add_argument('--out-dir', default='.', help='directory of the exported files')
+    p.add_argument('--element', choices=['node', 'way', 'relation'],
+                   help='only nodes, ways or relations')
+    p.add_argument('--values', action='store_true', help='the distinct values of each key, with counts')
+    p.add_argument('--count', action='store_true', help='only the number of elements')
+    p.set_defaults(func=run_tags)
+
+    p = stages.add_parser('update', help='apply the changes since the last export to a SQLite database')
+    p.add_argument('db')
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument('--osc', help='osmChange file with the changes')
+    source.add_argument('--osm', help='new extract, compared with the database by id and version')
+    p.add_argument('--validate', action='store_true', help='validate each element against schema.py')
+    p.add_argument('--cerberus', action='store_true', help='validate with cerberus (slow)')
+    add_metrics_arguments(p)
+    p.set_defaults(func=run_update)
+
+    p = stages.add_parser('generate', help='write a synthetic OSM file')
+    p.add_argument('output')
+    p.add_argument('--size-mb', type=float, default=10)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=run_generate)
+
+    p = stages.add_parser('bench', help='benchmark the export stages over an OSM file')
+    p.add_argument('osm_file')
+    p.add_argument('-o', '--output', help='save the results as JSON')
+    p.add_argument('--compare', metavar='JSON', help='compare with earlier saved results')
+    p.add_argument('--stages', nargs='+', help='stages to run (default: all but cerberus)')
+    p.add_argument('--cerberus', action='store_true', help='also benchmark cerberus validation')
+    p.set_defaults(func=run_bench)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    parse.set_parser_backend(args.parser)
+    pbf.set_pbf_workers(args.pbf_workers)
+    args.func(args)
+    return 0
@@ -0,0 +1,220 @@
+"""
+Export of the shaped OSM elements to typed, compressed columnar files (Parquet or Arrow IPC).
+
+ColumnarSink provides the same 8 writers as process_map (writerow / writerows). Each writer
+buffers its rows in one list per column, and every batch of rows is coerced to the column's
+type and written as one Arrow record batch / Parquet row group. The column types come from
+schema.py (integer -> int64, float -> float64, string -> string). In Parquet files the 'key' and
+'type' columns of the tag tables are dictionary encoded, as are the 'user' columns and the
+'member_type' and 'role' columns of relations_members, and the files are compressed (snappy by
+default).
+
+An Arrow IPC file holds a single dictionary per column, written with its first record batch, so
+the Arrow files have plain string columns instead (the dictionary of each batch would only be
+right for the first one). pyarrow 0.16 cannot compress the record batches of an IPC file either:
+Arrow files are written uncompressed, and asking for a compression codec for them is an error.
+
+pyarrow is an optional dependency, and is only imported when a ColumnarSink is opened.
+"""
+
+import os
+
+from .export import write_elements
+from .geometry import NodeIndex, NODE_INDEX_PATH
+from .quarantine import Quarantine, QUARANTINE_PATH, report_quarantine
+from .shape import (NODE_FIELDS, NODE_TAGS_FIELDS, WAY_FIELDS, WAY_TAGS_FIELDS, WAY_NODES_FIELDS,
+                    WAY_GEOMETRY_FIELDS, RELATION_FIELDS, RELATION_MEMBERS_FIELDS,
+                    RELATION_TAGS_FIELDS)
+from .validate import SCHEMA
+
+COLUMNAR_TABLES = [('nodes', 'node', NODE_FIELDS),
+                   ('nodes_tags', 'node_tags', NODE_TAGS_FIELDS),
+                   ('ways', 'way', WAY_FIELDS),
+                   ('ways_nodes', 'way_nodes', WAY_NODES_FIELDS),
+                   ('ways_tags', 'way_tags', WAY_TAGS_FIELDS),
+                   ('relations', 'relation', RELATION_FIELDS),
+                   ('relations_members', 'relation_members', RELATION_MEMBERS_FIELDS),
+                   ('relations_tags', 'relation_tags', RELATION_TAGS_FIELDS)]
+
+DICTIONARY_FIELDS = set(['key', 'type', 'user', 'member_type', 'role'])
+
+NULLABLE_FIELDS = set(WAY_GEOMETRY_FIELDS)
+
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+DEFAULT_COMPRESSION = {'parquet': 'snappy', 'arrow': None}
+
+COLUMNAR_BATCH_SIZE = 65536  # rows per record batch / row group
+
+def table_columns(schema_table, fields, schema=SCHEMA):
+    """[(field, schema type, coerce function)] for the columns of a table, from schema.py"""
+
+    rules = schema[schema_table]['schema']
+    if rules.get('type') == 'dict':
+        rules = rules['schema']
+    return [(field, rules[field]['type'], rules[field].get('coerce')) for field in fields]
+
+def arrow_schema(pa, columns, dictionary=True):
+    """Arrow schema for table_columns (dictionary: dictionary encode the DICTIONARY_FIELDS)"""
+
+    arrow_types = {'integer': pa.int64(), 'float': pa.float64(), 'string': pa.string()}
+    arrow_fields = []
+    for field, field_type, _ in columns:
+        arrow_type = arrow_types[field_type]
+        if dictionary and field in DICTIONARY_FIELDS and field_type == 'string':
+            arrow_type = pa.dictionary(pa.int32(), arrow_type)
+        arrow_fields.append(pa.field(field, arrow_type, nullable=field in NULLABLE_FIELDS))
+    return pa.schema(arrow_fields)
+
+class ColumnarTableWriter(object):
+    """Buffer the rows of one table column by column and write them in typed batches"""
+
+    def __init__(self, pa, file_writer, schema, columns, batch_size=COLUMNAR_BATCH_SIZE):
+        self.pa = pa
+        self.file_writer = file_writer
+        self.schema = schema
+        self.columns = columns
+        self.fields = [field for field, _, _ in columns]
+        self.batch_size = batch_size
+        self.buffers = [[] for _ in columns]
+        self.rows = 0
+
+    def writerow(self, row):
+        for field, buf in zip(self.fields, self.buffers):
+            buf.append(row[field])
+        self.rows += 1
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write_way_nodes(self, batch):
+        """Write a WayNodesBatch straight from its arrays"""
+
+        self.flush()
+        pa = self.pa
+        arrays = [pa.array(values, type=pa.int64())
+                  for values in (batch.way_ids, batch.node_ids, batch.positions)]
+        self.file_writer.write(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        pa = self.pa
+        arrays = []
+        for (field, _, coerce), buf, arrow_field in zip(self.columns, self.buffers, self.schema):
+            if coerce is not None:
+                buf = [coerce(value) for value in buf]
+            if isinstance(arrow_field.type, pa.DictionaryType):
+                array = pa.array(buf, type=arrow_field.type.value_type).dictionary_encode()
+            else:
+                array = pa.array(buf, type=arrow_field.type)
+            arrays.append(array)
+
+        self.file_writer.write(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.buffers = [[] for _ in self.columns]
+        self.rows = 0
+
+class ParquetFileWriter(object):
+    """Write record batches as Parquet row groups"""
+
+    def __init__(self, pa, path, schema, compression, compression_level):
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.writer = pq.ParquetWriter(path, schema, compression=compression,
+                                       compression_level=compression_level, use_dictionary=True)
+
+    def write(self, batch):
+        self.writer.write_table(self.pa.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
+
+class ArrowFileWriter(object):
+    """Write record batches to an Arrow IPC file"""
+
+    def __init__(self, pa, path, schema, compression, compression_level):
+        if compression is not None or compression_level is not None:
+            raise Exception("Arrow files cannot be compressed (compression '{0}', level {1}): "
+                            "write Parquet files to compress them".format(compression,
+                                                                         compression_level))
+        self.sink = pa.OSFile(path, 'wb')
+        self.writer = pa.RecordBatchFileWriter(self.sink, schema)
+
+    def write(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+class ColumnarSink(object):
+    """Context manager providing process_map style writers that write columnar files to out_dir"""
+
+    def __init__(self, out_dir='.', fmt='parquet', compression=None, compression_level=None,
+                 batch_size=COLUMNAR_BATCH_SIZE, geometry=False):
+        # compression None: the format's DEFAULT_COMPRESSION
+        if fmt not in COLUMNAR_FORMATS:
+            raise Exception("Unknown columnar format '{0}'".format(fmt))
+        self.tables = [(table, schema_table,
+                        fields + WAY_GEOMETRY_FIELDS if geometry and schema_table == 'way' else fields)
+                       for table, schema_table, fields in COLUMNAR_TABLES]
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.compression = compression or DEFAULT_COMPRESSION[fmt]
+        self.compression_level = compression_level
+        self.batch_size = batch_size
+        self.file_writers = []
+        self.writers = None
+
+    def paths(self):
+        return [os.path.join(self.out_dir, table + COLUMNAR_FORMATS[self.fmt])
+                for table, _, _ in self.tables]
+
+    def __enter__(self):
+        import pyarrow as pa
+
+        file_writer_class = ParquetFileWriter if self.fmt == 'parquet' else ArrowFileWriter
+        self.writers = []
+        for path, (table, schema_table, fields) in zip(self.paths(), self.tables):
+            columns = table_columns(schema_table, fields)
+            schema = arrow_schema(pa, columns, dictionary=self.fmt == 'parquet')
+            file_writer = file_writer_class(pa, path, schema, self.compression, self.compression_level)
+            self.file_writers.append(file_writer)
+            self.writers.append(ColumnarTableWriter(pa, file_writer, schema, columns, self.batch_size))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                for writer in self.writers:
+                    writer.flush()
+        finally:
+            for file_writer in self.file_writers:
+                file_writer.close()
+        return False
+
+def process_map_columnar(file_in, validate, use_cerberus=False, out_dir='.', fmt='parquet',
+                         compression=None, compression_level=None, geometry=False,
+                         quarantine=False):
+    """Iteratively process each XML element and write it to columnar file(s) in out_dir"""
+
+    node_index = NodeIndex(os.path.join(out_dir, NODE_INDEX_PATH), mode='w') if geometry else None
+    quarantine_path = os.path.join(out_dir, QUARANTINE_PATH)
+    dead_letters = Quarantine(quarantine_path) if quarantine else None
+    try:
+        with ColumnarSink(out_dir, fmt, compression, compression_level,
+                          geometry=geometry) as sink:
+            write_elements(file_in, sink.writers, validate, use_cerberus, node_index,
+                           quarantine=dead_letters)
+    finally:
+        if node_index is not None:
+            node_index.close()
+        if dead_letters is not None:
+            dead_letters.close()
+    if quarantine:
+        report_quarantine(quarantine_path)
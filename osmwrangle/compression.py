@@ -0,0 +1,208 @@
+"""
+Streaming bz2 / gzip decompression of the OSM input, and compression of the .csv output.
+"""
+
+import bz2
+import gzip
+import Queue
+import sys
+import threading
+import zlib
+
+# ================================================== #
+#      Compressed Input: Background Decompression    #
+# ================================================== #
+
+"""
+OSM extracts are mostly distributed as .osm.bz2 (or .osm.gz). get_element, and everything built
+on it, reads such files directly: open_osm returns a DecompressingReader for a compressed file
+(recognized by its first bytes, whatever its extension), and a plain file otherwise.
+
+A DecompressingReader decompresses in a background thread, which reads DECOMPRESS_CHUNK_SIZE
+compressed bytes at a time and keeps up to DECOMPRESS_QUEUE_SIZE decompressed chunks queued
+ahead of the parser. The bz2 and zlib modules release the GIL while they decompress, so the
+decompression runs alongside the parsing on another CPU.
+
+Files made by parallel compressors (pbzip2, lbzip2) and some extract services consist of many
+concatenated bz2 streams (or gzip members); Python 2's BZ2File stops after the first one. The
+reader starts a new decompressor whenever one stream ends, so it reads all of them.
+
+tell() returns the compressed bytes consumed, so that progress (see metrics.py) is measured
+against the size of the compressed file.
+"""
+
+DECOMPRESS_CHUNK_SIZE = 1 << 18  # Parameter: compressed bytes read at a time
+DECOMPRESS_QUEUE_SIZE = 16       # Parameter: decompressed chunks queued ahead of the parser
+
+MAGIC = [('BZh', 'bz2'), ('\x1f\x8b', 'gz')]
+
+def compression_of(path):
+    """'bz2' or 'gz' if the file at path is compressed, None otherwise"""
+
+    with open(path, 'rb') as f:
+        start = f.read(3)
+    for magic, codec in MAGIC:
+        if start.startswith(magic):
+            return codec
+    return None
+
+def new_decompressor(codec):
+    if codec == 'bz2':
+        return bz2.BZ2Decompressor()
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip header and trailer
+
+class DecompressingReader(object):
+    """File-like reader of a bz2 or gzip file, decompressed in a background thread"""
+
+    def __init__(self, path, codec=None):
+        self.codec = codec or compression_of(path)
+        if self.codec not in ('bz2', 'gz'):
+            raise Exception("'{0}' is not a bz2 or gzip file".format(path))
+        self.file = open(path, 'rb')
+        self.consumed = 0
+        self.buffer = ''
+        self.offset = 0  # of the first byte of the buffer not read yet
+        self.done = False
+        self.error = None
+        self.closed = threading.Event()
+        self.chunks = Queue.Queue(DECOMPRESS_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self.decompress)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, chunk):
+        while not self.closed.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def decompress(self):
+        """Background thread: decompress the file, stream after stream, into the queue"""
+
+        try:
+            decompressor = new_decompressor(self.codec)
+            while not self.closed.is_set():
+                data = self.file.read(DECOMPRESS_CHUNK_SIZE)
+                if not data:
+                    break
+                self.consumed += len(data)
+                while data:
+                    try:
+                        chunk = decompressor.decompress(data)
+                    except EOFError:
+                        # the previous stream ended exactly at the end of the last chunk
+                        decompressor = new_decompressor(self.codec)
+                        continue
+                    if chunk:
+                        self.put(chunk)
+                    data = decompressor.unused_data
+                    if data:
+                        decompressor = new_decompressor(self.codec)
+        except Exception:
+            self.error = sys.exc_info()
+        self.put(None)
+
+    def read(self, size=-1):
+        while not self.done and (size < 0 or len(self.buffer) - self.offset < size):
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.done = True
+                if self.error is not None:
+                    raise self.error[0], self.error[1], self.error[2]
+            else:
+                self.buffer = self.buffer[self.offset:] + chunk
+                self.offset = 0
+        if size < 0:
+            size = len(self.buffer) - self.offset
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def tell(self):
+        """Compressed bytes consumed"""
+        return self.consumed
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def open_osm(path):
+    """Open an OSM file for reading, decompressing it if it is compressed"""
+
+    codec = compression_of(path)
+    if codec is not None:
+        return DecompressingReader(path, codec)
+    return open(path, 'rb')
+
+# ================================================== #
+#          Compressed Output: .csv.gz / .csv.bz2     #
+# ================================================== #
+
+"""
+With compression='gz' or 'bz2', the .csv exports write nodes.csv.gz (or .bz2) and so on instead,
+at the given compression level. The csv writer writes a row at a time, so the rows are collected
+in a CompressingWriter and compressed COMPRESS_BUFFER_SIZE bytes at a time.
+"""
+
+CSV_COMPRESSION_LEVELS = {'gz': 6, 'bz2': 9}  # Parameter: default level of each codec
+COMPRESS_BUFFER_SIZE = 1 << 20                # Parameter: bytes compressed at a time
+
+def compressed_path(path, compression):
+    """The path of a .csv file written with a compression codec (or None)"""
+    return path + '.' + compression if compression else path
+
+class CompressingWriter(object):
+    """Write-only file object that compresses what is written to it with bz2 or gzip"""
+
+    def __init__(self, path, compression, level=None):
+        if compression not in CSV_COMPRESSION_LEVELS:
+            raise Exception("Unknown .csv compression '{0}', expected one of: {1}".format(
+                compression, ', '.join(sorted(CSV_COMPRESSION_LEVELS))))
+        if level is None:
+            level = CSV_COMPRESSION_LEVELS[compression]
+        if compression == 'bz2':
+            self.file = bz2.BZ2File(path, 'w', compresslevel=level)
+        else:
+            self.file = gzip.GzipFile(path, 'wb', compresslevel=level)
+        self.pending = []
+        self.pending_size = 0
+        self.written = 0
+
+    def write(self, data):
+        # like a plain file, refuse non-ASCII unicode right away (TableWriter then encodes it)
+        data = str(data)
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= COMPRESS_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.pending))
+        self.written += self.pending_size
+        self.pending = []
+        self.pending_size = 0
+
+    def tell(self):
+        """Uncompressed bytes written"""
+        return self.written + self.pending_size
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,290 @@
+"""
+Streaming, memory-bounded contributor statistics: unique users, top users and changeset activity.
+"""
+
+import math
+from array import array
+
+from .parse import get_element
+
+# ================================================== #
+#     Contributor Statistics: Sets and Sketches      #
+# ================================================== #
+
+"""
+ContributorStats counts the contributors of an OSM file in a single pass over its elements:
+
+- the number of unique users (uid) and changesets, exactly, in an IntSet: a bitmap per block of
+  65536 ids, so a set costs at most 8 KB per block of ids in use instead of a Python string per
+  id (a set of all the uids of the planet fits in a few MB),
+- the same numbers estimated by a HyperLogLog, in a fixed 2 ** HLL_PRECISION bytes whatever the
+  size of the file (with exact=False, the only memory used for them),
+- the top users and the top changesets by edits (the number of elements of the file they last
+  edited), counted in a count-min sketch, a fixed SKETCH_DEPTH x SKETCH_WIDTH array of counts,
+  with a candidate list of TOP_CANDIDATES times as many ids as asked for, and
+- the number of edits without a uid (anonymous, or stripped from the file) and the average
+  number of edits per changeset.
+
+The counts of the sketch are never below the true counts, and are above them by at most
+e / SKETCH_WIDTH of all the edits (with a high probability, and usually far less: the sketch is
+updated conservatively). Consecutive elements of the same user
+or changeset are common (the new nodes of a changeset have consecutive ids), so they are counted
+as one run, rather than one element at a time.
+
+ContributorStats is also an audit visitor (see audit.py), so audit_map gets these statistics in
+the same pass as the other checks.
+"""
+
+HLL_PRECISION = 14       # Parameter: 2 ** HLL_PRECISION registers (~0.8% standard error)
+SKETCH_WIDTH = 1 << 16   # Parameter: counts per row of the count-min sketch (a power of 2)
+SKETCH_DEPTH = 4         # Parameter: rows of the count-min sketch
+TOP_N = 10               # Parameter: top users / changesets reported
+TOP_CANDIDATES = 4       # Parameter: ids kept as candidates for the top, per id reported
+
+MASK64 = (1 << 64) - 1
+
+def mix64(key):
+    """A 64 bit hash of a non-negative integer (the MurmurHash3 finalizer)"""
+
+    key &= MASK64
+    key ^= key >> 33
+    key = (key * 0xff51afd7ed558ccd) & MASK64
+    key ^= key >> 33
+    key = (key * 0xc4ceb9fe1a85ec53) & MASK64
+    key ^= key >> 33
+    return key
+
+class IntSet(object):
+    """Exact set of non-negative integers, as a bitmap per block of 65536 integers"""
+
+    def __init__(self):
+        self.blocks = {}
+        self.count = 0
+
+    def add(self, n):
+        """Add n; return True if it was not in the set yet"""
+
+        block = self.blocks.get(n >> 16)
+        if block is None:
+            block = self.blocks[n >> 16] = bytearray(8192)
+        i, bit = (n & 0xffff) >> 3, 1 << (n & 7)
+        if block[i] & bit:
+            return False
+        block[i] |= bit
+        self.count += 1
+        return True
+
+    def __contains__(self, n):
+        n = int(n)
+        block = self.blocks.get(n >> 16)
+        return block is not None and bool(block[(n & 0xffff) >> 3] & (1 << (n & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for high in sorted(self.blocks):
+            block = self.blocks[high]
+            for i, byte in enumerate(block):
+                if byte:
+                    for bit in range(8):
+                        if byte & (1 << bit):
+                            yield (high << 16) | (i << 3) | bit
+
+class HyperLogLog(object):
+    """Approximate count of distinct 64 bit hashes, in 2 ** precision registers"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_hash(self, h):
+        index = h >> (64 - self.precision)
+        rank = 65 - self.precision - (h & ((1 << (64 - self.precision)) - 1)).bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count('\x00')
+        if estimate <= 2.5 * m and zeros:
+            # small range correction: linear counting
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+class CountMinSketch(object):
+    """Approximate counts of 64 bit hashes (never below the true counts), in a fixed array"""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        if width & (width - 1):
+            raise Exception("The count-min sketch width must be a power of 2, not {0}".format(width))
+        self.width = width
+        self.depth = depth
+        self.counts = array('l', [0]) * (width * depth)
+        # the index of each row is its own slice of the bits of the hash (extended with more
+        # hashes of it, if one is not enough)
+        bits = width.bit_length() - 1
+        self.rows = [(row * width, row * bits) for row in range(depth)]
+        self.words = (depth * bits + 63) // 64
+
+    def add_hash(self, h, n=1):
+        """Add n to the count of h; return its new count"""
+
+        counts, mask = self.counts, self.width - 1
+        for word in range(1, self.words):
+            h |= mix64(h + word) << (64 * word)
+        cells = [offset + ((h >> shift) & mask) for offset, shift in self.rows]
+        # conservative update: only the counts below the new count of h are raised to it, which
+        # keeps them upper bounds, and much closer to the true counts
+        count = min([counts[i] for i in cells]) + n
+        for i in cells:
+            if counts[i] < count:
+                counts[i] = count
+        return count
+
+class KeyCounter(object):
+    """Unique count (exact and / or approximate) and top ids by count of a stream of integer ids"""
+
+    def __init__(self, top_n=TOP_N, exact=True):
+        self.top_n = top_n
+        self.ids = IntSet() if exact else None
+        self.hll = HyperLogLog()
+        self.sketch = CountMinSketch()
+        self.total = 0
+        # top candidates: id -> [count, label]; floor is at most the lowest count among them
+        self.top = {}
+        self.capacity = top_n * TOP_CANDIDATES
+        self.floor = 0
+
+    def add(self, key, n=1, label=None):
+        """Count n occurrences of id key (label is reported with it, if it makes the top)"""
+
+        self.total += n
+        h = mix64(key)
+        # adding a hash to the HyperLogLog again changes nothing, so it only gets the new ids
+        # when the exact set tells them apart
+        if self.ids is None or self.ids.add(key):
+            self.hll.add_hash(h)
+        count = self.sketch.add_hash(h, n)
+
+        top = self.top
+        if key in top:
+            top[key] = [count, label]
+        elif len(top) < self.capacity:
+            top[key] = [count, label]
+        elif count > self.floor:
+            lowest = min(top, key=lambda k: top[k][0])
+            if count > top[lowest][0]:
+                del top[lowest]
+                top[key] = [count, label]
+            self.floor = min(entry[0] for entry in top.itervalues())
+
+    def unique(self):
+        """The exact number of unique ids (None with exact=False)"""
+        return None if self.ids is None else len(self.ids)
+
+    def estimate(self):
+        """The HyperLogLog estimate of the number of unique ids"""
+        return self.hll.count()
+
+    def most_common(self):
+        """The top_n (id, label, count) with the highest counts"""
+
+        ranked = sorted(self.top.iteritems(), key=lambda item: (-item[1][0], item[0]))
+        return [(key, label, count) for key, (count, label) in ranked[:self.top_n]]
+
+class ContributorStats(object):
+    """Contributor statistics of a stream of elements, usable as an audit visitor"""
+
+    name = 'contributors'
+
+    def __init__(self, top_n=TOP_N, exact=True):
+        self.users = KeyCounter(top_n, exact)
+        self.changesets = KeyCounter(top_n, exact)
+        self.elements = 0
+        self.anonymous = 0
+        # the current runs of the same uid and changeset: [raw value, length, label]
+        self.user_run = [None, 0, None]
+        self.changeset_run = [None, 0, None]
+
+    def visit(self, element):
+        self.elements += 1
+        get = element.get
+        uid = get('uid')
+        if uid is None:
+            self.anonymous += 1
+        else:
+            run = self.user_run
+            if uid == run[0]:
+                run[1] += 1
+            else:
+                if run[1]:
+                    self.users.add(int(run[0]), run[1], run[2])
+                run[:] = [uid, 1, get('user')]
+
+        changeset = get('changeset')
+        if changeset is not None:
+            run = self.changeset_run
+            if changeset == run[0]:
+                run[1] += 1
+            else:
+                if run[1]:
+                    self.changesets.add(int(run[0]), run[1], run[2])
+                run[:] = [changeset, 1, uid]
+
+    def flush(self, counter, run):
+        if run[1]:
+            counter.add(int(run[0]), run[1], run[2])
+            run[1] = 0
+
+    def result(self):
+        self.flush(self.users, self.user_run)
+        self.flush(self.changesets, self.changeset_run)
+        self.user_run[0] = self.changeset_run[0] = None
+        changesets = self.changesets.unique() or self.changesets.estimate()
+        return {'elements': self.elements,
+                'anonymous': self.anonymous,
+                'users': self.users.unique(),
+                'users_estimate': self.users.estimate(),
+                'top_users': self.users.most_common(),
+                'changesets': self.changesets.unique(),
+                'changesets_estimate': self.changesets.estimate(),
+                'top_changesets': self.changesets.most_common(),
+                'edits_per_changeset': float(self.changesets.total) / changesets if changesets
+                                       else 0.0}
+
+def contributor_stats(osm_file, top_n=TOP_N, exact=True):
+    """Contributor statistics of osm_file, in a single pass (exact=False: in fixed memory)"""
+
+    stats = ContributorStats(top_n, exact)
+    for element in get_element(osm_file, tags=('node', 'way', 'relation')):
+        stats.visit(element)
+    return stats.result()
+
+def print_contributors(result):
+    """Print the results of contributor_stats"""
+
+    if result['users'] is not None:
+        print "Unique users: {0} (HyperLogLog estimate {1})".format(result['users'],
+                                                                    result['users_estimate'])
+    else:
+        print "Unique users: ~{0} (HyperLogLog estimate)".format(result['users_estimate'])
+    print "Edits without a user id: {0} of {1}".format(result['anonymous'], result['elements'])
+    print "\n"
+    print "Top users by edits:"
+    for uid, user, edits in result['top_users']:
+        print u"  {0:>10}  {1:<30} {2}".format(uid, user or u'', edits).encode('utf-8')
+    print "\n"
+
+    if result['changesets'] is not None:
+        print "Changesets: {0} (HyperLogLog estimate {1})".format(result['changesets'],
+                                                                  result['changesets_estimate'])
+    else:
+        print "Changesets: ~{0} (HyperLogLog estimate)".format(result['changesets_estimate'])
+    print "Average edits per changeset: {0:.1f}".format(result['edits_per_changeset'])
+    print "\n"
+    print "Top changesets by edits:"
+    for changeset, uid, edits in result['top_changesets']:
+        print "  {0:>10}  user {1:<10} {2}".format(changeset, uid, edits)
@@ -0,0 +1,205 @@
+"""
+Direct load of the shaped OSM elements into a SQLite database.
+"""
+
+import os
+import sqlite3
+
+from .export import write_elements
+from .geometry import NodeIndex, NODE_INDEX_PATH
+from .quarantine import Quarantine, QUARANTINE_PATH, report_quarantine
+from .shape import (NODE_FIELDS, NODE_TAGS_FIELDS, WAY_FIELDS, WAY_TAGS_FIELDS, WAY_NODES_FIELDS,
+                    WAY_GEOMETRY_FIELDS, RELATION_FIELDS, RELATION_MEMBERS_FIELDS,
+                    RELATION_TAGS_FIELDS)
+from .validate import SCHEMA
+
+# ================================================== #
+#      SQLite Export: Direct Bulk Load (no .csv)     #
+# ================================================== #
+
+"""
+SQLiteSink provides the same 8 writers as process_map (writerow / writerows), but inserts the
+shaped rows straight into a SQLite database instead of writing .csv files. Rows are buffered
+and inserted with executemany, inside large transactions, with journaling and syncing turned
+off for the duration of the load. The indexes are only created once all rows are loaded.
+
+Without a journal, a load that fails cannot be rolled back (and the transactions committed
+before the failure could not be anyway), so a failed load removes what it wrote instead, if it
+can: the database file if the load created it, otherwise the tables of the export. Whatever else the
+database holds is left as it was; a process killed part way through a load leaves the tables
+(and possibly the database file) unusable.
+
+The column types are taken from schema.py (integer -> INTEGER, float -> REAL, string -> TEXT).
+The shaped values are inserted as the same strings that would be written to the .csv files and
+SQLite's column type affinity converts them, so the tables match a .csv import row for row.
+
+With geometry=True the ways table gets the WAY_GEOMETRY_FIELDS columns as well (see
+geometry.py), and the node index is kept next to the database.
+"""
+
+SQL_TABLES = [('nodes', 'node', NODE_FIELDS),
+              ('nodes_tags', 'node_tags', NODE_TAGS_FIELDS),
+              ('ways', 'way', WAY_FIELDS),
+              ('ways_nodes', 'way_nodes', WAY_NODES_FIELDS),
+              ('ways_tags', 'way_tags', WAY_TAGS_FIELDS),
+              ('relations', 'relation', RELATION_FIELDS),
+              ('relations_members', 'relation_members', RELATION_MEMBERS_FIELDS),
+              ('relations_tags', 'relation_tags', RELATION_TAGS_FIELDS)]
+
+SQL_TYPES = {'integer': 'INTEGER', 'float': 'REAL', 'string': 'TEXT'}
+
+SQL_INDEXES = ['CREATE INDEX IF NOT EXISTS nodes_tags_id ON nodes_tags (id)',
+               'CREATE INDEX IF NOT EXISTS nodes_tags_key ON nodes_tags (key)',
+               'CREATE INDEX IF NOT EXISTS ways_nodes_id ON ways_nodes (id)',
+               'CREATE INDEX IF NOT EXISTS ways_nodes_node_id ON ways_nodes (node_id)',
+               'CREATE INDEX IF NOT EXISTS ways_tags_id ON ways_tags (id)',
+               'CREATE INDEX IF NOT EXISTS ways_tags_key ON ways_tags (key)',
+               'CREATE INDEX IF NOT EXISTS relations_members_id ON relations_members (id)',
+               'CREATE INDEX IF NOT EXISTS relations_members_member_id '
+               'ON relations_members (member_type, member_id)',
+               'CREATE INDEX IF NOT EXISTS relations_tags_id ON relations_tags (id)',
+               'CREATE INDEX IF NOT EXISTS relations_tags_key ON relations_tags (key)']
+
+SQL_LOAD_PRAGMAS = ['PRAGMA journal_mode = OFF',
+                    'PRAGMA synchronous = OFF',
+                    'PRAGMA locking_mode = EXCLUSIVE',
+                    'PRAGMA temp_store = MEMORY',
+                    'PRAGMA cache_size = -262144']  # 256MB
+
+SQL_BATCH_SIZE = 10000        # rows per executemany
+SQL_COMMIT_ROWS = 1000000     # rows per transaction
+
+def create_table_sql(table, schema_table, fields, schema=SCHEMA):
+    """Build the CREATE TABLE statement for a table, with column types from schema.py"""
+
+    rules = schema[schema_table]['schema']
+    if rules.get('type') == 'dict':
+        rules = rules['schema']
+
+    columns = []
+    for field in fields:
+        column = '"{0}" {1}'.format(field, SQL_TYPES[rules[field]['type']])
+        if field == 'id' and schema[schema_table]['type'] == 'dict':
+            column += ' PRIMARY KEY NOT NULL'
+        columns.append(column)
+    return 'CREATE TABLE {0} ({1})'.format(table, ', '.join(columns))
+
+class SQLiteTableWriter(object):
+    """Buffer rows for one table and insert them in batches with executemany"""
+
+    def __init__(self, sink, table, fields, batch_size=SQL_BATCH_SIZE):
+        self.sink = sink
+        self.fields = fields
+        self.batch_size = batch_size
+        self.rows = []
+        self.sql = 'INSERT INTO {0} VALUES ({1})'.format(table, ', '.join('?' * len(fields)))
+
+    def writerow(self, row):
+        self.rows.append(tuple([row[field] for field in self.fields]))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        fields = self.fields
+        self.rows.extend(tuple([row[field] for field in fields]) for row in rows)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def write_way_nodes(self, batch):
+        self.flush()
+        self.sink.execute_batch(self.sql, list(batch.tuples()))
+
+    def flush(self):
+        if self.rows:
+            self.sink.execute_batch(self.sql, self.rows)
+            self.rows = []
+
+class SQLiteSink(object):
+    """Context manager providing process_map style writers that load into a SQLite database"""
+
+    def __init__(self, db_path, commit_rows=SQL_COMMIT_ROWS, geometry=False):
+        self.db_path = db_path
+        self.commit_rows = commit_rows
+        self.tables = [(table, schema_table,
+                        fields + WAY_GEOMETRY_FIELDS if geometry and schema_table == 'way' else fields)
+                       for table, schema_table, fields in SQL_TABLES]
+        self.uncommitted = 0
+        self.conn = None
+        self.writers = None
+        self.created = False
+
+    def __enter__(self):
+        self.created = not os.path.exists(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        for pragma in SQL_LOAD_PRAGMAS:
+            self.conn.execute(pragma)
+        for table, schema_table, fields in self.tables:
+            self.conn.execute('DROP TABLE IF EXISTS {0}'.format(table))
+            self.conn.execute(create_table_sql(table, schema_table, fields))
+        self.conn.commit()
+
+        self.writers = [SQLiteTableWriter(self, table, fields) for table, _, fields in self.tables]
+        return self
+
+    def execute_batch(self, sql, rows):
+        self.conn.executemany(sql, rows)
+        self.uncommitted += len(rows)
+        if self.uncommitted >= self.commit_rows:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                for writer in self.writers:
+                    writer.flush()
+                self.conn.commit()
+                for index in SQL_INDEXES:
+                    self.conn.execute(index)
+                self.conn.execute('ANALYZE')
+                self.conn.commit()
+        finally:
+            self.conn.close()
+        if exc_type is not None:
+            try:
+                self.discard()
+            except (OSError, sqlite3.Error):
+                # the error of the load is the one to report
+                pass
+        return False
+
+    def discard(self):
+        """Remove the partial load of a failed export (see above)"""
+
+        if self.created:
+            os.remove(self.db_path)
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for table, _, _ in self.tables:
+                conn.execute('DROP TABLE IF EXISTS {0}'.format(table))
+            conn.commit()
+        finally:
+            conn.close()
+
+def process_map_sqlite(file_in, db_path, validate, use_cerberus=False, geometry=False,
+                       quarantine=False):
+    """Iteratively process each XML element and load it into the SQLite database at db_path"""
+
+    node_index = None
+    if geometry:
+        index_path = os.path.splitext(db_path)[0] + '.' + NODE_INDEX_PATH
+        node_index = NodeIndex(index_path, mode='w')
+    quarantine_path = os.path.splitext(db_path)[0] + '.' + QUARANTINE_PATH
+    dead_letters = Quarantine(quarantine_path) if quarantine else None
+    try:
+        with SQLiteSink(db_path, geometry=geometry) as sink:
+            write_elements(file_in, sink.writers, validate, use_cerberus, node_index,
+                           quarantine=dead_letters)
+    finally:
+        if node_index is not None:
+            node_index.close()
+        if dead_letters is not None:
+            dead_letters.close()
+    if quarantine:
+        report_quarantine(quarantine_path)
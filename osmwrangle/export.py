@@ -0,0 +1,613 @@
+"""
+Export of the shaped OSM elements to the .csv files for the SQL database.
+"""
+
+import codecs
+import csv
+import os
+import re
+import shutil
+import tempfile
+from itertools import izip
+from operator import itemgetter
+from timeit import default_timer as timer
+
+from . import metrics
+from .compression import CompressingWriter, compressed_path, compression_of, open_osm
+from .fix import fix_element
+from .geometry import NodeIndex, build_node_index, NODE_INDEX_PATH
+from .parse import get_element
+from .pbf import PBFReader, is_pbf, pbf_shards
+from .quarantine import Quarantine, QUARANTINE_PATH, report_quarantine
+from .spatial import SpatialIndex, SPATIAL_INDEX_PATH
+from .tagindex import TagIndex, TAG_INDEX_PATH
+from .shape import (shape_element, NODE_FIELDS, NODE_TAGS_FIELDS, WAY_FIELDS, WAY_TAGS_FIELDS,
+                    WAY_NODES_FIELDS, WAY_GEOMETRY_FIELDS, RELATION_FIELDS,
+                    RELATION_MEMBERS_FIELDS, RELATION_TAGS_FIELDS)
+from .validate import validate_element, get_validator
+from .waynodes import (WayNodesBatch, write_relation_members, write_way_nodes,
+                       WAY_NODES_BATCH_SIZE)
+
+NODES_PATH = "nodes.csv"
+NODE_TAGS_PATH = "nodes_tags.csv"
+WAYS_PATH = "ways.csv"
+WAY_NODES_PATH = "ways_nodes.csv"
+WAY_TAGS_PATH = "ways_tags.csv"
+RELATIONS_PATH = "relations.csv"
+RELATION_MEMBERS_PATH = "relations_members.csv"
+RELATION_TAGS_PATH = "relations_tags.csv"
+
+# the top level elements that are exported, in one pass
+EXPORT_ELEMENTS = ('node', 'way', 'relation')
+
+CSV_BUFFER_SIZE = 1 << 20  # Parameter: write buffer of each .csv file, in bytes
+
+class UnicodeDictWriter(csv.DictWriter, object):
+    """Extend csv.DictWriter to handle Unicode input (the exports use the faster TableWriter)"""
+
+    def writerow(self, row):
+        super(UnicodeDictWriter, self).writerow({
+            k: (v.encode('utf-8') if isinstance(v, unicode) else v) for k, v in row.iteritems()
+        })
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write_way_nodes(self, batch):
+        """Write a WayNodesBatch (ints only, so nothing to encode)"""
+        self.writer.writerows(batch.tuples())
+
+# ================================================== #
+#          Table Writer: Rows in Field Order         #
+# ================================================== #
+
+"""
+TableWriter writes the same bytes as UnicodeDictWriter, with much less work per row. Instead of
+building an encoded copy of each row dict and letting csv.DictWriter map it to a list (checking
+every key against the field names on the way), it takes the values out of the dict in field
+order with a single itemgetter call and hands the tuple straight to the C csv writer.
+
+Values are not encoded up front either: the parser returns str for every ASCII value, and the csv
+writer only fails (with a UnicodeEncodeError, before anything is written) on a unicode value with
+non-ASCII characters. Only those rows are encoded to UTF-8 and written again. Batches of tuples,
+like the WayNodesBatch of way_nodes, go to the csv writer in a single call.
+
+The exports open the .csv files with CSV_BUFFER_SIZE buffers; codecs.open is line buffered by
+default, which costs a write system call per row. With a compression codec they write .csv.gz or
+.csv.bz2 files instead (see compression.py).
+"""
+
+def open_csv(path, compression=None, compression_level=None):
+    """Open a .csv file for writing, with a CSV_BUFFER_SIZE buffer (or compressed, as path.gz or
+    path.bz2)"""
+
+    if compression:
+        return CompressingWriter(compressed_path(path, compression), compression, compression_level)
+    return codecs.open(path, 'w', buffering=CSV_BUFFER_SIZE)
+
+def encode_row(row):
+    """A row tuple with its unicode values encoded to UTF-8"""
+    return tuple(v.encode('utf-8') if isinstance(v, unicode) else v for v in row)
+
+def is_ascii(row):
+    """Can the csv writer write a row as it is (no unicode values with non-ASCII characters)?"""
+
+    for v in row:
+        if isinstance(v, unicode):
+            try:
+                v.encode('ascii')
+            except UnicodeEncodeError:
+                return False
+    return True
+
+class TableWriter(object):
+    """Fast .csv writer of row dicts or tuples with the given fields, in field order"""
+
+    def __init__(self, f, fieldnames):
+        self.fieldnames = fieldnames
+        self.writer = csv.writer(f)
+        self.row_tuple = itemgetter(*fieldnames)
+
+    def writeheader(self):
+        self.writer.writerow(self.fieldnames)
+
+    def writerow(self, row):
+        try:
+            row = self.row_tuple(row)
+        except KeyError:
+            # a missing field is written empty, as csv.DictWriter does
+            row = tuple(row.get(field, '') for field in self.fieldnames)
+        try:
+            self.writer.writerow(row)
+        except UnicodeEncodeError:
+            self.writer.writerow(encode_row(row))
+
+    def writerows(self, rows):
+        rows = list(rows)
+        try:
+            tuples = map(self.row_tuple, rows)
+        except KeyError:
+            tuples = [tuple(row.get(field, '') for field in self.fieldnames) for row in rows]
+        self.write_tuples(tuples)
+
+    def write_tuples(self, rows):
+        """Write a list of row tuples in field order"""
+
+        while rows:
+            try:
+                self.writer.writerows(rows)
+                return
+            except UnicodeEncodeError:
+                # the rows before the first one that needs encoding have been written
+                i = next(i for i, row in enumerate(rows) if not is_ascii(row))
+                self.writer.writerow(encode_row(rows[i]))
+                rows = rows[i + 1:]
+
+    def write_way_nodes(self, batch):
+        """Write a WayNodesBatch (ints only, so nothing to encode)"""
+        self.writer.writerows(batch.tuples())
+
+# ================================================== #
+#          Main Function: Provided by Udacity        #
+# ================================================== #
+def process_map(file_in, validate, use_cerberus=False, out_dir='.', geometry=False,
+                spatial=False, tag_index=False, compression=None, compression_level=None,
+                quarantine=False):
+    """Iteratively process each XML element and write to csv(s)"""
+
+    # With geometry, the nodes are indexed in NODE_INDEX_PATH as they are written, and the ways
+    # get the WAY_GEOMETRY_FIELDS (see geometry.py). With spatial, the rows are also filed in the
+    # tile index at SPATIAL_INDEX_PATH (see spatial.py), which needs the way geometry. With
+    # tag_index, the tags are indexed by type, key and value in TAG_INDEX_PATH (see tagindex.py).
+    # With compression ('gz' or 'bz2'), the .csv files are compressed (see compression.py). With
+    # quarantine, the elements that fail are written to QUARANTINE_PATH (see quarantine.py).
+    if spatial and compression:
+        raise Exception("The spatial index points into the .csv files, so they cannot be compressed")
+    geometry = geometry or spatial
+    way_fields = WAY_FIELDS + WAY_GEOMETRY_FIELDS if geometry else WAY_FIELDS
+    node_index = NodeIndex(os.path.join(out_dir, NODE_INDEX_PATH), mode='w') if geometry else None
+    tags = TagIndex(os.path.join(out_dir, TAG_INDEX_PATH), mode='w') if tag_index else None
+    quarantine_path = os.path.join(out_dir, QUARANTINE_PATH)
+    dead_letters = Quarantine(quarantine_path) if quarantine else None
+
+    try:
+        write_csvs(file_in, validate, use_cerberus, out_dir, way_fields, node_index, spatial, tags,
+                   compression, compression_level, dead_letters)
+    finally:
+        if node_index is not None:
+            node_index.close()
+        if dead_letters is not None:
+            dead_letters.close()
+    if tags is not None:
+        tags.close()
+    if quarantine:
+        report_quarantine(quarantine_path)
+
+def write_csvs(file_in, validate, use_cerberus, out_dir, way_fields, node_index, spatial=False,
+               tag_index=None, compression=None, compression_level=None, quarantine=None):
+    def open_table(path):
+        return open_csv(os.path.join(out_dir, path), compression, compression_level)
+
+    with open_table(NODES_PATH) as nodes_file, \
+         open_table(NODE_TAGS_PATH) as nodes_tags_file, \
+         open_table(WAYS_PATH) as ways_file, \
+         open_table(WAY_NODES_PATH) as way_nodes_file, \
+         open_table(WAY_TAGS_PATH) as way_tags_file, \
+         open_table(RELATIONS_PATH) as relations_file, \
+         open_table(RELATION_MEMBERS_PATH) as relation_members_file, \
+         open_table(RELATION_TAGS_PATH) as relation_tags_file:
+
+        nodes_writer = TableWriter(nodes_file, NODE_FIELDS)
+        node_tags_writer = TableWriter(nodes_tags_file, NODE_TAGS_FIELDS)
+        ways_writer = TableWriter(ways_file, way_fields)
+        way_nodes_writer = TableWriter(way_nodes_file, WAY_NODES_FIELDS)
+        way_tags_writer = TableWriter(way_tags_file, WAY_TAGS_FIELDS)
+        relations_writer = TableWriter(relations_file, RELATION_FIELDS)
+        relation_members_writer = TableWriter(relation_members_file, RELATION_MEMBERS_FIELDS)
+        relation_tags_writer = TableWriter(relation_tags_file, RELATION_TAGS_FIELDS)
+
+        nodes_writer.writeheader()
+        node_tags_writer.writeheader()
+        ways_writer.writeheader()
+        way_nodes_writer.writeheader()
+        way_tags_writer.writeheader()
+        relations_writer.writeheader()
+        relation_members_writer.writeheader()
+        relation_tags_writer.writeheader()
+
+        spatial_index = None
+        if spatial:
+            spatial_index = SpatialIndex(os.path.join(out_dir, SPATIAL_INDEX_PATH),
+                                         (nodes_file, nodes_tags_file, ways_file, way_tags_file))
+        write_elements(file_in, (nodes_writer, node_tags_writer, ways_writer, way_nodes_writer,
+                                 way_tags_writer, relations_writer, relation_members_writer,
+                                 relation_tags_writer), validate, use_cerberus,
+                       node_index, spatial_index, tag_index, quarantine)
+        if spatial_index is not None:
+            spatial_index.close()
+
+def write_elements(file_in, writers, validate, use_cerberus=False, node_index=None,
+                   spatial_index=None, tag_index=None, quarantine=None):
+    """Shape (and optionally validate) each node / way / relation element and write it to the 8
+    writers (nodes, node tags, ways, way nodes, way tags, relations, relation members and
+    relation tags). With a node_index, the ways are shaped with their geometry (and the nodes are added to the
+    index, unless it is read only). With a spatial_index, each node and way is filed in it just
+    before it is written, and with a tag_index its tags are added to it. With a Quarantine, the
+    elements that fail fixing, shaping or validation are written to it instead of raising"""
+
+    m = metrics.METRICS
+    validator = get_validator(use_cerberus) if validate is True else None
+
+    # With timing, open the file here, so that progress can be measured in bytes consumed (of the
+    # compressed file, if it is compressed)
+    osm_file = progress = None
+    if m.timing and isinstance(file_in, basestring):
+        osm_file = open_osm(file_in)
+        m.start(os.path.getsize(file_in))
+        file_in = osm_file
+        progress = lambda: m.progress(osm_file.tell())
+
+    try:
+        write_shaped(get_element(file_in, tags=EXPORT_ELEMENTS), writers, validator, node_index,
+                     spatial_index, tag_index, quarantine, timed=m.timing, progress=progress)
+    finally:
+        if osm_file is not None:
+            osm_file.close()
+
+def no_timer():
+    """The clock of write_shaped when it is not timed"""
+    return 0.0
+
+def write_shaped(elements, writers, validator=None, node_index=None, spatial_index=None,
+                 tag_index=None, quarantine=None, timed=False, progress=None):
+    """The loop of write_elements, over parsed elements (validated if a validator is given).
+    With timed, each stage and element type is timed and counted in the metrics, and progress
+    (if given) is called every PROGRESS_EVERY elements (see metrics.py)"""
+
+    (nodes_writer, node_tags_writer, ways_writer, way_nodes_writer, way_tags_writer,
+     relations_writer, relation_members_writer, relation_tags_writer) = writers
+
+    m = metrics.METRICS
+    counters, timers = m.counters, m.timers
+    clock = timer if timed else no_timer
+    way_nodes = WayNodesBatch()
+    index_nodes = node_index is not None and node_index.writable
+    if quarantine is not None:
+        elements = quarantine.counted(elements)
+
+    n = 0
+    t0 = clock()
+    for element in elements:
+        t1 = clock()
+        try:
+            stage = 'fix'
+            fix_element(element)
+            t2 = clock()
+            stage = 'shape'
+            el = shape_element(element, fix=False, node_index=node_index)
+            t3 = clock()
+            if el and validator is not None:
+                stage = 'validate'
+                validate_element(el, validator)
+            t4 = clock()
+            tag = element.tag
+            if el:
+                # nothing of the element is written yet: a way whose node refs are not numbers,
+                # or an element the indexes cannot take (a node whose coordinates are not
+                # numbers, or out of id order...), is quarantined rather than half written
+                if tag == 'way':
+                    # the node refs become ints in the batch
+                    stage = 'shape'
+                    way_nodes.append(el['way_nodes'])
+                stage = 'index'
+                if tag == 'node':
+                    node = el['node']
+                    if node_index is not None:
+                        # checked as well when the index was built beforehand (read only)
+                        node_id, lat, lon = int(node['id']), float(node['lat']), float(node['lon'])
+                        if index_nodes:
+                            node_index.add(node_id, lat, lon)
+                    if spatial_index is not None:
+                        spatial_index.add_node(node, len(el['node_tags']))
+                    if tag_index is not None:
+                        tag_index.add('node', node['id'], el['node_tags'])
+                elif tag == 'way':
+                    if spatial_index is not None:
+                        spatial_index.add_way(el['way'], len(el['way_tags']))
+                    if tag_index is not None:
+                        tag_index.add('way', el['way']['id'], el['way_tags'])
+                elif tag == 'relation':
+                    if tag_index is not None:
+                        tag_index.add('relation', el['relation']['id'], el['relation_tags'])
+        except Exception as error:
+            if quarantine is None:
+                raise
+            quarantine.add(element, stage, error)
+            t0 = clock()
+            continue
+
+        if el:
+            if tag == 'node':
+                nodes_writer.writerow(el['node'])
+                node_tags_writer.writerows(el['node_tags'])
+            elif tag == 'way':
+                ways_writer.writerow(el['way'])
+                way_tags_writer.writerows(el['way_tags'])
+                if len(way_nodes) >= WAY_NODES_BATCH_SIZE:
+                    write_way_nodes(way_nodes_writer, way_nodes)
+                    way_nodes = WayNodesBatch()
+            elif tag == 'relation':
+                relations_writer.writerow(el['relation'])
+                write_relation_members(relation_members_writer, el['relation_members'])
+                relation_tags_writer.writerows(el['relation_tags'])
+
+        if timed:
+            t5 = clock()
+            timers['parse'] += t1 - t0
+            timers['fix'] += t2 - t1
+            timers['shape'] += t3 - t2
+            timers['validate'] += t4 - t3
+            timers['write'] += t5 - t4
+            timers['element.' + tag] += t5 - t0
+            counters['elements.' + tag] += 1
+
+            n += 1
+            if progress is not None and n % metrics.PROGRESS_EVERY == 0:
+                progress()
+            t0 = clock()
+
+    t4 = clock()
+    write_way_nodes(way_nodes_writer, way_nodes)
+    if timed:
+        timers['write'] += clock() - t4
+
+# ================================================== #
+#        Parallel Export: Sharded process_map        #
+# ================================================== #
+
+"""
+process_map_parallel splits the OSM file into byte-range shards, each starting on a top level
+node / way / relation element, and shapes, fixes and validates the shards in a process pool.
+Every shard is written to its own set of headerless .csv files, which are then appended to the
+final .csv files in shard order, so the output is identical to that of process_map.
+
+Shard boundaries are found by scanning for the next '<node', '<way' or '<relation' start tag,
+which can only appear at the top level of an OSM file ('<' is always escaped in attribute
+values). PBF files are split between blobs instead (see pbf.py). There are more shards than
+processes so that the pool stays evenly loaded. Shards are byte ranges of the OSM file, so
+compressed input needs the serial or the pipelined export instead.
+
+With geometry, the node index is built first, in a pass over the nodes only, and every worker
+opens it read only to resolve the geometry of the ways in its shards. With spatial, every worker
+also builds a tile index of its shard's rows, and the shard indexes are merged into the final one
+with their offsets moved to where the shard's rows land in the final .csv files. The tag indexes
+of the shards are merged in shard order, which keeps the posting lists sorted, and their
+quarantine files are appended in shard order.
+"""
+
+EXPORT_TABLES = [(NODES_PATH, NODE_FIELDS),
+                 (NODE_TAGS_PATH, NODE_TAGS_FIELDS),
+                 (WAYS_PATH, WAY_FIELDS),
+                 (WAY_NODES_PATH, WAY_NODES_FIELDS),
+                 (WAY_TAGS_PATH, WAY_TAGS_FIELDS),
+                 (RELATIONS_PATH, RELATION_FIELDS),
+                 (RELATION_MEMBERS_PATH, RELATION_MEMBERS_FIELDS),
+                 (RELATION_TAGS_PATH, RELATION_TAGS_FIELDS)]
+
+def export_tables(geometry=False):
+    """EXPORT_TABLES, with the WAY_GEOMETRY_FIELDS added to the ways table if geometry is True"""
+
+    if not geometry:
+        return EXPORT_TABLES
+    return [(path, fields + WAY_GEOMETRY_FIELDS if path == WAYS_PATH else fields)
+            for path, fields in EXPORT_TABLES]
+
+TOP_LEVEL_START = re.compile(r'<(node|way|relation)[\s/>]')
+
+SHARD_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<osm>\n'
+SHARD_FOOTER = '</osm>\n'
+SHARDS_PER_PROCESS = 4
+
+def next_element_offset(osm_file, offset, chunk_size=1 << 20):
+    """Return the byte offset of the first top level element starting at or after offset"""
+
+    osm_file.seek(offset)
+    tail = ''
+    while True:
+        chunk = osm_file.read(chunk_size)
+        if not chunk:
+            return None
+        data = tail + chunk
+        m = TOP_LEVEL_START.search(data)
+        if m:
+            return offset - len(tail) + m.start()
+        # keep enough of the chunk to match a start tag split over two reads
+        tail = data[-16:]
+        offset += len(chunk)
+
+def root_end_offset(osm_file, size, chunk_size=1 << 16):
+    """Return the byte offset of the closing </osm> tag"""
+
+    osm_file.seek(max(0, size - chunk_size))
+    data = osm_file.read()
+    pos = data.rfind('</osm>')
+    if pos == -1:
+        raise Exception("No closing </osm> tag found in the last {0} bytes".format(chunk_size))
+    return size - len(data) + pos
+
+def find_shards(file_in, n_shards):
+    """Split file_in into at most n_shards (start, end) byte ranges of whole top level elements"""
+
+    if is_pbf(file_in):
+        return pbf_shards(file_in, n_shards)
+    size = os.path.getsize(file_in)
+    starts = []
+    with open(file_in, 'rb') as osm_file:
+        for i in range(n_shards):
+            offset = next_element_offset(osm_file, size * i // n_shards)
+            if offset is None:
+                break
+            if not starts or offset > starts[-1]:
+                starts.append(offset)
+        end = root_end_offset(osm_file, size)
+
+    starts = [start for start in starts if start < end]
+    return zip(starts, starts[1:] + [end])
+
+class ShardReader(object):
+    """File-like view of the bytes [start, end) of an OSM file, wrapped in an <osm> root"""
+
+    def __init__(self, file_in, start, end):
+        self.osm_file = open(file_in, 'rb')
+        self.osm_file.seek(start)
+        self.remaining = end - start
+        self.pending = [SHARD_HEADER]
+
+    def read(self, size=-1):
+        if self.pending:
+            return self.pending.pop(0)
+        if self.remaining > 0:
+            if size < 0 or size > self.remaining:
+                size = self.remaining
+            data = self.osm_file.read(size)
+            self.remaining -= len(data)
+            if not data:
+                self.remaining = 0
+            if self.remaining == 0:
+                self.pending.append(SHARD_FOOTER)
+            return data or self.read(size)
+        return ''
+
+    def tell(self):
+        """Offset in the OSM file of the next byte to read"""
+        return self.osm_file.tell()
+
+    def close(self):
+        self.osm_file.close()
+
+def export_shard(args):
+    """Pool worker: write one shard to its own set of headerless .csv files; return their paths
+    and the shard's metrics counters and timers"""
+
+    (file_in, start, end, validate, use_cerberus, out_paths, index_path, spatial_path,
+     tag_index_path, quarantine_path) = args
+
+    # the worker's copy of the metrics only collects this shard's counters and timers
+    metrics.METRICS.reset()
+
+    tables = export_tables(geometry=index_path is not None)
+    node_index = NodeIndex(index_path) if index_path is not None else None
+    files = [open_csv(path) for path in out_paths]
+    if is_pbf(file_in):
+        reader = PBFReader(file_in, start, end, workers=1)
+    else:
+        reader = ShardReader(file_in, start, end)
+    spatial_index = None
+    if spatial_path is not None:
+        spatial_index = SpatialIndex(spatial_path, (files[0], files[1], files[2], files[4]))
+    tag_index = TagIndex(tag_index_path, mode='w') if tag_index_path is not None else None
+    quarantine = Quarantine(quarantine_path) if quarantine_path is not None else None
+    try:
+        writers = [TableWriter(f, fields) for f, (_, fields) in zip(files, tables)]
+        write_elements(reader, writers, validate, use_cerberus, node_index, spatial_index,
+                       tag_index, quarantine)
+    finally:
+        if quarantine is not None:
+            quarantine.close()
+        if tag_index is not None:
+            tag_index.close()
+        if spatial_index is not None:
+            spatial_index.close(create_indexes=False)
+        if node_index is not None:
+            node_index.close()
+        reader.close()
+        for f in files:
+            f.close()
+    return out_paths, dict(metrics.METRICS.counters), dict(metrics.METRICS.timers)
+
+def process_map_parallel(file_in, validate, processes=None, shards=None, use_cerberus=False,
+                         out_dir='.', geometry=False, spatial=False, tag_index=False,
+                         compression=None, compression_level=None, quarantine=False):
+    """Export file_in to the same csv(s) as process_map, using a pool of processes"""
+
+    import multiprocessing
+
+    if compression_of(file_in):
+        raise Exception("'{0}' is compressed: the parallel export needs an uncompressed OSM "
+                        "file (the pipelined export decompresses in the background)".format(file_in))
+    if spatial and compression:
+        raise Exception("The spatial index points into the .csv files, so they cannot be compressed")
+    geometry = geometry or spatial
+    processes = processes or multiprocessing.cpu_count()
+    shards = find_shards(file_in, shards or processes * SHARDS_PER_PROCESS)
+    tables = export_tables(geometry)
+
+    index_path = None
+    if geometry:
+        index_path = build_node_index(file_in, os.path.join(out_dir, NODE_INDEX_PATH),
+                                      skip_invalid=quarantine)
+
+    tmp_dir = tempfile.mkdtemp(prefix='osm_shards_', dir=out_dir)
+    try:
+        jobs = []
+        for i, (start, end) in enumerate(shards):
+            out_paths = [os.path.join(tmp_dir, '{0:05d}.{1}'.format(i, os.path.basename(path)))
+                         for path, _ in EXPORT_TABLES]
+            spatial_path = os.path.join(tmp_dir, '{0:05d}.tiles.db'.format(i)) if spatial else None
+            tag_index_path = os.path.join(tmp_dir, '{0:05d}.tags.idx'.format(i)) if tag_index else None
+            quarantine_path = (os.path.join(tmp_dir, '{0:05d}.{1}'.format(i, QUARANTINE_PATH))
+                               if quarantine else None)
+            jobs.append((file_in, start, end, validate, use_cerberus, out_paths, index_path,
+                         spatial_path, tag_index_path, quarantine_path))
+
+        m = metrics.METRICS
+        if m.timing:
+            m.start(os.path.getsize(file_in))
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = []
+            for (start, end), (out_paths, counters, timers), job in izip(
+                    shards, pool.imap(export_shard, jobs, chunksize=1), jobs):
+                results.append((out_paths, job[7], job[8]))
+                m.merge(counters, timers)
+                m.progress(end)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        # Merge the shard outputs in shard order, noting where each shard's rows start
+        offsets = [[] for _ in results]
+        for t, (path, fields) in enumerate(tables):
+            with open_csv(os.path.join(out_dir, path), compression, compression_level) as out_file:
+                TableWriter(out_file, fields).writeheader()
+                for i, (out_paths, _, _) in enumerate(results):
+                    offsets[i].append(out_file.tell())
+                    with open(out_paths[t], 'rb') as shard_file:
+                        shutil.copyfileobj(shard_file, out_file)
+
+        if spatial:
+            spatial_index = SpatialIndex(os.path.join(out_dir, SPATIAL_INDEX_PATH))
+            for (_, spatial_path, _), shard_offsets in zip(results, offsets):
+                spatial_index.merge(spatial_path, [shard_offsets[t] for t in (0, 1, 2, 4)])
+            spatial_index.close()
+
+        if tag_index:
+            tags = TagIndex(os.path.join(out_dir, TAG_INDEX_PATH), mode='w')
+            for _, _, tag_index_path in results:
+                tags.merge(tag_index_path)
+            tags.close()
+
+        if quarantine:
+            with open(os.path.join(out_dir, QUARANTINE_PATH), 'wb') as out_file:
+                for job in jobs:
+                    with open(job[-1], 'rb') as shard_file:
+                        shutil.copyfileobj(shard_file, out_file)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if quarantine:
+        report_quarantine(os.path.join(out_dir, QUARANTINE_PATH))
@@ -0,0 +1,122 @@
+"""
+Functions for fixing street type, zip code and state name issues, identified during the data
+auditing step.
+"""
+
+import xml.etree.cElementTree as ET
+
+from . import metrics
+from .audit import street_type_re, expected
+from .parse import get_element
+
+# mapping provides a dictionary for updating potentially problematic street type names.
+# Dictionary contents were updated iteratively, based on the audit results
+
+mapping = { "St.": "Street",
+            "St": "Street",
+            "Street.":"Street",
+            "Ave": "Avenue",
+            "Rd.": "Road",
+            "Blvd": "Boulevard",
+            "Dr":"Drive",
+            "Hwy":"Highway",
+            "highway":"Highway",
+            "Pkwy": "Parkway"
+            }
+
+"""
+The fixing rules are compiled once into a CleaningRules object. fix_element then rewrites all of
+the addr:* tags of an element in a single walk over its tags, looking up the rule for each tag
+key in a dict. Street names are fixed by looking up their street type (the last word, as found
+by street_type_re) in the mapping, and the results are memoized, since the same street names
+repeat throughout the file. Each fix applied is counted and reported through the pipeline's
+metrics (see metrics.py), which by default prints it as it has always been printed: a zip code
+that is not 5 characters long is reported even when the fix leaves it as it was, and the fixed
+state is shown quoted.
+"""
+
+class CleaningRules(object):
+    """Compiled street / zip / state fixing rules"""
+
+    MEMO_SIZE = 100000  # street names remembered before the memo is reset
+
+    def __init__(self, mapping, expected, state='HI', zip_prefix='96'):
+        expected = set(expected)
+        self.street_fixes = dict((k, v) for k, v in mapping.iteritems() if k not in expected)
+        self.state = state
+        self.zip_prefix = zip_prefix
+        self.street_memo = {}
+
+        # tag key => (fixing function, label reported for each fix, how the fixed value is shown,
+        # order the fixes of an element are reported in); a fixing function returns None if its
+        # fix does not apply to the value
+        self.rules = {"addr:street": (self.fix_street, "Fixed Street:", "{0}", 0),
+                      "addr:postcode": (self.fix_zip, "Fixed Zip:   ", "{0}", 1),
+                      "addr:state": (self.fix_state, "Fixed State: ", "'{0}'", 2)}
+
+    def fix_street(self, name):
+        try:
+            return self.street_memo[name]
+        except KeyError:
+            pass
+
+        better_name = None
+        m = street_type_re.search(name)
+        if m:
+            fix = self.street_fixes.get(m.group())
+            if fix is not None and name[:m.start()] + fix != name:
+                better_name = name[:m.start()] + fix
+
+        if len(self.street_memo) >= self.MEMO_SIZE:
+            self.street_memo.clear()
+        self.street_memo[name] = better_name
+        return better_name
+
+    def fix_zip(self, zip_code):
+        if len(zip_code) != 5:
+            if zip_code[0:2] == self.zip_prefix:
+                return zip_code[0:5]
+            return zip_code[-5:]
+        return None
+
+    def fix_state(self, state):
+        if state != self.state:
+            return self.state
+        return None
+
+    def fix(self, elem):
+        """Fix the addr:* tags of a node or way element in place"""
+
+        if elem.tag == "node" or elem.tag == "way":
+            rules = self.rules
+            fixes = []
+            for tag in elem.iter("tag"):
+                rule = rules.get(tag.attrib['k'])
+                if rule is not None:
+                    value = tag.attrib['v']
+                    better_value = rule[0](value)
+                    if better_value is not None:
+                        fixes.append((rule[3], tag.attrib['k'], rule, value, better_value))
+                        tag.attrib['v'] = better_value
+            if fixes:
+                # the street fixes first, then the zip codes and the states
+                fixes.sort(key=lambda fix: fix[0])
+                for _, key, rule, value, better_value in fixes:
+                    metrics.METRICS.fixed(key, rule[1], value, better_value,
+                                          rule[2].format(better_value))
+
+CLEANING_RULES = CleaningRules(mapping, expected)
+
+def fix_element(elem):
+    CLEANING_RULES.fix(elem)
+
+def fix_osm(osm_file, out_file):
+    """Write a copy of osm_file with all node and way elements fixed"""
+
+    with open(out_file, 'wb') as output:
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        output.write('<osm>\n  ')
+        for element in get_element(osm_file, backend='etree'):
+            fix_element(element)
+            output.write(ET.tostring(element, encoding='utf-8'))
+        output.write('</osm>')
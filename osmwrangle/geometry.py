@@ -0,0 +1,255 @@
+"""
+Disk-backed node coordinate index, and the way geometry (bbox, centroid, length) resolved from it.
+"""
+
+import math
+import mmap
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+
+# ================================================== #
+#        Node Index: Memory-Mapped id -> lat/lon     #
+# ================================================== #
+
+"""
+NodeIndex stores the coordinates of every node in two flat files next to each other: the node
+ids (64 bit) in <path>.ids and their coordinates (lat and lon as 32 bit integers, in units of
+1e-7 degrees, which is the precision OSM stores) in <path>.coords. The nodes are appended while
+they stream past, which requires them to be in increasing id order, as they are in OSM extracts
+and planet files.
+
+For lookups both files are memory mapped, so the operating system pages them in and out as
+needed and the index works on files much larger than RAM. Only every NODE_INDEX_BLOCK-th id is
+kept in memory (the 'fence'): a lookup bisects the fence to find the block of ids that can hold
+the node, and bisects that block. Consecutive lookups mostly hit the same block, which is kept.
+
+With geometry turned on, write_elements adds each node to the index and shape_element adds the
+WAY_GEOMETRY_FIELDS to each way: its bounding box, centroid (the mean of its distinct node
+coordinates) and length in meters (the sum of the great circle distances between consecutive
+nodes). Nodes missing from the extract are left out; a way without any known node gets None.
+The first lookup finishes the index, so the nodes have to come before the ways, as they do in
+OSM extracts and planet files: a node after a way (in a merged extract, say) cannot be added
+any more, and stops the export (or is quarantined, see quarantine.py).
+"""
+
+NODE_INDEX_PATH = "nodes.idx"   # Parameter: index file name (in the export's out_dir)
+NODE_INDEX_BLOCK = 256          # Parameter: ids per block (one id per block is kept in memory)
+NODE_INDEX_BUFFER = 1 << 16     # nodes buffered before they are appended to the files
+
+COORD_SCALE = 10000000.0        # coordinates are stored in units of 1e-7 degrees
+EARTH_RADIUS = 6371008.8        # mean earth radius, in meters
+
+WAY_GEOMETRY_FIELDS = ['min_lat', 'min_lon', 'max_lat', 'max_lon', 'centroid_lat', 'centroid_lon',
+                       'length']
+
+class NodeIndex(object):
+    """Disk-backed id -> (lat, lon) index of the nodes of an OSM file"""
+
+    def __init__(self, path=NODE_INDEX_PATH, mode='r', block=NODE_INDEX_BLOCK, count=None):
+        # mode 'a' carries on with the index of an interrupted export (see checkpoint.py), from
+        # its first count nodes
+        if array('l').itemsize < 8:
+            raise Exception("The node index needs 64 bit integers (array type 'l')")
+
+        self.path = path
+        self.block = block
+        self.fence = array('l')
+        self.count = 0
+        self.last_id = None
+        self.ids_mm = self.coords_mm = None
+        self.block_start = None
+        self.block_ids = None
+
+        if mode == 'w':
+            self.ids_file = open(path + '.ids', 'wb')
+            self.coords_file = open(path + '.coords', 'wb')
+            self.ids = array('l')
+            self.coords = array('i')
+        elif mode == 'a':
+            self.reopen(count)
+        elif mode == 'r':
+            self.ids_file = self.coords_file = None
+            self.open_maps()
+        else:
+            raise Exception("Unknown node index mode '{0}'".format(mode))
+
+    @property
+    def writable(self):
+        return self.ids_file is not None
+
+    def add(self, node_id, lat, lon):
+        """Append a node; nodes must be added in increasing id order, before any lookup"""
+
+        if self.ids_file is None:
+            raise Exception("Node {0} comes after the node index was finished (by the lookups of "
+                            "the first way): the geometry needs all the nodes before the "
+                            "ways".format(node_id))
+        if self.last_id is not None and node_id <= self.last_id:
+            raise Exception("Node {0} follows node {1}: the node index needs the nodes sorted "
+                            "by id".format(node_id, self.last_id))
+        if self.count % self.block == 0:
+            self.fence.append(node_id)
+        self.last_id = node_id
+        self.count += 1
+
+        self.ids.append(node_id)
+        self.coords.append(int(round(lat * COORD_SCALE)))
+        self.coords.append(int(round(lon * COORD_SCALE)))
+        if len(self.ids) >= NODE_INDEX_BUFFER:
+            self.flush()
+
+    def flush(self):
+        self.ids.tofile(self.ids_file)
+        self.coords.tofile(self.coords_file)
+        self.ids_file.flush()
+        self.coords_file.flush()
+        self.ids = array('l')
+        self.coords = array('i')
+
+    def reopen(self, count):
+        """Open the files of an index to append to them, truncated to their first count nodes
+        (the files are append only, so that is the index as it was with count nodes)"""
+
+        ids_size = os.path.getsize(self.path + '.ids') if os.path.exists(self.path + '.ids') else 0
+        if ids_size < count * 8:
+            raise Exception("'{0}.ids' holds fewer than the {1} nodes of the checkpoint".format(
+                self.path, count))
+        self.ids_file = open(self.path + '.ids', 'r+b')
+        self.coords_file = open(self.path + '.coords', 'r+b')
+        self.ids_file.truncate(count * 8)
+        self.coords_file.truncate(count * 8)
+        self.ids = array('l')
+        self.coords = array('i')
+        self.count = count
+
+        for offset in xrange(0, count * 8, self.block * 8):
+            self.ids_file.seek(offset)
+            self.fence.fromstring(self.ids_file.read(8))
+        if count:
+            self.ids_file.seek((count - 1) * 8)
+            self.last_id = array('l', self.ids_file.read(8))[0]
+        self.ids_file.seek(count * 8)
+        self.coords_file.seek(count * 8)
+
+    def open_maps(self):
+        """Memory map the index files for lookups (rebuilding the fence if needed)"""
+
+        size = os.path.getsize(self.path + '.ids')
+        self.count = size // 8
+        if not self.count:
+            return
+        with open(self.path + '.ids', 'rb') as f:
+            self.ids_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.path + '.coords', 'rb') as f:
+            self.coords_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if not self.fence:
+            step = self.block * 8
+            for offset in xrange(0, size, step):
+                self.fence.append(array('l', self.ids_mm[offset:offset + 8])[0])
+
+    def finish(self):
+        """Stop adding nodes, and open the index for lookups"""
+
+        if self.ids_file is not None:
+            self.flush()
+            self.ids_file.close()
+            self.coords_file.close()
+            self.ids_file = self.coords_file = None
+            self.open_maps()
+
+    def get(self, node_id):
+        """(lat, lon) of a node, or None if it is not in the index"""
+
+        if self.ids_file is not None:
+            self.finish()
+        if not self.count:
+            return None
+
+        b = bisect_right(self.fence, node_id) - 1
+        if b < 0:
+            return None
+        start = b * self.block
+        if start != self.block_start:
+            self.block_ids = array('l', self.ids_mm[start * 8:(start + self.block) * 8])
+            self.block_start = start
+        i = bisect_left(self.block_ids, node_id)
+        if i == len(self.block_ids) or self.block_ids[i] != node_id:
+            return None
+        i = (start + i) * 8
+        lat, lon = array('i', self.coords_mm[i:i + 8])
+        return lat / COORD_SCALE, lon / COORD_SCALE
+
+    def close(self):
+        self.finish()
+        for mm in (self.ids_mm, self.coords_mm):
+            if mm is not None:
+                mm.close()
+        self.ids_mm = self.coords_mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def build_node_index(osm_file, path=NODE_INDEX_PATH, skip_invalid=False):
+    """Build the node index of osm_file at path, in a single pass over its nodes (with
+    skip_invalid, leaving out the nodes without a numeric id and coordinates, which a quarantined
+    export quarantines)"""
+
+    from .parse import get_element
+
+    with NodeIndex(path, mode='w') as index:
+        for element in get_element(osm_file, tags=('node',)):
+            attrib = element.attrib
+            try:
+                node = int(attrib['id']), float(attrib['lat']), float(attrib['lon'])
+            except (KeyError, ValueError):
+                if skip_invalid:
+                    continue
+                raise
+            index.add(*node)
+    return path
+
+def distance(lat1, lon1, lat2, lon2):
+    """Great circle distance between two points, in meters (haversine formula)"""
+
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+def way_geometry(index, refs):
+    """The WAY_GEOMETRY_FIELDS of a way with the node refs, looked up in a NodeIndex"""
+
+    points = []
+    for ref in refs:
+        point = index.get(int(ref))
+        if point is not None:
+            points.append(point)
+    if not points:
+        return dict.fromkeys(WAY_GEOMETRY_FIELDS)
+
+    length = 0.0
+    for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+        length += distance(lat1, lon1, lat2, lon2)
+
+    # a closed way lists its first node again at the end, and a way can pass through the same
+    # node more than once, which would skew the centroid: it is the mean of the distinct points
+    seen = set()
+    distinct = []
+    for point in points:
+        if point not in seen:
+            seen.add(point)
+            distinct.append(point)
+    lats = [lat for lat, _ in distinct]
+    lons = [lon for _, lon in distinct]
+
+    return {'min_lat': round(min(lats), 7), 'min_lon': round(min(lons), 7),
+            'max_lat': round(max(lats), 7), 'max_lon': round(max(lons), 7),
+            'centroid_lat': round(sum(lats) / len(lats), 7),
+            'centroid_lon': round(sum(lons) / len(lons), 7),
+            'length': round(length, 2)}
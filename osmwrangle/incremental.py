@@ -0,0 +1,167 @@
+"""
+Incremental update of a SQLite database built by process_map_sqlite.
+
+Instead of re-exporting a whole extract, only the nodes, ways and relations that were created,
+modified or deleted since the last run are fixed, shaped, (validated) and applied to the
+database. (Databases loaded before relations were exported have no relation tables; their
+relation changes are skipped.)
+The changes are found either
+
+  - in an osmChange (.osc) diff, with apply_osc, or
+  - by comparing the id and version of every element in a new extract with the ones
+    already in the database, with apply_extract. The new extract is still parsed, but only
+    the elements whose version changed go through fix_element and shape_element.
+
+Changes are applied in batches: the old rows of every changed element in the batch are
+deleted, then the new rows are inserted, in one transaction per batch. Within a batch only
+the last change of an element is kept.
+"""
+
+import sqlite3
+import xml.etree.cElementTree as ET
+
+from .compression import open_osm
+from .database import SQL_TABLES
+from .parse import get_element
+from .shape import shape_element
+from .validate import validate_element, get_validator
+
+CHANGE_BATCH_SIZE = 10000  # changed elements per transaction
+
+# element type => [(table, shaped element key, fields)]
+CHANGE_TABLES = {'node': [t for t in SQL_TABLES if t[1] in ('node', 'node_tags')],
+                 'way': [t for t in SQL_TABLES if t[1] in ('way', 'way_nodes', 'way_tags')],
+                 'relation': [t for t in SQL_TABLES
+                              if t[1] in ('relation', 'relation_members', 'relation_tags')]}
+
+CHANGE_ACTIONS = ('create', 'modify', 'delete')
+
+def get_change(osc_file):
+    """Yield (action, element) for each node, way and relation of an osmChange file (which may be
+    bz2 or gzip compressed, as the minutely diffs are)"""
+
+    stream = open_osm(osc_file) if isinstance(osc_file, basestring) else osc_file
+    try:
+        context = iter(ET.iterparse(stream, events=('start', 'end')))
+        _, root = next(context)
+        block = None
+        for event, elem in context:
+            if event == 'start':
+                if elem.tag in CHANGE_ACTIONS:
+                    block = elem
+            elif elem.tag in CHANGE_ACTIONS:
+                block = None
+                root.clear()
+            elif block is not None and elem.tag in ('node', 'way', 'relation'):
+                yield block.tag, elem
+                # the parser keeps appending the following elements to the (cleared) block
+                block.clear()
+    finally:
+        if stream is not osc_file:
+            stream.close()
+
+def change_tables(conn):
+    """CHANGE_TABLES, for the element types whose tables are all in the database"""
+
+    existing = set(name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"))
+    return dict((element_type, tables) for element_type, tables in CHANGE_TABLES.iteritems()
+                if all(table in existing for table, _, _ in tables))
+
+class ChangeWriter(object):
+    """Apply shaped elements and deletions to the database in batches"""
+
+    def __init__(self, conn, validate=False, use_cerberus=False, batch_size=CHANGE_BATCH_SIZE):
+        self.conn = conn
+        self.tables = change_tables(conn)
+        self.validator = get_validator(use_cerberus) if validate else None
+        self.batch_size = batch_size
+        self.batch = {}
+        self.counts = {'create': 0, 'modify': 0, 'delete': 0}
+
+    def change(self, action, element):
+        """Record a create / modify / delete action for a node, way or relation element"""
+
+        if element.tag not in self.tables:
+            return
+        if action == 'delete':
+            shaped = None
+        else:
+            shaped = shape_element(element)
+            if self.validator is not None:
+                validate_element(shaped, self.validator)
+
+        self.batch[(element.tag, int(element.attrib['id']))] = shaped
+        self.counts[action] += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def delete(self, element_type, element_id):
+        self.batch[(element_type, element_id)] = None
+        self.counts['delete'] += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        with self.conn:
+            for element_type, tables in self.tables.iteritems():
+                ids = [(element_id,) for (t, element_id) in self.batch if t == element_type]
+                if not ids:
+                    continue
+                for table, _, _ in tables:
+                    self.conn.executemany('DELETE FROM {0} WHERE id = ?'.format(table), ids)
+
+                shaped = [el for (t, _), el in self.batch.iteritems() if t == element_type and el]
+                for table, key, fields in tables:
+                    if key == element_type:
+                        rows = [tuple([el[key][f] for f in fields]) for el in shaped]
+                    else:
+                        rows = [tuple([row[f] for f in fields]) for el in shaped for row in el[key]]
+                    # the columns are named, since the ways table may also have the geometry
+                    # columns (see geometry.py), which are left NULL for the changed ways
+                    sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                        table, ', '.join(fields), ', '.join('?' * len(fields)))
+                    self.conn.executemany(sql, rows)
+        self.batch = {}
+
+def apply_osc(osc_file, db_path, validate=False, use_cerberus=False):
+    """Apply an osmChange file to the database; return the number of each type of change"""
+
+    conn = sqlite3.connect(db_path)
+    try:
+        writer = ChangeWriter(conn, validate, use_cerberus)
+        for action, element in get_change(osc_file):
+            writer.change(action, element)
+        writer.flush()
+    finally:
+        conn.close()
+    return writer.counts
+
+def apply_extract(osm_file, db_path, validate=False, use_cerberus=False):
+    """Apply the differences between a new extract and the database; return the change counts"""
+
+    conn = sqlite3.connect(db_path)
+    try:
+        writer = ChangeWriter(conn, validate, use_cerberus)
+        versions = dict((element_type, dict(conn.execute(
+                            'SELECT id, version FROM {0}'.format(tables[0][0]))))
+                        for element_type, tables in writer.tables.iteritems())
+
+        for element in get_element(osm_file, tags=tuple(versions)):
+            old_version = versions[element.tag].pop(int(element.attrib['id']), None)
+            if old_version is None:
+                writer.change('create', element)
+            elif old_version != element.attrib['version']:
+                writer.change('modify', element)
+
+        # whatever was not seen in the new extract has been deleted
+        for element_type, remaining in versions.iteritems():
+            for element_id in remaining:
+                writer.delete(element_type, element_id)
+        writer.flush()
+    finally:
+        conn.close()
+    return writer.counts
@@ -0,0 +1,211 @@
+"""
+Counters, stage timers and progress reporting for the export pipeline.
+"""
+
+import json
+import sys
+from collections import defaultdict
+from timeit import default_timer as timer
+
+# ================================================== #
+#        Instrumentation: Counters, Timers, ETA      #
+# ================================================== #
+
+"""
+All of the pipeline's reporting goes through one Metrics object (METRICS, replaced with
+set_metrics). Each fix applied by fix_element and each tag skipped by shape_element is counted
+and sent to the metrics sink as an event, instead of being printed (and so is each element
+quarantined, see quarantine.py). The default StdoutSink prints these events exactly as the
+pipeline always has; JSONLinesSink writes them (and everything else) as one JSON record per line,
+and NullSink drops all records.
+
+Stage timers are only kept when the Metrics object has timing turned on. write_elements then
+times the parse / fix / shape / validate / write stages and the total time per element type, and
+emits a progress record (with an ETA based on the bytes of the input consumed since the progress
+clock was started) every PROGRESS_SECONDS. With timing off the same loop reads a no-op clock and
+skips the timers, and the only cost left is counting the fixes. finish() emits a summary record
+of all counters and timers, with the elapsed time of the whole run.
+"""
+
+PROGRESS_SECONDS = 10  # Parameter: seconds between progress records
+PROGRESS_EVERY = 1000  # Parameter: elements between progress checks
+
+STAGES = ['parse', 'fix', 'shape', 'validate', 'write']
+ELEMENT_TYPES = ['node', 'way', 'relation']
+
+class StdoutSink(object):
+    """Print the fix and skip events as before (unless fixes is False) and the quarantine
+    report; progress (and resume) lines go to stderr"""
+
+    def __init__(self, fixes=True):
+        self.fixes = fixes
+
+    def emit(self, record):
+        event = record['event']
+        if event == 'fix':
+            if self.fixes:
+                print record['label'], record['value'], "=>", record['shown']
+        elif event == 'skip' and self.fixes:
+            # only the skipped tags of ways have ever been printed
+            if record['element'] == 'way':
+                print "Problem character found - skipping element"
+        elif event == 'progress':
+            sys.stderr.write("{percent:5.1f}%  {mb_done:.1f} of {mb_total:.1f} MB  "
+                             "{mb_per_sec:.2f} MB/sec  ETA {eta:.0f}s\n".format(**record))
+        elif event == 'resume':
+            sys.stderr.write("Resuming the export from its checkpoint, after {elements} "
+                             "elements\n".format(**record))
+        elif event == 'quarantined':
+            print "Quarantined {total} elements, written to {path}: ".format(**record) + ', '.join(
+                '{0} {1}'.format(error_type, n) for error_type, n in sorted(record['counts'].items()))
+        elif event == 'summary':
+            print_summary(record)
+
+    def close(self):
+        pass
+
+class JSONLinesSink(object):
+    """Write every record as a line of JSON to path"""
+
+    def __init__(self, path):
+        # append mode, and a flush per record, so the forked workers of process_map_parallel
+        # can share the file
+        self.file = open(path, 'a')
+
+    def emit(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class NullSink(object):
+    """Drop all records"""
+
+    def emit(self, record):
+        pass
+
+    def close(self):
+        pass
+
+class Metrics(object):
+    """Counters, stage timers and events of a pipeline run, sent to a sink"""
+
+    def __init__(self, sink=None, timing=False, progress_seconds=PROGRESS_SECONDS):
+        self.sink = sink or StdoutSink()
+        self.timing = timing
+        self.progress_seconds = progress_seconds
+        self.reset()
+
+    def reset(self):
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.started = self.progress_started = timer()
+        self.next_progress = self.started + self.progress_seconds
+        self.total_bytes = None
+
+    def emit(self, event, **fields):
+        fields['event'] = event
+        self.sink.emit(fields)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def fixed(self, key, label, value, better_value, shown=None):
+        """Record a fix applied by fix_element (shown: how the fixed value is printed)"""
+        self.counters['fix.' + key] += 1
+        self.emit('fix', key=key, label=label, value=value, fixed=better_value,
+                  shown=better_value if shown is None else shown)
+
+    def skipped_tag(self, element, key):
+        """Record a tag skipped by shape_element for its problem characters"""
+        self.counters['skipped_tags.' + element] += 1
+        self.emit('skip', element=element, key=key)
+
+    def quarantined(self, element, error_type):
+        """Record an element written to the quarantine file (see quarantine.py)"""
+        self.counters['quarantined.' + error_type] += 1
+        self.emit('quarantine', element=element, type=error_type)
+
+    def merge(self, counters, timers):
+        """Add the counters and timers of another Metrics (e.g. from a worker process)"""
+        for name, n in counters.iteritems():
+            self.counters[name] += n
+        for name, seconds in timers.iteritems():
+            self.timers[name] += seconds
+
+    def start(self, total_bytes):
+        """Start the progress clock for an input of total_bytes (the rate and ETA leave out
+        anything done before, such as the node index pass of a parallel export)"""
+        self.total_bytes = total_bytes
+        self.progress_started = timer()
+        self.next_progress = self.progress_started + self.progress_seconds
+
+    def progress(self, bytes_done, force=False):
+        """Emit a progress record if PROGRESS_SECONDS have passed since the last one"""
+
+        now = timer()
+        if not self.total_bytes or (now < self.next_progress and not force):
+            return
+        self.next_progress = now + self.progress_seconds
+        elapsed = now - self.progress_started
+        rate = bytes_done / elapsed if elapsed > 0 else 0.0
+        self.emit('progress',
+                  percent=100.0 * bytes_done / self.total_bytes,
+                  mb_done=bytes_done / 1048576.0,
+                  mb_total=self.total_bytes / 1048576.0,
+                  mb_per_sec=rate / 1048576.0,
+                  eta=(self.total_bytes - bytes_done) / rate if rate else 0.0,
+                  elapsed=elapsed)
+
+    def summary(self):
+        """Counters, timers and per element type throughput, as a dict"""
+
+        throughput = {}
+        for element in ELEMENT_TYPES:
+            seconds = self.timers.get('element.' + element)
+            if seconds:
+                throughput[element] = self.counters['elements.' + element] / seconds
+        return {'elapsed': timer() - self.started,
+                'counters': dict(self.counters),
+                'timers': dict(self.timers),
+                'elements_per_sec': throughput}
+
+    def finish(self):
+        """Emit the summary record and close the sink"""
+        self.emit('summary', **self.summary())
+        self.sink.close()
+
+def print_summary(summary):
+    counters, timers = summary['counters'], summary['timers']
+
+    print "Elapsed: {0:.2f}s".format(summary['elapsed'])
+    for element in ELEMENT_TYPES:
+        if counters.get('elements.' + element):
+            line = "{0:<9}{1:>10} elements".format(element, counters['elements.' + element])
+            # (there is no per element type time when the stages overlap, see pipeline.py)
+            if element in summary['elements_per_sec']:
+                line += " {0:>12.0f} /sec".format(summary['elements_per_sec'][element])
+            print line
+    if timers:
+        print "Stage seconds: " + ', '.join('{0} {1:.2f}'.format(stage, timers[stage])
+                                            for stage in STAGES if stage in timers)
+    fixes = sorted((name[4:], n) for name, n in counters.iteritems() if name.startswith('fix.'))
+    if fixes:
+        print "Fixes: " + ', '.join('{0} {1}'.format(key, n) for key, n in fixes)
+    skipped = sorted((name[13:], n) for name, n in counters.iteritems()
+                     if name.startswith('skipped_tags.'))
+    if skipped:
+        print "Skipped tags: " + ', '.join('{0} {1}'.format(key, n) for key, n in skipped)
+
+METRICS = Metrics()
+
+def get_metrics():
+    return METRICS
+
+def set_metrics(metrics):
+    """Send the pipeline's counters and events to metrics; return the Metrics it replaces"""
+
+    global METRICS
+    previous, METRICS = METRICS, metrics
+    return previous
@@ -0,0 +1,196 @@
+"""
+Streaming access to the top level elements of an OSM XML (or PBF) file.
+"""
+
+import re
+import xml.etree.cElementTree as ET
+
+from .compression import DecompressingReader, compression_of
+
+# ================================================== #
+#         Parser Backends: etree, lxml, expat        #
+# ================================================== #
+
+"""
+get_element can use one of three parser backends, chosen with PARSER_BACKEND (or
+set_parser_backend, or the backend argument):
+
+- 'etree': the original cElementTree iterparse loop provided by Udacity.
+- 'lxml': lxml's iterparse, only reporting the 'end' events of the wanted tags, and deleting each
+  yielded element (and any earlier siblings) from the tree once it has been processed.
+- 'expat': a raw expat parser with a single start element handler, which builds lightweight
+  OSMElement records (tag, attrib and children) directly and skips unwanted top level elements.
+
+All of the backends yield objects with the same tag / attrib / get / iter / find interface and
+the same attribute values (str when ASCII, unicode otherwise, as cElementTree returns them), so
+fix_element, shape_element and the exports give identical output with each of them. Only the
+'etree' elements can be written back out with ET.tostring, so sample.py and fix_osm always use
+'etree'. PBF files are decoded by pbf.py, whatever the backend.
+"""
+
+PARSER_BACKEND = 'etree'  # Parameter: 'etree', 'lxml' (requires lxml) or 'expat'
+
+EXPAT_CHUNK_SIZE = 1 << 16  # bytes fed to the expat parser at a time
+
+NON_ASCII = re.compile(r'[\x80-\xff]')
+
+OSM_CHILD_TAGS = frozenset(['tag', 'nd', 'member'])
+
+# The get_element function was provided by Udacity and used unmodified (as iter_etree)
+
+def iter_etree(osm_file, tags=('node', 'way', 'relation')):
+
+    """
+    Yield element if it is the right type of tag
+
+    Reference:
+    http://stackoverflow.com/questions/3095434/inserting-newlines-in-xml-file-generated-via-xml-etree-elementtree-in-python
+    """
+    context = iter(ET.iterparse(osm_file, events=('start', 'end')))
+    _, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag in tags:
+            yield elem
+            root.clear()
+
+def iter_lxml(osm_file, tags=('node', 'way', 'relation')):
+    """Yield the elements with the given tags, parsed with lxml"""
+
+    from lxml import etree
+
+    for _, elem in etree.iterparse(osm_file, events=('end',), tag=tags):
+        yield elem
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+class OSMElement(object):
+    """Lightweight element built by the expat backend"""
+
+    __slots__ = ('tag', 'attrib', 'children')
+
+    def __init__(self, tag, attrib):
+        self.tag = tag
+        self.attrib = attrib
+        self.children = []
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def iter(self, tag=None):
+        if tag is None or self.tag == tag:
+            yield self
+        for child in self.children:
+            if child.children:
+                for elem in child.iter(tag):
+                    yield elem
+            elif tag is None or child.tag == tag:
+                yield child
+
+    def find(self, tag):
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return None
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __len__(self):
+        return len(self.children)
+
+    def __repr__(self):
+        return '<OSMElement {0} {1}>'.format(self.tag, self.attrib)
+
+def ascii_or_unicode(value):
+    """Return a UTF-8 value as str if it is ASCII, or decoded to unicode (as cElementTree does)"""
+
+    if NON_ASCII.search(value):
+        return value.decode('utf-8')
+    return value
+
+def iter_expat(osm_file, tags=('node', 'way', 'relation'), chunk_size=EXPAT_CHUNK_SIZE):
+    """Yield the elements with the given tags as OSMElement records, parsed with expat"""
+
+    from xml.parsers import expat
+
+    parser = expat.ParserCreate()
+    parser.returns_unicode = False
+
+    # OSM files are flat: the top level elements only have (empty) tag / nd / member children.
+    # A top level element is therefore complete as soon as the next one starts, or the file
+    # ends, and only the start events need a handler.
+    tags = frozenset(tags)
+    done = []
+    current = [None]  # the wanted top level element being built
+
+    def start(tag, attrib):
+        if tag in OSM_CHILD_TAGS:
+            elem = current[0]
+            if elem is not None:
+                elem.children.append(OSMElement(tag, attrib))
+        else:
+            if current[0] is not None:
+                done.append(current[0])
+            current[0] = OSMElement(tag, attrib) if tag in tags else None
+
+    def start_non_ascii(tag, attrib):
+        start(tag, dict((k, ascii_or_unicode(v)) for k, v in attrib.iteritems()))
+
+    if hasattr(osm_file, 'read'):
+        stream = osm_file
+    else:
+        stream = open(osm_file, 'rb')
+    try:
+        non_ascii = False
+        while True:
+            chunk = stream.read(chunk_size)
+            # values are only checked for non-ASCII bytes in (or just after) chunks that have any
+            chunk_non_ascii = NON_ASCII.search(chunk) is not None
+            if chunk_non_ascii or non_ascii:
+                parser.StartElementHandler = start_non_ascii
+            else:
+                parser.StartElementHandler = start
+            non_ascii = chunk_non_ascii
+
+            parser.Parse(chunk, not chunk)
+            for elem in done:
+                yield elem
+            del done[:]
+            if not chunk:
+                break
+        if current[0] is not None:
+            yield current[0]
+    finally:
+        if stream is not osm_file:
+            stream.close()
+
+PARSER_BACKENDS = {'etree': iter_etree, 'lxml': iter_lxml, 'expat': iter_expat}
+
+def set_parser_backend(backend):
+    """Make backend the default for get_element"""
+
+    global PARSER_BACKEND
+    if backend not in PARSER_BACKENDS:
+        raise Exception("Unknown parser backend '{0}', expected one of: {1}".format(
+            backend, ', '.join(sorted(PARSER_BACKENDS))))
+    PARSER_BACKEND = backend
+
+def get_element(osm_file, tags=('node', 'way', 'relation'), backend=None):
+    """Yield the top level elements of osm_file (a file object, or the path of an OSM file,
+    which may be bz2 or gzip compressed, or a PBF file) with the given tags"""
+
+    from .pbf import PBFReader, is_pbf, iter_pbf
+
+    if isinstance(osm_file, PBFReader) or is_pbf(osm_file):
+        return iter_pbf(osm_file, tags, etree=backend == 'etree')
+    if isinstance(osm_file, basestring) and compression_of(osm_file):
+        return iter_compressed(osm_file, tags, backend)
+    return PARSER_BACKENDS[backend or PARSER_BACKEND](osm_file, tags)
+
+def iter_compressed(path, tags, backend=None):
+    """Yield the elements of a compressed OSM file, decompressed in the background"""
+
+    with DecompressingReader(path) as stream:
+        for element in PARSER_BACKENDS[backend or PARSER_BACKEND](stream, tags):
+            yield element
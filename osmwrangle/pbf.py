@@ -0,0 +1,535 @@
+"""
+Reader of OSM PBF files: decodes the blocks of a .osm.pbf extract into the same element records as
+the XML parsers.
+"""
+
+import struct
+import time
+import zlib
+from collections import deque
+from itertools import izip
+
+from .parse import OSMElement, ascii_or_unicode
+
+# ================================================== #
+#          PBF Input: Blocks to OSMElements          #
+# ================================================== #
+
+"""
+get_element reads .osm.pbf files (recognized by their first bytes, whatever their extension)
+with a PBFReader, so the audit, the exports and the updates run on PBF extracts directly, with
+no XML step. A PBF file is a sequence of blobs: an OSMHeader, then OSMData blobs of (usually
+zlib compressed) PrimitiveBlocks of up to 8000 nodes, ways or relations each, with their own
+string table. The protobuf messages are decoded here directly, so no protobuf package is
+needed.
+
+The elements are yielded as the OSMElement records of the expat backend, with the attribute
+values the XML of the same data has (ids, versions, coordinates with 7 decimals, ISO
+timestamps, and tag values as str when ASCII, unicode otherwise), so fix_element,
+shape_element and the exports give the same output for the PBF and the XML of an extract.
+When get_element is asked for the 'etree' backend explicitly (as sample.py and fix.py do, to
+write the elements back out with ET.tostring), they are converted to cElementTree elements.
+
+The blocks are independent of each other, so with PBF_WORKERS > 1 (or set_pbf_workers) they are
+decompressed and decoded in a pool of processes, up to PBF_BLOCKS_AHEAD blocks per process
+ahead of the consumer, while the reading process only reads the blobs and rebuilds the records
+(which are sent back as plain tuples, as those pickle faster). Sending the records back costs
+about as much as decoding them, so this only pays off with several idle CPUs. For exports,
+process_map_parallel scales better: it shards PBF files at blob boundaries (see pbf_shards), and
+each worker decodes the blocks of its own shard.
+"""
+
+PBF_WORKERS = 1       # Parameter: processes decoding the blocks (1: decode in the reading process)
+PBF_BLOCKS_AHEAD = 2  # Parameter: blocks being decoded per process, ahead of the consumer
+
+PBF_MAGIC = '\x0a\x09OSMHeader'  # the start of the first BlobHeader, after its 4 byte size
+PBF_FEATURES = frozenset(['OsmSchema-V0.6', 'DenseNodes'])  # required features that are read
+BLOB_HEADER_SIZE = struct.Struct('>I')
+BLOB_CODECS = {4: 'lzma', 5: 'bzip2', 6: 'lz4', 7: 'zstd'}
+MEMBER_TYPES = ('node', 'way', 'relation')
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def set_pbf_workers(workers):
+    """Make workers the number of processes decoding PBF blocks"""
+
+    global PBF_WORKERS
+    if workers < 1:
+        raise Exception("PBF workers must be at least 1, not {0}".format(workers))
+    PBF_WORKERS = workers
+
+def is_pbf(osm_file):
+    """True if osm_file (a path, or a file object, which is left where it was) is a PBF file"""
+
+    if isinstance(osm_file, basestring):
+        with open(osm_file, 'rb') as f:
+            start = f.read(len(PBF_MAGIC) + 4)
+    elif isinstance(osm_file, file):
+        position = osm_file.tell()
+        start = osm_file.read(len(PBF_MAGIC) + 4)
+        osm_file.seek(position)
+    else:
+        return False
+    return start[4:] == PBF_MAGIC
+
+# protobuf wire format
+
+def varint(data, pos):
+    """(value, next position) of the varint at pos"""
+
+    result = shift = 0
+    while True:
+        b = ord(data[pos])
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def message_fields(data):
+    """Yield the (field number, value) pairs of a protobuf message: ints for varints, strs for
+    length-delimited (and fixed size) fields"""
+
+    pos, end = 0, len(data)
+    while pos < end:
+        key, pos = varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = varint(data, pos)
+        elif wire_type == 2:
+            size, pos = varint(data, pos)
+            value = data[pos:pos + size]
+            pos += size
+        elif wire_type == 1:
+            value = data[pos:pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = data[pos:pos + 4]
+            pos += 4
+        else:
+            raise Exception("Unsupported protobuf wire type {0}".format(wire_type))
+        yield key >> 3, value
+
+def packed(data):
+    """The varints of a packed repeated field"""
+
+    values = []
+    append = values.append
+    result = shift = 0
+    for b in bytearray(data):
+        if b < 0x80:
+            append(result | (b << shift))
+            result = shift = 0
+        else:
+            result |= (b & 0x7f) << shift
+            shift += 7
+    return values
+
+def signed(n):
+    """The int32 / int64 value of a varint (negative values are sent as 64 bit two's complement)"""
+    return n - (1 << 64) if n >= 1 << 63 else n
+
+def zigzag(n):
+    """The sint32 / sint64 value of a varint"""
+    return (n >> 1) ^ -(n & 1)
+
+def packed_deltas(data):
+    """The values of a packed DELTA field: the running sums of its zigzag encoded varints"""
+
+    values = []
+    append = values.append
+    result = shift = total = 0
+    for b in bytearray(data):
+        if b < 0x80:
+            result |= b << shift
+            total += (result >> 1) ^ -(result & 1)
+            append(total)
+            result = shift = 0
+        else:
+            result |= (b & 0x7f) << shift
+            shift += 7
+    return values
+
+# blobs and blocks
+
+def blob_data(blob):
+    """The uncompressed contents of a Blob message"""
+
+    for number, value in message_fields(blob):
+        if number == 1:
+            return value
+        if number == 3:
+            return zlib.decompress(value)
+        if number in BLOB_CODECS:
+            raise Exception("Unsupported PBF blob compression: {0}".format(BLOB_CODECS[number]))
+    raise Exception("Empty PBF blob")
+
+def check_header(data):
+    """Raise if the OSMHeader block requires features that are not read"""
+
+    required = [value for number, value in message_fields(data) if number == 4]
+    missing = [feature for feature in required if feature not in PBF_FEATURES]
+    if missing:
+        raise Exception("The PBF file requires unsupported features: {0}".format(
+            ', '.join(missing)))
+
+class PrimitiveBlock(object):
+    """The string table and coordinate / date granularity of a PrimitiveBlock, and the decoding
+    of its groups into OSMElement records"""
+
+    def __init__(self, data):
+        self.strings = []
+        self.groups = []
+        self.granularity = 100
+        self.date_granularity = 1000
+        self.lat_offset = self.lon_offset = 0
+        for number, value in message_fields(data):
+            if number == 1:
+                self.strings = [ascii_or_unicode(s) for n, s in message_fields(value) if n == 1]
+            elif number == 2:
+                self.groups.append(value)
+            elif number == 17:
+                self.granularity = value
+            elif number == 18:
+                self.date_granularity = value
+            elif number == 19:
+                self.lat_offset = signed(value)
+            elif number == 20:
+                self.lon_offset = signed(value)
+
+    def elements(self, tags):
+        """The OSMElements of the elements with the given tags"""
+
+        elements = []
+        for group in self.groups:
+            for number, value in message_fields(group):
+                if number == 2 and 'node' in tags:
+                    elements.extend(self.dense_nodes(value))
+                elif number == 1 and 'node' in tags:
+                    elements.append(self.node(value))
+                elif number == 3 and 'way' in tags:
+                    elements.append(self.way(value))
+                elif number == 4 and 'relation' in tags:
+                    elements.append(self.relation(value))
+        return elements
+
+    def coordinate(self, offset, value):
+        """The decimal degrees of a coordinate, with 7 decimals (as in OSM XML) unless it is
+        more precise"""
+
+        nanodegrees = offset + self.granularity * value
+        if nanodegrees % 100:
+            return '%.9f' % (nanodegrees * 1e-9)
+        return '%.7f' % (nanodegrees * 1e-9)
+
+    def timestamp(self, value):
+        return time.strftime(TIMESTAMP_FORMAT, time.gmtime(value * self.date_granularity // 1000))
+
+    def info(self, data, attrib):
+        """Add the version, timestamp, changeset, uid and user of an Info message to attrib"""
+
+        for number, value in message_fields(data):
+            if number == 1:
+                attrib['version'] = str(value)
+            elif number == 2:
+                attrib['timestamp'] = self.timestamp(signed(value))
+            elif number == 3:
+                attrib['changeset'] = str(signed(value))
+            elif number == 4:
+                attrib['uid'] = str(signed(value))
+            elif number == 5:
+                attrib['user'] = self.strings[value]
+
+    def tags(self, keys, values):
+        strings = self.strings
+        return [OSMElement('tag', {'k': strings[k], 'v': strings[v]}) for k, v in zip(keys, values)]
+
+    def node(self, data):
+        attrib = {}
+        keys = values = ()
+        lat = lon = 0
+        for number, value in message_fields(data):
+            if number == 1:
+                attrib['id'] = str(zigzag(value))
+            elif number == 2:
+                keys = packed(value)
+            elif number == 3:
+                values = packed(value)
+            elif number == 4:
+                self.info(value, attrib)
+            elif number == 8:
+                lat = zigzag(value)
+            elif number == 9:
+                lon = zigzag(value)
+        attrib['lat'] = self.coordinate(self.lat_offset, lat)
+        attrib['lon'] = self.coordinate(self.lon_offset, lon)
+        node = OSMElement('node', attrib)
+        node.children = self.tags(keys, values)
+        return node
+
+    def dense_nodes(self, data):
+        ids = lats = lons = keys_vals = ()
+        info = {}
+        for number, value in message_fields(data):
+            if number == 1:
+                ids = packed_deltas(value)
+            elif number == 5:
+                info = dict(message_fields(value))
+            elif number == 8:
+                lats = packed_deltas(value)
+            elif number == 9:
+                lons = packed_deltas(value)
+            elif number == 10:
+                keys_vals = packed(value)
+
+        # the attributes are decoded a column at a time, and zipped into the attribs
+        strings = self.strings
+        coordinate = self.coordinate
+        lat_offset, lon_offset = self.lat_offset, self.lon_offset
+        names = ['id', 'lat', 'lon']
+        columns = [[str(node_id) for node_id in ids],
+                   [coordinate(lat_offset, lat) for lat in lats],
+                   [coordinate(lon_offset, lon) for lon in lons]]
+        if 1 in info:
+            names.append('version')
+            columns.append([str(version) for version in packed(info[1])])
+        if 2 in info:
+            names.append('timestamp')
+            columns.append([self.timestamp(t) for t in packed_deltas(info[2])])
+        if 3 in info:
+            names.append('changeset')
+            columns.append([str(changeset) for changeset in packed_deltas(info[3])])
+        if 4 in info:
+            names.append('uid')
+            columns.append([str(uid) for uid in packed_deltas(info[4])])
+        if 5 in info:
+            names.append('user')
+            columns.append([strings[s] for s in packed_deltas(info[5])])
+
+        nodes = []
+        kv = 0
+        for values in izip(*columns):
+            node = OSMElement('node', dict(izip(names, values)))
+            if keys_vals:
+                # the keys and values of each node, followed by a 0
+                children = node.children
+                while keys_vals[kv]:
+                    children.append(OSMElement('tag', {'k': strings[keys_vals[kv]],
+                                                       'v': strings[keys_vals[kv + 1]]}))
+                    kv += 2
+                kv += 1
+            nodes.append(node)
+        return nodes
+
+    def way(self, data):
+        attrib = {}
+        keys = values = refs = ()
+        for number, value in message_fields(data):
+            if number == 1:
+                attrib['id'] = str(signed(value))
+            elif number == 2:
+                keys = packed(value)
+            elif number == 3:
+                values = packed(value)
+            elif number == 4:
+                self.info(value, attrib)
+            elif number == 8:
+                refs = packed_deltas(value)
+        way = OSMElement('way', attrib)
+        way.children = [OSMElement('nd', {'ref': str(ref)}) for ref in refs]
+        way.children.extend(self.tags(keys, values))
+        return way
+
+    def relation(self, data):
+        attrib = {}
+        keys = values = roles = ids = types = ()
+        for number, value in message_fields(data):
+            if number == 1:
+                attrib['id'] = str(signed(value))
+            elif number == 2:
+                keys = packed(value)
+            elif number == 3:
+                values = packed(value)
+            elif number == 4:
+                self.info(value, attrib)
+            elif number == 8:
+                roles = packed(value)
+            elif number == 9:
+                ids = packed_deltas(value)
+            elif number == 10:
+                types = packed(value)
+        strings = self.strings
+        relation = OSMElement('relation', attrib)
+        relation.children = [OSMElement('member', {'type': MEMBER_TYPES[member_type],
+                                                   'ref': str(ref), 'role': strings[role]})
+                             for member_type, ref, role in zip(types, ids, roles)]
+        relation.children.extend(self.tags(keys, values))
+        return relation
+
+def decode_blob(data, tags):
+    """The OSMElements of the elements with the given tags in an OSMData blob"""
+
+    return PrimitiveBlock(blob_data(data)).elements(tags)
+
+def decode_blob_packed(data, tags):
+    """Pool worker: decode_blob, with the elements as (tag, attrib, children) tuples"""
+
+    return [(element.tag, element.attrib,
+             [(child.tag, child.attrib) for child in element.children])
+            for element in decode_blob(data, tags)]
+
+def record(element):
+    """The OSMElement of a (tag, attrib, children) tuple"""
+
+    tag, attrib, children = element
+    elem = OSMElement(tag, attrib)
+    elem.children = [OSMElement(child_tag, child_attrib) for child_tag, child_attrib in children]
+    return elem
+
+def to_etree(element):
+    """The cElementTree element of an OSMElement"""
+
+    import xml.etree.cElementTree as ET
+
+    elem = ET.Element(element.tag, element.attrib)
+    for child in element.children:
+        ET.SubElement(elem, child.tag, child.attrib)
+    return elem
+
+class PBFReader(object):
+    """Reader of the elements of a PBF file (a path or a file object), or of the blobs in its
+    byte range [start, end)"""
+
+    def __init__(self, osm_file, start=0, end=None, workers=None):
+        if isinstance(osm_file, basestring):
+            self.file = open(osm_file, 'rb')
+            self.owned = True
+        else:
+            self.file = osm_file
+            self.owned = False
+        if start:
+            self.file.seek(start)
+        self.remaining = end - start if end is not None else None
+        self.workers = workers or PBF_WORKERS
+        self.blob_offset = self.block_offset = start
+
+    def blobs(self):
+        """Yield the (type, data) of each blob"""
+
+        f = self.file
+        while self.remaining is None or self.remaining > 0:
+            self.blob_offset = f.tell()
+            head = f.read(BLOB_HEADER_SIZE.size)
+            if not head:
+                break
+            if len(head) < BLOB_HEADER_SIZE.size:
+                raise Exception("Truncated PBF file")
+            (header_size,) = BLOB_HEADER_SIZE.unpack(head)
+            blob_type, data_size = None, 0
+            for number, value in message_fields(f.read(header_size)):
+                if number == 1:
+                    blob_type = value
+                elif number == 3:
+                    data_size = value
+            data = f.read(data_size)
+            if len(data) < data_size:
+                raise Exception("Truncated PBF file")
+            if self.remaining is not None:
+                self.remaining -= BLOB_HEADER_SIZE.size + header_size + data_size
+            yield blob_type, data
+
+    def data_blobs(self):
+        """Yield the data of each OSMData blob, checking the OSMHeader on the way"""
+
+        for blob_type, data in self.blobs():
+            if blob_type == 'OSMData':
+                yield data
+            elif blob_type == 'OSMHeader':
+                check_header(blob_data(data))
+            # blobs of other types are skipped, as the format asks
+
+    def blocks(self, tags):
+        """Yield the list of OSMElements of each block (block_offset is then the offset of its
+        blob, where a reader can start again from)"""
+
+        tags = frozenset(tags)
+        workers = self.workers
+        if workers > 1:
+            import multiprocessing
+            # processes of a pool (or of the pipelined export) cannot start pools of their own
+            if multiprocessing.current_process().daemon:
+                workers = 1
+        if workers == 1:
+            for data in self.data_blobs():
+                self.block_offset = self.blob_offset
+                yield decode_blob(data, tags)
+            return
+
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = deque()
+            for data in self.data_blobs():
+                pending.append((self.blob_offset,
+                                pool.apply_async(decode_blob_packed, (data, tags))))
+                if len(pending) >= workers * PBF_BLOCKS_AHEAD:
+                    self.block_offset, result = pending.popleft()
+                    yield [record(element) for element in result.get()]
+            while pending:
+                self.block_offset, result = pending.popleft()
+                yield [record(element) for element in result.get()]
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def elements(self, tags=('node', 'way', 'relation')):
+        """Yield the elements with the given tags as OSMElement records"""
+
+        for block in self.blocks(tags):
+            for element in block:
+                yield element
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+def iter_pbf(osm_file, tags=('node', 'way', 'relation'), etree=False):
+    """Yield the elements of a PBF file (a path, a file object or a PBFReader) with the given
+    tags, as OSMElement records, or as cElementTree elements if etree is True"""
+
+    reader = osm_file if isinstance(osm_file, PBFReader) else PBFReader(osm_file)
+    try:
+        for element in reader.elements(tags):
+            yield to_etree(element) if etree else element
+    finally:
+        if reader is not osm_file:
+            reader.close()
+
+def pbf_shards(file_in, n_shards):
+    """Split a PBF file into at most n_shards (start, end) byte ranges of whole blobs"""
+
+    offsets = []
+    with open(file_in, 'rb') as f:
+        while True:
+            offset = f.tell()
+            head = f.read(BLOB_HEADER_SIZE.size)
+            if not head:
+                break
+            (header_size,) = BLOB_HEADER_SIZE.unpack(head)
+            data_size = 0
+            for number, value in message_fields(f.read(header_size)):
+                if number == 3:
+                    data_size = value
+            offsets.append(offset)
+            f.seek(data_size, 1)
+        size = f.tell()
+
+    starts = []
+    for i in range(n_shards):
+        target = size * i // n_shards
+        start = next((offset for offset in offsets if offset >= target), None)
+        if start is not None and (not starts or start > starts[-1]):
+            starts.append(start)
+    return zip(starts, starts[1:] + [size])
@@ -0,0 +1,281 @@
+"""
+Pipelined export: parsing, shaping and writing run as separate stages, connected by bounded queues.
+"""
+
+import os
+import Queue
+import threading
+import traceback
+from cStringIO import StringIO
+from timeit import default_timer as timer
+
+from . import metrics
+from .compression import open_osm
+from .export import TableWriter, export_tables, open_csv, write_shaped, EXPORT_ELEMENTS
+from .geometry import NodeIndex, NODE_INDEX_PATH
+from .parse import OSMElement, get_element
+from .quarantine import Quarantine, QUARANTINE_PATH, report_quarantine
+from .tagindex import TagIndex, TAG_INDEX_PATH
+from .validate import get_validator
+
+# ================================================== #
+#      Pipelined Export: parse | shape | write       #
+# ================================================== #
+
+"""
+process_map_pipelined writes the same .csv files as process_map, with the export split into
+three stages:
+
+- parse: reads and parses the OSM file, and puts the elements on the first queue in batches of
+  PIPELINE_BATCH_SIZE (as standalone OSMElement records, since the lxml and etree backends
+  clear their elements once they are done with them).
+- shape: fixes, shapes and validates the elements of each batch (quarantining those that fail,
+  with quarantine=True) and formats their rows as .csv text, with the same writers as
+  process_map, and puts the text of each table on the second queue.
+- write: appends the text to the .csv files.
+
+Each queue holds at most PIPELINE_QUEUE_SIZE batches, so a stage that gets ahead of the next one
+blocks until it catches up, and memory use stays bounded. With workers='thread' the parse and
+shape stages run in threads: reading and writing files releases the GIL, so the disk I/O
+overlaps the parsing and shaping, but those two still share one CPU. With workers='process' they
+run in processes of their own, and also use separate CPUs, at the cost of pickling the batches
+between them.
+
+If a stage fails, it passes the error (with its traceback) down the pipeline to the write stage,
+which raises it. Whenever the write stage stops, for an error or not, it sets the stop flag; the
+other stages then stop at their next queue operation, and process_map_pipelined returns (or
+raises) once they have all shut down.
+"""
+
+PIPELINE_WORKERS = 'thread'  # Parameter: run the parse and shape stages as 'thread's or 'process'es
+PIPELINE_BATCH_SIZE = 1000   # Parameter: elements per batch
+PIPELINE_QUEUE_SIZE = 8      # Parameter: batches waiting between two stages
+PIPELINE_POLL = 0.1          # seconds between checks of the stop flag while blocked on a queue
+
+def put(queue, message, stop):
+    """Put message on a queue, waiting while it is full; False if the pipeline was stopped"""
+
+    while not stop.is_set():
+        try:
+            queue.put(message, timeout=PIPELINE_POLL)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+def get(queue, stop, stages=None):
+    """Get the next message from a queue, waiting while it is empty; None if the pipeline was
+    stopped (or if none of the stages that feed the queue are left)"""
+
+    while True:
+        try:
+            return queue.get(timeout=PIPELINE_POLL)
+        except Queue.Empty:
+            if stop.is_set():
+                return None
+            if stages is not None and not any(stage.is_alive() for stage in stages):
+                return None
+
+def drain(queue):
+    """Discard the messages left on a queue (so that stopped worker processes can exit)"""
+
+    try:
+        while True:
+            queue.get_nowait()
+    except Queue.Empty:
+        pass
+
+def standalone(element):
+    """An OSMElement copy of a parsed element and its children"""
+
+    if isinstance(element, OSMElement):
+        return element
+    record = OSMElement(element.tag, dict(element.attrib))
+    record.children = [OSMElement(child.tag, dict(child.attrib)) for child in element]
+    return record
+
+def pack(element):
+    """A parsed element as plain tuples, which pickle about twice as fast as OSMElements"""
+
+    return element.tag, dict(element.attrib), [(child.tag, dict(child.attrib)) for child in element]
+
+def unpack(packed):
+    """The OSMElement of a packed element"""
+
+    tag, attrib, children = packed
+    record = OSMElement(tag, attrib)
+    record.children = [OSMElement(child_tag, child_attrib) for child_tag, child_attrib in children]
+    return record
+
+def run_stage(name, stage, out_queue, stop, *args):
+    """Run a stage, passing any error on to the next stage"""
+
+    try:
+        stage(out_queue, stop, *args)
+    except Exception:
+        put(out_queue, ('error', name, traceback.format_exc()), stop)
+
+def parse_stage(out_queue, stop, file_in, timing, packed):
+    """Put batches of parsed elements (and the bytes of the file consumed) on out_queue, packed
+    if they go to another process"""
+
+    copy = pack if packed else standalone
+    osm_file = open_osm(file_in) if isinstance(file_in, basestring) else file_in
+    tell = osm_file.tell if hasattr(osm_file, 'tell') else lambda: None
+    busy = 0.0
+    try:
+        batch = []
+        t0 = timer()
+        for element in get_element(osm_file, tags=EXPORT_ELEMENTS):
+            batch.append(copy(element))
+            if len(batch) >= PIPELINE_BATCH_SIZE:
+                busy += timer() - t0
+                if not put(out_queue, ('batch', batch, tell()), stop):
+                    return
+                batch = []
+                t0 = timer()
+        busy += timer() - t0
+        if batch and not put(out_queue, ('batch', batch, tell()), stop):
+            return
+        put(out_queue, ('done', {}, {'parse': busy} if timing else {}), stop)
+    finally:
+        if osm_file is not file_in:
+            osm_file.close()
+
+def shape_stage(out_queue, stop, in_queue, tables, validate, use_cerberus, index_path,
+                tag_index_path, quarantine_path, process):
+    """Shape, validate and format each batch from in_queue, and put its .csv text on out_queue"""
+
+    m = metrics.METRICS
+    if process:
+        # a worker process reports its own counters when it is done
+        m.reset()
+    validator = get_validator(use_cerberus) if validate is True else None
+    node_index = NodeIndex(index_path, mode='w') if index_path is not None else None
+    tag_index = TagIndex(tag_index_path, mode='w') if tag_index_path is not None else None
+    quarantine = Quarantine(quarantine_path) if quarantine_path is not None else None
+
+    buffers = [StringIO() for _ in tables]
+    writers = [TableWriter(buf, fields) for buf, (_, fields) in zip(buffers, tables)]
+    busy = 0.0
+    try:
+        while True:
+            message = get(in_queue, stop)
+            if message is None:
+                return
+            if message[0] != 'batch':
+                break
+            t0 = timer()
+            _, batch, bytes_done = message
+            if process:
+                batch = [unpack(packed) for packed in batch]
+            write_shaped(batch, writers, validator, node_index, tag_index=tag_index,
+                         quarantine=quarantine)
+            chunks = []
+            for buf in buffers:
+                chunks.append(buf.getvalue())
+                buf.seek(0)
+                buf.truncate()
+            if m.timing:
+                for element in batch:
+                    m.counters['elements.' + element.tag] += 1
+            busy += timer() - t0
+            if not put(out_queue, ('batch', chunks, bytes_done), stop):
+                return
+    finally:
+        if node_index is not None:
+            node_index.close()
+        if quarantine is not None:
+            quarantine.close()
+
+    if message[0] == 'error':
+        put(out_queue, message, stop)
+        return
+    if tag_index is not None:
+        tag_index.close()
+    _, counters, timers = message
+    if m.timing:
+        timers['shape'] = busy
+    if process:
+        counters = dict(m.counters)
+    put(out_queue, ('done', counters, timers), stop)
+
+def process_map_pipelined(file_in, validate, use_cerberus=False, out_dir='.', geometry=False,
+                          tag_index=False, workers=PIPELINE_WORKERS, compression=None,
+                          compression_level=None, quarantine=False):
+    """Export file_in to the same csv(s) as process_map, with the parse, shape and write stages
+    overlapping"""
+
+    if workers == 'process':
+        import multiprocessing
+        Worker, make_queue, stop = (multiprocessing.Process, multiprocessing.Queue,
+                                    multiprocessing.Event())
+    elif workers == 'thread':
+        Worker, make_queue, stop = threading.Thread, Queue.Queue, threading.Event()
+    else:
+        raise Exception("Unknown pipeline workers '{0}', expected 'thread' or 'process'".format(
+            workers))
+
+    m = metrics.METRICS
+    if m.timing and isinstance(file_in, basestring):
+        m.start(os.path.getsize(file_in))
+
+    tables = export_tables(geometry)
+    index_path = os.path.join(out_dir, NODE_INDEX_PATH) if geometry else None
+    tag_index_path = os.path.join(out_dir, TAG_INDEX_PATH) if tag_index else None
+    quarantine_path = os.path.join(out_dir, QUARANTINE_PATH) if quarantine else None
+
+    elements = make_queue(PIPELINE_QUEUE_SIZE)
+    chunks = make_queue(PIPELINE_QUEUE_SIZE)
+    process = workers == 'process'
+    stages = [Worker(target=run_stage, args=('parse', parse_stage, elements, stop, file_in,
+                                             m.timing, process)),
+              Worker(target=run_stage, args=('shape', shape_stage, chunks, stop, elements, tables,
+                                             validate, use_cerberus, index_path, tag_index_path,
+                                             quarantine_path, process))]
+
+    files = [open_csv(os.path.join(out_dir, path), compression, compression_level)
+             for path, _ in tables]
+    try:
+        for f, (_, fields) in zip(files, tables):
+            TableWriter(f, fields).writeheader()
+        for stage in stages:
+            stage.daemon = True
+            stage.start()
+
+        busy = 0.0
+        while True:
+            message = get(chunks, stop, stages)
+            if message is None:
+                raise Exception("The export pipeline stages stopped without finishing")
+            if message[0] == 'error':
+                _, name, stage_traceback = message
+                raise Exception("The {0} stage of the export pipeline failed:\n{1}".format(
+                    name, stage_traceback))
+            if message[0] == 'done':
+                _, counters, timers = message
+                break
+            t0 = timer()
+            _, texts, bytes_done = message
+            for f, text in zip(files, texts):
+                f.write(text)
+            busy += timer() - t0
+            if bytes_done is not None:
+                m.progress(bytes_done)
+
+        for stage in stages:
+            stage.join()
+        m.merge(counters, timers)
+        if m.timing:
+            m.timers['write'] += busy
+    finally:
+        stop.set()
+        for stage in stages:
+            while stage.is_alive():
+                drain(elements)
+                drain(chunks)
+                stage.join(PIPELINE_POLL)
+        for f in files:
+            f.close()
+    if quarantine:
+        report_quarantine(quarantine_path)
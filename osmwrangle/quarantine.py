@@ -0,0 +1,128 @@
+"""
+Quarantine of the elements that fail fixing, shaping or validation, instead of stopping the export.
+"""
+
+import json
+import traceback
+
+from . import metrics
+from .validate import ValidationError
+
+# ================================================== #
+#        Quarantine: Dead-Letter File of Errors      #
+# ================================================== #
+
+"""
+By default the first element that fails validation (or that fix_element or shape_element raise
+on, e.g. a node without coordinates, or that the node, spatial or tag index of the export cannot
+take, e.g. a node whose coordinates are not numbers) stops the export. With quarantine=True the exports write
+such an element to a dead-letter file instead, QUARANTINE_PATH next to the output files, and
+carry on with the next element. Each line of the file is a JSON record of one element:
+
+    {"type": "validate.node", "stage": "validate", "error": "...", "traceback": null,
+     "element": {"tag": "node", "attrib": {...}, "children": [["tag", {...}], ...]}}
+
+"type" is what the errors are counted by: the stage ('fix', 'shape', 'validate' or 'index') and either
+the schema table with the errors (for validation errors) or the exception class (for the others,
+which also get their traceback). The element is recorded as it was when it failed (fix_element
+may have changed its tags). Elements that pass cost nothing more than without the quarantine.
+
+The number of elements quarantined per type is counted in the metrics (as quarantined.<type>)
+and reported at the end of the export. A broken input (or a bug) should still stop the export
+early, so once QUARANTINE_MIN_ELEMENTS elements have been seen, an export with more than
+QUARANTINE_MAX_RATE of its elements quarantined aborts (the parallel export checks the rate of
+each shard). The XML parsers cannot carry on after a syntax error, so those still stop the
+export.
+"""
+
+QUARANTINE_PATH = "quarantine.jsonl"  # Parameter: dead-letter file name (in the export's out_dir)
+QUARANTINE_MAX_RATE = 0.01            # Parameter: fraction of the elements quarantined before aborting
+QUARANTINE_MIN_ELEMENTS = 10000       # Parameter: elements seen before the rate is checked
+
+def set_quarantine_max_rate(max_rate):
+    """Set the fraction of the elements that can be quarantined before an export aborts"""
+
+    global QUARANTINE_MAX_RATE
+    if not 0 <= max_rate <= 1:
+        raise Exception("The quarantine max rate must be between 0 and 1, not {0}".format(max_rate))
+    QUARANTINE_MAX_RATE = max_rate
+
+def error_message(error):
+    """The message of an exception, as unicode"""
+
+    try:
+        return unicode(error)
+    except UnicodeError:
+        return str(error).decode('utf-8', 'replace')
+
+def element_record(element):
+    """An element (parsed or OSMElement) and its children as a JSON serializable dict"""
+
+    return {'tag': element.tag, 'attrib': dict(element.attrib),
+            'children': [[child.tag, dict(child.attrib)] for child in element]}
+
+class Quarantine(object):
+    """Dead-letter file of the elements that failed, with their errors"""
+
+    def __init__(self, path, size=None):
+        # with a size, carry on with the dead-letter file of an interrupted export (see
+        # checkpoint.py), from size bytes in
+        self.path = path
+        if size is None:
+            self.file = open(path, 'wb')
+        else:
+            self.file = open(path, 'r+b')
+            self.file.truncate(size)
+            self.file.seek(size)
+        self.elements = 0
+        self.errors = 0
+
+    def counted(self, elements):
+        """Pass the elements on, counting them"""
+
+        for element in elements:
+            self.elements += 1
+            yield element
+
+    def add(self, element, stage, error):
+        """Quarantine an element that raised error in stage; called in the except block, for the
+        traceback"""
+
+        if isinstance(error, ValidationError):
+            error_type = 'validate.' + str(error.field)
+            trace = None
+        else:
+            error_type = stage + '.' + type(error).__name__
+            trace = traceback.format_exc()
+        record = {'type': error_type, 'stage': stage, 'error': error_message(error),
+                  'traceback': trace, 'element': element_record(element)}
+        self.file.write(json.dumps(record) + '\n')
+        self.errors += 1
+        metrics.METRICS.quarantined(element.tag, error_type)
+
+        if (self.elements >= QUARANTINE_MIN_ELEMENTS and
+                self.errors > QUARANTINE_MAX_RATE * self.elements):
+            self.file.flush()
+            raise Exception("{0} of the first {1} elements failed, more than the maximum of "
+                            "{2:.2%} (see {3}); the last one with:\n{4}".format(
+                                self.errors, self.elements, QUARANTINE_MAX_RATE, self.path,
+                                error_message(error)))
+
+    def flush(self):
+        self.file.flush()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+def report_quarantine(path):
+    """Emit the number of elements quarantined per error type (from the metrics counters, which
+    include those of worker processes), if any were"""
+
+    m = metrics.METRICS
+    counts = dict((name[len('quarantined.'):], n) for name, n in m.counters.iteritems()
+                  if name.startswith('quarantined.'))
+    if counts:
+        m.emit('quarantined', path=path, counts=counts, total=sum(counts.values()))
@@ -0,0 +1,196 @@
+"""
+Streaming OSM sampler.
+
+sample_osm writes a sample of the OSM file in one of three modes:
+
+  "every_k", every k-th top level element (the original sampling method),
+  "reservoir", a uniformly random sample of 'size' top level elements, and
+  "grid", up to 'size' random nodes from each cell of a grid x grid grid laid over the
+          map bounds, plus the ways whose first node was sampled and the relations with a
+          sampled member.
+
+With closed=True the sample is made referentially closed: every node referenced by a sampled
+way is added as well.
+
+Elements are always written in their original file order, streamed to the sample file as they
+are parsed: the sampler only keeps the positions of the sampled elements (and, with closed=True,
+the node refs of the sampled ways), never the elements themselves. every_k writes its sample in
+a single pass over the file; the other modes, and closed samples, first select the elements in
+one pass and then write them in a second one.
+
+Samples are cached in SAMPLE_CACHE_DIR, keyed by the path, size and modification time of the
+source file and the sampling parameters, so a later run with the same file and parameters just
+copies the cached sample.
+
+The sampled elements are written out with ET.tostring, so the sampler always parses with the
+'etree' backend (see parse.py).
+"""
+
+import hashlib
+import os
+import random
+import shutil
+import xml.etree.cElementTree as ET
+from collections import defaultdict
+
+from .parse import get_element
+
+SAMPLE_K = 10           # Parameter: take every k-th top level element ("every_k")
+SAMPLE_MODE = "every_k" # Parameter: "every_k", "reservoir" or "grid"
+SAMPLE_SIZE = 10000     # Parameter: sample size ("reservoir") or nodes per grid cell ("grid")
+SAMPLE_GRID = 10        # Parameter: number of grid rows and columns ("grid")
+SAMPLE_CLOSED = False   # Parameter: add the missing nodes of sampled ways
+SAMPLE_SEED = 0
+SAMPLE_CACHE_DIR = ".sample_cache"
+
+def file_signature(filename):
+    """The absolute path, size and modification time of a file, which its cached samples match"""
+
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime]
+
+def map_bounds(osm_file):
+    """(minlat, minlon, maxlat, maxlon) of the file's <bounds> element (whole world if missing)"""
+
+    tags = ('bounds', 'node', 'way', 'relation')
+    for element in get_element(osm_file, tags=tags, backend='etree'):
+        if element.tag == 'bounds':
+            return tuple(float(element.attrib[a]) for a in ('minlat', 'minlon', 'maxlat', 'maxlon'))
+        break
+    return (-90.0, -180.0, 90.0, 180.0)
+
+def sample_record(i, element):
+    """(index, tag, id, nd refs) record of a sampled top level element"""
+
+    refs = [nd.attrib['ref'] for nd in element.iter('nd')] if element.tag == 'way' else None
+    return (i, element.tag, element.get('id'), refs)
+
+def every_k_refs(osm_file, k):
+    """The node refs of the ways among every k-th top level element"""
+
+    refs = set()
+    for i, element in enumerate(get_element(osm_file, backend='etree')):
+        if i % k == 0 and element.tag == 'way':
+            refs.update(nd.attrib['ref'] for nd in element.iter('nd'))
+    return refs
+
+def sample_reservoir(osm_file, size, rand):
+    """Sample records for a uniformly random sample of size top level elements"""
+
+    reservoir = []
+    for i, element in enumerate(get_element(osm_file, backend='etree')):
+        if i < size:
+            reservoir.append(sample_record(i, element))
+        else:
+            j = rand.randint(0, i)
+            if j < size:
+                reservoir[j] = sample_record(i, element)
+    return reservoir
+
+def sample_grid(osm_file, size, grid, rand):
+    """Sample records for up to size random nodes per grid cell, plus their ways and relations"""
+
+    minlat, minlon, maxlat, maxlon = map_bounds(osm_file)
+    lat_step = (maxlat - minlat) / grid or 1.0
+    lon_step = (maxlon - minlon) / grid or 1.0
+
+    cells = defaultdict(list)
+    seen = defaultdict(int)
+    sampled = []
+    sampled_nodes = None
+    sampled_ways = set()
+
+    for i, element in enumerate(get_element(osm_file, backend='etree')):
+        if element.tag == 'node':
+            row = min(max(int((float(element.attrib['lat']) - minlat) / lat_step), 0), grid - 1)
+            col = min(max(int((float(element.attrib['lon']) - minlon) / lon_step), 0), grid - 1)
+            n = seen[(row, col)]
+            seen[(row, col)] = n + 1
+            if n < size:
+                cells[(row, col)].append(sample_record(i, element))
+            else:
+                j = rand.randint(0, n)
+                if j < size:
+                    cells[(row, col)][j] = sample_record(i, element)
+            continue
+
+        if sampled_nodes is None:
+            # The node reservoirs are final once the first way or relation is reached
+            for cell in cells.itervalues():
+                sampled.extend(cell)
+            cells.clear()
+            sampled_nodes = set(record[2] for record in sampled)
+
+        if element.tag == 'way':
+            nd = element.find('nd')
+            if nd is not None and nd.attrib['ref'] in sampled_nodes:
+                sampled.append(sample_record(i, element))
+                sampled_ways.add(element.attrib['id'])
+        else:
+            for member in element.iter('member'):
+                if ((member.attrib['type'] == 'node' and member.attrib['ref'] in sampled_nodes) or
+                        (member.attrib['type'] == 'way' and member.attrib['ref'] in sampled_ways)):
+                    sampled.append(sample_record(i, element))
+                    break
+
+    for cell in cells.itervalues():
+        sampled.extend(cell)
+    return sampled
+
+def sampled_refs(sampled):
+    """The node refs of the sampled ways"""
+
+    refs = set()
+    for record in sampled:
+        if record[1] == 'way':
+            refs.update(record[3])
+    return refs
+
+def write_sample(osm_file, sample_file, selected, nodes):
+    """Write the top level elements for whose index selected is true, and the nodes with their
+    ids in nodes, to sample_file"""
+
+    with open(sample_file, 'wb') as output:
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        output.write('<osm>\n  ')
+        for i, element in enumerate(get_element(osm_file, backend='etree')):
+            if selected(i) or (nodes and element.tag == 'node' and element.attrib['id'] in nodes):
+                output.write(ET.tostring(element, encoding='utf-8'))
+        output.write('</osm>')
+
+def sample_osm(osm_file, sample_file, mode=SAMPLE_MODE, k=SAMPLE_K, size=SAMPLE_SIZE, grid=SAMPLE_GRID,
+               closed=SAMPLE_CLOSED, seed=SAMPLE_SEED, cache_dir=SAMPLE_CACHE_DIR):
+    """Write a sample of osm_file to sample_file (from the cache if possible)"""
+
+    params = [mode, k if mode == "every_k" else size, grid if mode == "grid" else None, closed,
+              seed if mode != "every_k" else None]
+    key = hashlib.sha1(repr(file_signature(osm_file)) + repr(params)).hexdigest()
+    cached = os.path.join(cache_dir, key + '.osm') if cache_dir else None
+    if cached and os.path.exists(cached):
+        shutil.copyfile(cached, sample_file)
+        return sample_file
+
+    rand = random.Random(seed)
+    if mode == "every_k":
+        selected = lambda i: i % k == 0
+        nodes = every_k_refs(osm_file, k) if closed else None
+    elif mode == "reservoir" or mode == "grid":
+        if mode == "reservoir":
+            sampled = sample_reservoir(osm_file, size, rand)
+        else:
+            sampled = sample_grid(osm_file, size, grid, rand)
+        selected = set(record[0] for record in sampled).__contains__
+        nodes = sampled_refs(sampled) if closed else None
+    else:
+        raise Exception("Unknown sample mode '{0}'".format(mode))
+
+    write_sample(osm_file, sample_file, selected, nodes)
+
+    if cached:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # copied under a temporary name and renamed, so an interrupted copy is never used
+        tmp_path = cached + '.tmp'
+        shutil.copyfile(sample_file, tmp_path)
+        os.rename(tmp_path, cached)
+    return sample_file
@@ -36,7 +36,16 @@ schema = {
             'uid': {'required': True, 'type': 'integer', 'coerce': int},
             'version': {'required': True, 'type': 'string'},
             'changeset': {'required': True, 'type': 'integer', 'coerce': int},
-            'timestamp': {'required': True, 'type': 'string'}
+            'timestamp': {'required': True, 'type': 'string'},
+            # way geometry, only shaped when the export resolves it from a node index
+            # (see geometry.py); None if none of the way's nodes are in the file
+            'min_lat': {'type': 'float', 'nullable': True},
+            'min_lon': {'type': 'float', 'nullable': True},
+            'max_lat': {'type': 'float', 'nullable': True},
+            'max_lon': {'type': 'float', 'nullable': True},
+            'centroid_lat': {'type': 'float', 'nullable': True},
+            'centroid_lon': {'type': 'float', 'nullable': True},
+            'length': {'type': 'float', 'nullable': True}
         }
     },
     'way_nodes': {
@@ -61,5 +70,41 @@ schema = {
                 'type': {'required': True, 'type': 'string'}
             }
         }
+    },
+    'relation': {
+        'type': 'dict',
+        'schema': {
+            'id': {'required': True, 'type': 'integer', 'coerce': int},
+            'user': {'required': True, 'type': 'string'},
+            'uid': {'required': True, 'type': 'integer', 'coerce': int},
+            'version': {'required': True, 'type': 'string'},
+            'changeset': {'required': True, 'type': 'integer', 'coerce': int},
+            'timestamp': {'required': True, 'type': 'string'}
+        }
+    },
+    'relation_members': {
+        'type': 'list',
+        'schema': {
+            'type': 'dict',
+            'schema': {
+                'id': {'required': True, 'type': 'integer', 'coerce': int},
+                'member_type': {'required': True, 'type': 'string'},
+                'member_id': {'required': True, 'type': 'integer', 'coerce': int},
+                'role': {'required': True, 'type': 'string'},
+                'position': {'required': True, 'type': 'integer', 'coerce': int}
+            }
+        }
+    },
+    'relation_tags': {
+        'type': 'list',
+        'schema': {
+            'type': 'dict',
+            'schema': {
+                'id': {'required': True, 'type': 'integer', 'coerce': int},
+                'key': {'required': True, 'type': 'string'},
+                'value': {'required': True, 'type': 'string'},
+                'type': {'required': True, 'type': 'string'}
+            }
+        }
     }
 }
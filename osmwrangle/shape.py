@@ -0,0 +1,287 @@
+"""
+Shaping of node, way and relation XML elements into the Python dicts written to the .csv tables.
+"""
+
+import re
+
+from . import metrics
+from .fix import fix_element
+from .geometry import WAY_GEOMETRY_FIELDS, way_geometry
+from .tagkeys import PROBLEMCHARS, get_classifier
+from .waynodes import RelationMembers, WayNodes
+
+# Steps for fixing problematic data and shaping data for export to .csv:
+# Shaping / exporting code adapted from: Udacity OSM SQL Case Study Slide 11
+
+# Because the Udacity code was so crucial for this project, the original case study commentary
+# is left here in its entirety, for reference purposes:
+
+# UDACITY COMMENTARY STARTS:
+"""
+After auditing is complete the next step is to prepare the data to be inserted into a SQL database.
+To do so you will parse the elements in the OSM XML file, transforming them from document format to
+tabular format, thus making it possible to write to .csv files.  These csv files can then easily be
+imported to a SQL database as tables.
+
+The process for this transformation is as follows:
+- Use iterparse to iteratively step through each top level element in the XML
+- Shape each element into several data structures using a custom function
+- Utilize a schema and validation library to ensure the transformed data is in the correct format
+- Write each data structure to the appropriate .csv files
+
+We've already provided the code needed to load the data, perform iterative parsing and write the
+output to csv files. Your task is to complete the shape_element function that will transform each
+element into the correct format. To make this process easier we've already defined a schema (see
+the schema.py file in the last code tab) for the .csv files and the eventual tables. Using the
+cerberus library we can validate the output against this schema to ensure it is correct.
+
+## Shape Element Function
+The function should take as input an iterparse Element object and return a dictionary.
+
+### If the element top level tag is "node":
+The dictionary returned should have the format {"node": .., "node_tags": ...}
+
+The "node" field should hold a dictionary of the following top level node attributes:
+- id
+- user
+- uid
+- version
+- lat
+- lon
+- timestamp
+- changeset
+All other attributes can be ignored
+
+The "node_tags" field should hold a list of dictionaries, one per secondary tag. Secondary tags are
+child tags of node which have the tag name/type: "tag". Each dictionary should have the following
+fields from the secondary tag attributes:
+- id: the top level node id attribute value
+- key: the full tag "k" attribute value if no colon is present or the characters after the colon if one is.
+- value: the tag "v" attribute value
+- type: either the characters before the colon in the tag "k" value or "regular" if a colon
+        is not present.
+
+Additionally,
+
+- if the tag "k" value contains problematic characters, the tag should be ignored
+- if the tag "k" value contains a ":" the characters before the ":" should be set as the tag type
+  and characters after the ":" should be set as the tag key
+- if there are additional ":" in the "k" value they and they should be ignored and kept as part of
+  the tag key. For example:
+
+  <tag k="addr:street:name" v="Lincoln"/>
+  should be turned into
+  {'id': 12345, 'key': 'street:name', 'value': 'Lincoln', 'type': 'addr'}
+
+- If a node has no secondary tags then the "node_tags" field should just contain an empty list.
+
+The final return value for a "node" element should look something like:
+
+{'node': {'id': 757860928,
+          'user': 'uboot',
+          'uid': 26299,
+       'version': '2',
+          'lat': 41.9747374,
+          'lon': -87.6920102,
+          'timestamp': '2010-07-22T16:16:51Z',
+      'changeset': 5288876},
+ 'node_tags': [{'id': 757860928,
+                'key': 'amenity',
+                'value': 'fast_food',
+                'type': 'regular'},
+               {'id': 757860928,
+                'key': 'cuisine',
+                'value': 'sausage',
+                'type': 'regular'},
+               {'id': 757860928,
+                'key': 'name',
+                'value': "Shelly's Tasty Freeze",
+                'type': 'regular'}]}
+
+### If the element top level tag is "way":
+The dictionary should have the format {"way": ..., "way_tags": ..., "way_nodes": ...}
+
+The "way" field should hold a dictionary of the following top level way attributes:
+- id
+-  user
+- uid
+- version
+- timestamp
+- changeset
+
+All other attributes can be ignored
+
+The "way_tags" field should again hold a list of dictionaries, following the exact same rules as
+for "node_tags".
+
+Additionally, the dictionary should have a field "way_nodes". "way_nodes" should hold a list of
+dictionaries, one for each nd child tag.  Each dictionary should have the fields:
+- id: the top level element (way) id
+- node_id: the ref attribute value of the nd tag
+- position: the index starting at 0 of the nd tag i.e. what order the nd tag appears within
+            the way element
+
+The final return value for a "way" element should look something like:
+
+{'way': {'id': 209809850,
+         'user': 'chicago-buildings',
+         'uid': 674454,
+         'version': '1',
+         'timestamp': '2013-03-13T15:58:04Z',
+         'changeset': 15353317},
+ 'way_nodes': [{'id': 209809850, 'node_id': 2199822281, 'position': 0},
+               {'id': 209809850, 'node_id': 2199822390, 'position': 1},
+               {'id': 209809850, 'node_id': 2199822392, 'position': 2},
+               {'id': 209809850, 'node_id': 2199822369, 'position': 3},
+               {'id': 209809850, 'node_id': 2199822370, 'position': 4},
+               {'id': 209809850, 'node_id': 2199822284, 'position': 5},
+               {'id': 209809850, 'node_id': 2199822281, 'position': 6}],
+ 'way_tags': [{'id': 209809850,
+               'key': 'housenumber',
+               'type': 'addr',
+               'value': '1412'},
+              {'id': 209809850,
+               'key': 'street',
+               'type': 'addr',
+               'value': 'West Lexington St.'},
+              {'id': 209809850,
+               'key': 'street:name',
+               'type': 'addr',
+               'value': 'Lexington'},
+              {'id': '209809850',
+               'key': 'street:prefix',
+               'type': 'addr',
+               'value': 'West'},
+              {'id': 209809850,
+               'key': 'street:type',
+               'type': 'addr',
+               'value': 'Street'},
+              {'id': 209809850,
+               'key': 'building',
+               'type': 'regular',
+               'value': 'yes'},
+              {'id': 209809850,
+               'key': 'levels',
+               'type': 'building',
+               'value': '1'},
+              {'id': 209809850,
+               'key': 'building_id',
+               'type': 'chicago',
+               'value': '366409'}]}
+"""
+# UDACITY COMMENTARY ENDS
+
+"""
+Relations are shaped the same way, into {"relation": ..., "relation_members": ...,
+"relation_tags": ...}. The "relation" field holds the same top level attributes as a way, and
+"relation_tags" follows the exact same rules as "node_tags" and "way_tags" (all three are
+shaped by shape_tags). "relation_members" holds one row per member child tag, with the fields:
+- id: the top level element (relation) id
+- member_type: the type attribute value of the member tag (node, way or relation)
+- member_id: the ref attribute value of the member tag
+- role: the role attribute value of the member tag (often empty)
+- position: the index starting at 0 of the member tag within the relation element
+
+Route and boundary relations can have thousands of members, so the members are kept compact
+in a RelationMembers object (see waynodes.py), like the way nodes.
+"""
+
+LOWER_COLON = re.compile(r'^([a-z]|_)+:([a-z]|_)+')
+
+# Make sure the fields order in the csvs matches the column order in the sql table schema
+NODE_FIELDS = ['id', 'lat', 'lon', 'user', 'uid', 'version', 'changeset', 'timestamp']
+NODE_TAGS_FIELDS = ['id', 'key', 'value', 'type']
+WAY_FIELDS = ['id', 'user', 'uid', 'version', 'changeset', 'timestamp']
+WAY_TAGS_FIELDS = ['id', 'key', 'value', 'type']
+WAY_NODES_FIELDS = ['id', 'node_id', 'position']
+RELATION_FIELDS = ['id', 'user', 'uid', 'version', 'changeset', 'timestamp']
+RELATION_MEMBERS_FIELDS = ['id', 'member_type', 'member_id', 'role', 'position']
+RELATION_TAGS_FIELDS = ['id', 'key', 'value', 'type']
+
+def shape_tags(element, element_id, problem_chars=PROBLEMCHARS, default_tag_type='regular'):
+    """The tag rows of a node, way or relation element, split into type and key"""
+
+    attribs = [tag.attrib for tag in element.iter('tag')]
+    if not attribs:
+        return []
+
+    # Each distinct key is checked for problem characters and split into type and key once
+    # (see tagkeys.py)
+
+    classes = get_classifier(problem_chars, default_tag_type).classify_keys(
+        [attrib['k'] for attrib in attribs])
+
+    tags = []
+    for attrib, (_, tag_type, key, is_problem) in zip(attribs, classes):
+
+        # ignores tags containing problem characters in the k tag attribute:
+
+        if is_problem:
+            metrics.METRICS.skipped_tag(element.tag, attrib['k'])
+            continue
+
+        tags.append({'id': element_id, 'key': key, 'value': attrib['v'], 'type': tag_type})
+    return tags
+
+def shape_element(element, node_attr_fields=NODE_FIELDS, way_attr_fields=WAY_FIELDS,
+                  problem_chars=PROBLEMCHARS, default_tag_type='regular', fix=True,
+                  node_index=None, relation_attr_fields=RELATION_FIELDS):
+    """Clean and shape node, way or relation XML element to Python dict"""
+
+    node_attribs = {}
+    way_attribs = {}
+    tags = []  # Handle secondary tags the same way for node, way and relation elements (shape_tags)
+
+    # Fix data issues, based on auditing results (unless the caller already has, e.g. to time
+    # the fixing on its own)
+
+    if fix:
+        fix_element(element)
+
+    # Shape elements, by splitting the attribute fields per the rules described in the
+    # Udacity commentary
+
+    if element.tag == 'node':
+
+            for node_field in node_attr_fields:
+                node_attribs[node_field] =element.attrib[node_field]
+
+            tags = shape_tags(element, node_attribs['id'], problem_chars, default_tag_type)
+
+            return {'node': node_attribs, 'node_tags': tags}
+
+    elif element.tag == 'way':
+
+        for way_field in way_attr_fields:
+            way_attribs[way_field] =element.attrib[way_field]
+
+        tags = shape_tags(element, way_attribs['id'], problem_chars, default_tag_type)
+
+        # The way nodes are kept compact: WayNodes behaves like the list of
+        # {'id', 'node_id', 'position'} dicts, without building them
+
+        way_nodes = WayNodes(way_attribs['id'], [nd.attrib['ref'] for nd in element.iter('nd')])
+
+        # With a node index (see geometry.py), add the way's bbox, centroid and length
+
+        if node_index is not None:
+            way_attribs.update(way_geometry(node_index, way_nodes.refs))
+
+        return {'way': way_attribs, 'way_nodes': way_nodes, 'way_tags': tags}
+
+    elif element.tag == 'relation':
+
+        relation_attribs = {}
+        for relation_field in relation_attr_fields:
+            relation_attribs[relation_field] = element.attrib[relation_field]
+
+        tags = shape_tags(element, relation_attribs['id'], problem_chars, default_tag_type)
+
+        members = [member.attrib for member in element.iter('member')]
+        relation_members = RelationMembers(relation_attribs['id'],
+                                           [member['type'] for member in members],
+                                           [member['ref'] for member in members],
+                                           [member.get('role', '') for member in members])
+
+        return {'relation': relation_attribs, 'relation_members': relation_members,
+                'relation_tags': tags}
@@ -0,0 +1,303 @@
+"""
+Spatial tile index of the exported .csv files, and bounding box / nearest node queries over it.
+"""
+
+import csv
+import math
+import os
+import sqlite3
+
+from .geometry import distance
+
+# ================================================== #
+#      Spatial Index: Web Mercator Tiles -> Rows     #
+# ================================================== #
+
+"""
+With spatial=True, process_map builds a tile index (SPATIAL_INDEX_PATH, a small SQLite database)
+next to the .csv files while it writes them. Each node is filed under the Web Mercator tile (at
+SPATIAL_NODE_ZOOM) holding its coordinates, and each way under every tile (at SPATIAL_WAY_ZOOM)
+its bounding box overlaps. Ways covering more than SPATIAL_MAX_WAY_TILES tiles are filed once,
+under tile -1, which every query checks. The way bounding boxes come from the geometry columns,
+so spatial implies geometry (see geometry.py).
+
+Besides its coordinates or bounding box, every index entry holds the byte offset of the element's
+row in nodes.csv / ways.csv, and the byte offset and number of its rows in nodes_tags.csv /
+ways_tags.csv. SpatialQuery answers a query by looking up the tiles it covers, filtering the
+entries on their exact coordinates, and then only reading the matching rows from the .csv files.
+
+Tile keys are x * 2**zoom + y, so the tiles of one column of a bounding box form a single range
+of keys.
+"""
+
+SPATIAL_INDEX_PATH = "tiles.db"  # Parameter: index file name (in the export's out_dir)
+SPATIAL_NODE_ZOOM = 16           # Parameter: tile zoom level for nodes (~600m tiles)
+SPATIAL_WAY_ZOOM = 14            # Parameter: tile zoom level for ways (~2.4km tiles)
+SPATIAL_MAX_WAY_TILES = 64       # Parameter: ways covering more tiles are filed under tile -1
+SPATIAL_BATCH_SIZE = 10000       # index entries per executemany
+
+EARTH_CIRCUMFERENCE = 40075016.686  # at the equator, in meters
+MAX_LATITUDE = 85.0511287798        # limit of the Web Mercator projection
+
+SPATIAL_TABLES = ['CREATE TABLE nodes (tile INTEGER, id INTEGER, lat REAL, lon REAL, '
+                  'row INTEGER, tags INTEGER, n_tags INTEGER)',
+                  'CREATE TABLE ways (tile INTEGER, id INTEGER, min_lat REAL, min_lon REAL, '
+                  'max_lat REAL, max_lon REAL, row INTEGER, tags INTEGER, n_tags INTEGER)']
+
+SPATIAL_INDEXES = ['CREATE INDEX nodes_tile ON nodes (tile)',
+                   'CREATE INDEX ways_tile ON ways (tile)']
+
+SPATIAL_PRAGMAS = ['PRAGMA journal_mode = OFF',
+                   'PRAGMA synchronous = OFF']
+
+def tile_xy(lat, lon, zoom):
+    """(x, y) of the Web Mercator tile holding a point"""
+
+    n = 1 << zoom
+    lat = math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_ranges(min_lat, min_lon, max_lat, max_lon, zoom):
+    """[(first key, last key)] of the tiles covering a bounding box, one range per tile column"""
+
+    n = 1 << zoom
+    x0, y0 = tile_xy(max_lat, min_lon, zoom)
+    x1, y1 = tile_xy(min_lat, max_lon, zoom)
+    return [(x * n + y0, x * n + y1) for x in xrange(x0, x1 + 1)]
+
+def tile_size(lat, zoom):
+    """Width (and height) of a tile at latitude lat, in meters"""
+
+    return EARTH_CIRCUMFERENCE * math.cos(math.radians(min(abs(lat), MAX_LATITUDE))) / (1 << zoom)
+
+class SpatialIndex(object):
+    """Builds the tile index of the rows written to files, the open nodes, nodes_tags, ways and
+    ways_tags .csv files (or only of merged indexes, without files)"""
+
+    def __init__(self, path, files=None):
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.files = files
+        self.conn = sqlite3.connect(path)
+        for pragma in SPATIAL_PRAGMAS:
+            self.conn.execute(pragma)
+        for sql in SPATIAL_TABLES:
+            self.conn.execute(sql)
+        self.nodes = []
+        self.ways = []
+
+    def add_node(self, node, n_tags):
+        """File a node, just before its row and its n_tags tag rows are written"""
+
+        lat, lon = float(node['lat']), float(node['lon'])
+        x, y = tile_xy(lat, lon, SPATIAL_NODE_ZOOM)
+        self.nodes.append(((x << SPATIAL_NODE_ZOOM) + y, int(node['id']), lat, lon,
+                           self.files[0].tell(), self.files[1].tell(), n_tags))
+        if len(self.nodes) >= SPATIAL_BATCH_SIZE:
+            self.flush()
+
+    def add_way(self, way, n_tags):
+        """File a way by its bounding box, just before its row and its n_tags tag rows are written"""
+
+        if way.get('min_lat') is None:
+            return
+        bbox = (way['min_lat'], way['min_lon'], way['max_lat'], way['max_lon'])
+        entry = (int(way['id']),) + bbox + (self.files[2].tell(), self.files[3].tell(), n_tags)
+
+        ranges = tile_ranges(*bbox, zoom=SPATIAL_WAY_ZOOM)
+        if len(ranges) * (ranges[0][1] - ranges[0][0] + 1) > SPATIAL_MAX_WAY_TILES:
+            self.ways.append((-1,) + entry)
+        else:
+            for first, last in ranges:
+                for tile in xrange(first, last + 1):
+                    self.ways.append((tile,) + entry)
+        if len(self.ways) >= SPATIAL_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)', self.nodes)
+        self.conn.executemany('INSERT INTO ways VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self.ways)
+        self.nodes = []
+        self.ways = []
+
+    def merge(self, path, offsets):
+        """Add the entries of another index (of a shard), whose rows start at the given byte
+        offsets of the nodes, nodes_tags, ways and ways_tags files"""
+
+        self.flush()
+        self.conn.execute('ATTACH DATABASE ? AS shard', (path,))
+        self.conn.execute('INSERT INTO nodes SELECT tile, id, lat, lon, row + ?, tags + ?, n_tags '
+                          'FROM shard.nodes', offsets[:2])
+        self.conn.execute('INSERT INTO ways SELECT tile, id, min_lat, min_lon, max_lat, max_lon, '
+                          'row + ?, tags + ?, n_tags FROM shard.ways', offsets[2:])
+        self.conn.commit()
+        self.conn.execute('DETACH DATABASE shard')
+
+    def close(self, create_indexes=True):
+        self.flush()
+        if create_indexes:
+            for sql in SPATIAL_INDEXES:
+                self.conn.execute(sql)
+        self.conn.commit()
+        self.conn.close()
+
+class SpatialQuery(object):
+    """Bounding box and nearest node queries over an export with a tile index"""
+
+    def __init__(self, out_dir='.', index_path=None):
+        from .export import NODES_PATH, NODE_TAGS_PATH, WAYS_PATH, WAY_TAGS_PATH
+
+        index_path = index_path or os.path.join(out_dir, SPATIAL_INDEX_PATH)
+        if not os.path.exists(index_path):
+            raise Exception("No spatial index at '{0}' (export with spatial=True)".format(index_path))
+        self.conn = sqlite3.connect(index_path)
+        self.files = {}
+        self.fields = {}
+        for table, path in (('nodes', NODES_PATH), ('nodes_tags', NODE_TAGS_PATH),
+                            ('ways', WAYS_PATH), ('ways_tags', WAY_TAGS_PATH)):
+            f = open(os.path.join(out_dir, path), 'rb')
+            self.fields[table] = next(csv.reader(f))
+            self.files[table] = f
+
+    def read_rows(self, table, offset, n=1):
+        """n rows of a .csv table, starting at a byte offset, as dicts"""
+
+        f = self.files[table]
+        f.seek(offset)
+        reader = csv.DictReader(f, self.fields[table])
+        return [next(reader) for _ in xrange(n)]
+
+    def node_entries(self, min_lat, min_lon, max_lat, max_lon):
+        """Index entries (id, lat, lon, row, tags, n_tags) of the nodes in a bounding box"""
+
+        entries = []
+        for first, last in tile_ranges(min_lat, min_lon, max_lat, max_lon, SPATIAL_NODE_ZOOM):
+            entries.extend(self.conn.execute(
+                'SELECT id, lat, lon, row, tags, n_tags FROM nodes WHERE tile BETWEEN ? AND ? '
+                'AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?',
+                (first, last, min_lat, max_lat, min_lon, max_lon)))
+        return entries
+
+    def way_entries(self, min_lat, min_lon, max_lat, max_lon):
+        """Index entries (id, row, tags, n_tags) of the ways whose bounding box overlaps a
+        bounding box"""
+
+        sql = ('SELECT id, row, tags, n_tags FROM ways WHERE {0} AND min_lat <= ? AND max_lat >= ? '
+               'AND min_lon <= ? AND max_lon >= ?')
+        overlap = (max_lat, min_lat, max_lon, min_lon)
+
+        entries = {}
+        ranges = tile_ranges(min_lat, min_lon, max_lat, max_lon, SPATIAL_WAY_ZOOM)
+        for first, last in ranges:
+            for entry in self.conn.execute(sql.format('tile BETWEEN ? AND ?'), (first, last) + overlap):
+                entries[entry[0]] = entry
+        for entry in self.conn.execute(sql.format('tile = -1'), overlap):
+            entries[entry[0]] = entry
+        return sorted(entries.itervalues())
+
+    def nodes_in_bbox(self, min_lat, min_lon, max_lat, max_lon, tags=False):
+        """The nodes.csv rows of the nodes in a bounding box (with their tag rows as 'tags')"""
+
+        nodes = []
+        for _, _, _, row, tags_offset, n_tags in self.node_entries(min_lat, min_lon, max_lat, max_lon):
+            node = self.read_rows('nodes', row)[0]
+            if tags:
+                node['tags'] = self.read_rows('nodes_tags', tags_offset, n_tags) if n_tags else []
+            nodes.append(node)
+        return nodes
+
+    def ways_in_bbox(self, min_lat, min_lon, max_lat, max_lon, tags=False):
+        """The ways.csv rows of the ways overlapping a bounding box (with their tag rows as 'tags')"""
+
+        ways = []
+        for _, row, tags_offset, n_tags in self.way_entries(min_lat, min_lon, max_lat, max_lon):
+            way = self.read_rows('ways', row)[0]
+            if tags:
+                way['tags'] = self.read_rows('ways_tags', tags_offset, n_tags) if n_tags else []
+            ways.append(way)
+        return ways
+
+    def tags_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """The nodes_tags.csv and ways_tags.csv rows of the nodes and ways in a bounding box"""
+
+        node_tags = []
+        for entry in self.node_entries(min_lat, min_lon, max_lat, max_lon):
+            if entry[5]:
+                node_tags.extend(self.read_rows('nodes_tags', entry[4], entry[5]))
+        way_tags = []
+        for entry in self.way_entries(min_lat, min_lon, max_lat, max_lon):
+            if entry[3]:
+                way_tags.extend(self.read_rows('ways_tags', entry[2], entry[3]))
+        return node_tags, way_tags
+
+    def nearest(self, lat, lon, key='amenity', value=None, n=1, max_distance=None):
+        """[(distance in meters, node row with 'tags')] of the n nodes nearest to a point that
+        have a tag with the given key (and value, if given)"""
+
+        x, y = tile_xy(lat, lon, SPATIAL_NODE_ZOOM)
+        size = tile_size(lat, SPATIAL_NODE_ZOOM)
+        tiles = 1 << SPATIAL_NODE_ZOOM
+        found = []
+        seen = set()
+
+        # the extent of the index, as its first and last tile columns (MIN and MAX of the tile
+        # keys are lookups in their index)
+        (first_tile, last_tile), = self.conn.execute('SELECT MIN(tile), MAX(tile) FROM nodes')
+        if first_tile is None:
+            return []
+        first_col, last_col = first_tile // tiles, last_tile // tiles
+
+        # Search squares of tiles of growing radius r around the point's tile. All nodes within
+        # r tile sizes of the point have been seen after radius r. Once a square spans all the
+        # columns of the index, the rest of the nodes are read in a single scan instead.
+        r = 0
+        while True:
+            everything = x - r <= first_col and x + r >= last_col
+            if everything:
+                rows = self.conn.execute('SELECT id, lat, lon, row, tags, n_tags FROM nodes '
+                                         'WHERE n_tags > 0')
+            else:
+                rows = []
+                first_row, last_row = max(y - r, 0), min(y + r, tiles - 1)
+                for col in xrange(max(x - r, first_col), min(x + r, last_col) + 1):
+                    rows.extend(self.conn.execute(
+                        'SELECT id, lat, lon, row, tags, n_tags FROM nodes '
+                        'WHERE tile BETWEEN ? AND ? AND n_tags > 0',
+                        (col * tiles + first_row, col * tiles + last_row)))
+            for node_id, node_lat, node_lon, row, tags_offset, n_tags in rows:
+                if node_id in seen:
+                    continue
+                seen.add(node_id)
+                tags = self.read_rows('nodes_tags', tags_offset, n_tags)
+                if any(node_tag_matches(tag, key, value) for tag in tags):
+                    node = self.read_rows('nodes', row)[0]
+                    node['tags'] = tags
+                    found.append((distance(lat, lon, node_lat, node_lon), node))
+            found.sort(key=lambda match: match[0])
+
+            covered = r * size
+            if everything:
+                break
+            if len(found) >= n and found[n - 1][0] <= covered:
+                break
+            if max_distance is not None and covered >= max_distance:
+                break
+            r = r + 1 if r < 8 else r * 2
+
+        if max_distance is not None:
+            found = [match for match in found if match[0] <= max_distance]
+        return found[:n]
+
+    def close(self):
+        self.conn.close()
+        for f in self.files.itervalues():
+            f.close()
+
+def node_tag_matches(tag, key, value):
+    """Does a nodes_tags.csv row have the given (full, as in the OSM file) key and value?"""
+
+    full_key = tag['key'] if tag['type'] == 'regular' else tag['type'] + ':' + tag['key']
+    return full_key == key and (value is None or tag['value'] == value)
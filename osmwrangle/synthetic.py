@@ -0,0 +1,161 @@
+"""
+Generator of synthetic OSM XML files, for benchmarks and testing without the real extract.
+
+The files look like a metro extract: a <bounds> element, then nodes, ways and relations (in
+that order, as in real extracts). Most nodes are untagged; the tagged ones and the ways get
+tags drawn from the common OSM keys, including addr:street / addr:postcode / addr:state values
+with the same kinds of problems as the Honolulu data (abbreviated street types, ZIP+4 and
+"HI 96816" style postcodes, "Hawaii" / "hi" states), and a few keys with problem characters.
+Ways reference recent nodes, with a long tailed number of nd refs per way.
+"""
+
+import random
+from xml.sax.saxutils import quoteattr
+
+BOUNDS = (21.2, -158.3, 21.75, -157.6)  # Oahu (minlat, minlon, maxlat, maxlon)
+
+# share of the file size taken by each element type
+NODE_SHARE = 0.70
+WAY_SHARE = 0.27
+
+STREET_NAMES = ['Kalakaua', 'Ala Moana', 'King', 'Beretania', 'Kapiolani', 'Kamehameha', 'Pali',
+                'Nuuanu', 'Date', 'Wilder', 'Moanalua', 'Hawaii Kai', 'Keeaumoku', 'Ward',
+                'Kuhio', 'Waialae', 'Dillingham', 'Farrington', 'Kahekili', 'Likelike']
+STREET_TYPES = (['Street', 'Avenue', 'Boulevard', 'Highway', 'Road', 'Drive', 'Place', 'Way',
+                 'Loop', 'Lane'] * 4 +
+                ['St', 'St.', 'Ave', 'Blvd', 'Hwy', 'highway', 'Rd.', 'Dr', 'Pkwy', 'Street.'])
+POSTCODES = ['96815', '96816', '96817', '96813', '96822', '96826', '96734', '96744'] * 5 + \
+            ['96815-2527', 'HI 96816', '96817-1234', '9681', 'HI96734']
+STATES = ['HI'] * 20 + ['Hawaii', 'hi', 'HI ']
+
+NODE_TAGS = [('amenity', ['restaurant', 'cafe', 'school', 'parking', 'place_of_worship', 'bench']),
+             ('name', ['Ala Moana Center', 'Kapiolani Park', u'Caf\xe9 Kaila', 'Diamond Head']),
+             ('shop', ['convenience', 'supermarket', 'clothes']),
+             ('highway', ['bus_stop', 'traffic_signals', 'crossing']),
+             ('tourism', ['hotel', 'attraction', 'viewpoint']),
+             ('gnis:feature_id', ['1234567', '7654321']),
+             ('source', ['bing', 'survey', 'tiger_import_dch_v0.6_20070809'])]
+WAY_TAGS = [('highway', ['residential', 'service', 'footway', 'primary', 'secondary']),
+            ('building', ['yes', 'house', 'apartments', 'commercial']),
+            ('name', ['Kalakaua Avenue', 'Ala Moana Boulevard', 'Kamehameha Highway']),
+            ('tiger:cfcc', ['A41', 'A45']),
+            ('tiger:name_base', ['Kalakaua', 'Kuhio']),
+            ('oneway', ['yes', 'no']),
+            ('surface', ['asphalt', 'concrete'])]
+PROBLEM_KEYS = ['name 1', 'addr.street', 'FIXME', 'note:en/1']
+
+class OSMGenerator(object):
+    """Write synthetic OSM elements; see generate_osm"""
+
+    def __init__(self, seed=0, bounds=BOUNDS, users=2000):
+        self.rand = random.Random(seed)
+        self.bounds = bounds
+        self.users = users
+        self.node_id = 0
+        self.way_id = 0
+        self.relation_id = 0
+
+    def meta(self):
+        r = self.rand
+        uid = int(r.paretovariate(1.2)) % self.users + 1
+        return ('version="{0}" timestamp="20{1:02d}-{2:02d}-{3:02d}T{4:02d}:{5:02d}:00Z" '
+                'changeset="{6}" uid="{7}" user="user{7}"').format(
+                    r.randint(1, 9), r.randint(8, 17), r.randint(1, 12), r.randint(1, 28),
+                    r.randint(0, 23), r.randint(0, 59), r.randint(1, 50000000), uid)
+
+    def address_tags(self):
+        r = self.rand
+        tags = [('addr:housenumber', str(r.randint(1, 3000))),
+                ('addr:street', '{0} {1}'.format(r.choice(STREET_NAMES), r.choice(STREET_TYPES)))]
+        if r.random() < 0.7:
+            tags.append(('addr:postcode', r.choice(POSTCODES)))
+        if r.random() < 0.5:
+            tags.append(('addr:state', r.choice(STATES)))
+        return tags
+
+    def tags(self, pool, n):
+        r = self.rand
+        tags = [(k, r.choice(values)) for k, values in r.sample(pool, min(n, len(pool)))]
+        if r.random() < 0.3:
+            tags.extend(self.address_tags())
+        if r.random() < 0.02:
+            tags.append((r.choice(PROBLEM_KEYS), 'x'))
+        return tags
+
+    def element(self, tag, attrs, children):
+        if not children:
+            return u' <{0} {1}/>\n'.format(tag, attrs)
+        return u' <{0} {1}>\n{2} </{0}>\n'.format(tag, attrs, u''.join(children))
+
+    def tag_children(self, tags):
+        return [u'  <tag k={0} v={1}/>\n'.format(quoteattr(k), quoteattr(v)) for k, v in tags]
+
+    def node(self):
+        r = self.rand
+        self.node_id += 1
+        minlat, minlon, maxlat, maxlon = self.bounds
+        attrs = u'id="{0}" lat="{1:.7f}" lon="{2:.7f}" {3}'.format(
+            self.node_id, r.uniform(minlat, maxlat), r.uniform(minlon, maxlon), self.meta())
+        tags = self.tags(NODE_TAGS, r.randint(1, 4)) if r.random() < 0.1 else []
+        return self.element('node', attrs, self.tag_children(tags))
+
+    def way(self):
+        r = self.rand
+        self.way_id += 1
+        n = min(2 + int(r.paretovariate(1.5) * 3), 2000)
+        start = r.randint(1, max(1, self.node_id - n))
+        refs = [min(start + i, self.node_id) for i in range(n)]
+        if r.random() < 0.3:
+            refs.append(refs[0])  # closed way (building, area)
+        children = [u'  <nd ref="{0}"/>\n'.format(ref) for ref in refs]
+        children.extend(self.tag_children(self.tags(WAY_TAGS, r.randint(1, 4))))
+        return self.element('way', u'id="{0}" {1}'.format(self.way_id, self.meta()), children)
+
+    def relation(self):
+        r = self.rand
+        self.relation_id += 1
+        children = []
+        for _ in range(r.randint(2, 30)):
+            if r.random() < 0.7:
+                children.append(u'  <member type="way" ref="{0}" role="outer"/>\n'.format(
+                    r.randint(1, max(1, self.way_id))))
+            else:
+                children.append(u'  <member type="node" ref="{0}" role=""/>\n'.format(
+                    r.randint(1, max(1, self.node_id))))
+        children.extend(self.tag_children([('type', r.choice(['route', 'multipolygon'])),
+                                           ('name', r.choice(STREET_NAMES))]))
+        return self.element('relation', u'id="{0}" {1}'.format(self.relation_id, self.meta()),
+                            children)
+
+def generate_osm(path, size_mb, seed=0, buffer_size=1 << 20):
+    """Write a synthetic OSM file of about size_mb megabytes to path; return its element counts"""
+
+    gen = OSMGenerator(seed)
+    target = int(size_mb * 1024 * 1024)
+    minlat, minlon, maxlat, maxlon = gen.bounds
+
+    with open(path, 'wb') as output:
+        header = ('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="osmwrangle">\n'
+                  ' <bounds minlat="{0}" minlon="{1}" maxlat="{2}" maxlon="{3}"/>\n').format(
+                      minlat, minlon, maxlat, maxlon)
+        output.write(header)
+        written = len(header)
+
+        buf = []
+        buffered = 0
+        for make, limit in ((gen.node, NODE_SHARE), (gen.way, NODE_SHARE + WAY_SHARE),
+                            (gen.relation, 1.0)):
+            while written + buffered < target * limit:
+                element = make().encode('utf-8')
+                buf.append(element)
+                buffered += len(element)
+                if buffered >= buffer_size:
+                    output.write(''.join(buf))
+                    written += buffered
+                    buf = []
+                    buffered = 0
+
+        output.write(''.join(buf))
+        output.write('</osm>\n')
+
+    return {'node': gen.node_id, 'way': gen.way_id, 'relation': gen.relation_id}
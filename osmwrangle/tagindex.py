@@ -0,0 +1,247 @@
+"""
+Inverted index of the exported tags: (type, key, value) -> ids of the elements with the tag.
+"""
+
+import marshal
+import struct
+from array import array
+from heapq import merge
+
+from .tagkeys import get_classifier
+
+# ================================================== #
+#        Tag Index: (type, key, value) -> ids        #
+# ================================================== #
+
+"""
+With tag_index=True, process_map adds the tags of every node, way and relation to a TagIndex as
+they are written, already split into type / key / value by shape_element, and saves it at TAG_INDEX_PATH
+next to the .csv files. Queries like "all amenity=restaurant" or "the distinct values of
+addr:street" are then answered from the index instead of a scan of nodes_tags.csv and
+ways_tags.csv (and relations_tags.csv).
+
+While it is built, every distinct string is stored once (the types, keys and values repeat a
+lot), and the ids of each tag are appended to a typed array. The ids arrive in increasing order
+(as the elements are sorted by id in OSM files), so on disk each posting list is stored as the
+differences between consecutive ids, in the smallest array type that holds them; most lists of a
+dense extract need 1 or 2 bytes per id. The first id is stored zigzag encoded (0, -1, 1, -2...
+as 0, 1, 2, 3...), as the new elements of OSM editor output have negative ids.
+
+The file holds a header, all the posting lists, and a directory (the string table and the
+offset of each posting list, marshalled). Opening the index only loads the directory; a lookup
+decodes just the posting lists it needs.
+"""
+
+TAG_INDEX_PATH = "tags.idx"  # Parameter: index file name (in the export's out_dir)
+
+TAG_INDEX_MAGIC = 'OSMTAGS2'
+TAG_INDEX_HEADER = struct.Struct('<8sQ')  # magic, directory offset
+
+ELEMENTS = ('node', 'way', 'relation')
+POSTING_TYPES = ['B', 'H', 'I', 'L']  # unsigned array types, from smallest to largest
+
+def split_key(k, default_tag_type='regular'):
+    """(type, key) of a full OSM tag key, split as shape_element does"""
+
+    return get_classifier(default_tag_type=default_tag_type).split(k)
+
+def full_key(tag_type, key, default_tag_type='regular'):
+    """The full OSM tag key of a (type, key) pair"""
+
+    return key if tag_type == default_tag_type else tag_type + ':' + key
+
+def encode_postings(ids):
+    """(typecode, bytes) of a list of ids, stored sorted, as the zigzag encoded first id and the
+    differences between consecutive ids"""
+
+    ids = sorted(ids)
+    first = ids[0]
+    deltas = [(first << 1) ^ (first >> 63)] + [b - a for a, b in zip(ids, ids[1:])]
+    largest = max(deltas)
+    for typecode in POSTING_TYPES:
+        if largest < 1 << (8 * array(typecode).itemsize):
+            return typecode, array(typecode, deltas).tostring()
+    raise Exception("Id {0} is too large for the tag index".format(largest))
+
+def decode_postings(typecode, data):
+    """The sorted id list stored by encode_postings"""
+
+    deltas = array(typecode, data)
+    if not deltas:
+        return []
+    total = (deltas[0] >> 1) ^ -(deltas[0] & 1)
+    ids = [total]
+    for delta in deltas[1:]:
+        total += delta
+        ids.append(total)
+    return ids
+
+class TagIndex(object):
+    """Inverted (type, key, value) -> ids index of the node, way and relation tags of an export"""
+
+    def __init__(self, path=TAG_INDEX_PATH, mode='r'):
+        self.path = path
+        self.mode = mode
+        if mode == 'w':
+            self.strings = {}
+            self.postings = dict((element, {}) for element in ELEMENTS)
+        elif mode == 'r':
+            self.load()
+        else:
+            raise Exception("Unknown tag index mode '{0}'".format(mode))
+
+    @property
+    def writable(self):
+        return self.mode == 'w'
+
+    # building
+
+    def add(self, element, element_id, tags):
+        """Add the shaped tags (dicts with type, key and value) of a node, way or relation"""
+
+        strings = self.strings
+        postings = self.postings[element]
+        element_id = int(element_id)
+        for tag in tags:
+            term = (tag['type'], tag['key'], tag['value'])
+            ids = postings.get(term)
+            if ids is None:
+                term = tuple(strings.setdefault(s, s) for s in term)
+                ids = postings[term] = array('l')
+            ids.append(element_id)
+
+    def merge(self, path):
+        """Add the tags of another (saved) index, whose ids all follow the ones already added"""
+
+        other = TagIndex(path)
+        strings = self.strings
+        for element in ELEMENTS:
+            postings = self.postings[element]
+            for term in other.directory[element]:
+                term = tuple(strings.setdefault(s, s) for s in term)
+                postings.setdefault(term, array('l')).extend(other.postings(element, term))
+        other.close()
+
+    def save(self):
+        """Write the index to its path"""
+
+        string_ids = {}
+        string_table = []
+        for s in self.strings:
+            string_ids[s] = len(string_table)
+            string_table.append(s)
+
+        entries = dict((element, []) for element in ELEMENTS)
+        with open(self.path, 'wb') as f:
+            f.write(TAG_INDEX_HEADER.pack(TAG_INDEX_MAGIC, 0))
+            for element in ELEMENTS:
+                for term, ids in self.postings[element].iteritems():
+                    typecode, data = encode_postings(ids)
+                    entries[element].append(tuple(string_ids[s] for s in term) +
+                                            (typecode, f.tell(), len(data)))
+                    f.write(data)
+            directory_offset = f.tell()
+            marshal.dump({'strings': string_table, 'entries': entries}, f)
+            f.seek(0)
+            f.write(TAG_INDEX_HEADER.pack(TAG_INDEX_MAGIC, directory_offset))
+
+    # lookups
+
+    def load(self):
+        """Load the directory of the index (the posting lists are read as needed)"""
+
+        self.file = open(self.path, 'rb')
+        magic, directory_offset = TAG_INDEX_HEADER.unpack(self.file.read(TAG_INDEX_HEADER.size))
+        if magic != TAG_INDEX_MAGIC:
+            raise Exception("'{0}' is not a tag index (of this version: export it again)".format(
+                self.path))
+        self.file.seek(directory_offset)
+        stored = marshal.load(self.file)
+
+        strings = stored['strings']
+        self.directory = {}
+        self.values = {}  # (type, key) -> set of values
+        for element in ELEMENTS:
+            directory = self.directory[element] = {}
+            # (indexes saved before relations were exported have no relation entries)
+            entries = stored['entries'].get(element, ())
+            for type_id, key_id, value_id, typecode, offset, size in entries:
+                term = (strings[type_id], strings[key_id], strings[value_id])
+                directory[term] = (typecode, offset, size)
+                self.values.setdefault(term[:2], set()).add(term[2])
+
+    def postings(self, element, term):
+        """The sorted ids of the nodes, ways or relations with a (type, key, value) tag"""
+
+        entry = self.directory[element].get(term)
+        if entry is None:
+            return []
+        typecode, offset, size = entry
+        self.file.seek(offset)
+        return decode_postings(typecode, self.file.read(size))
+
+    def posting_count(self, element, term):
+        """Number of ids in a posting list, from its size"""
+
+        entry = self.directory[element].get(term)
+        if entry is None:
+            return 0
+        typecode, _, size = entry
+        return size // array(typecode).itemsize
+
+    def ids(self, k, value=None, element=None):
+        """Sorted ids of the elements (nodes, ways and relations, unless element is given) with
+        the tag k (a full OSM key, e.g. 'addr:postcode'), with the given value or any value.
+        Without an element, a dict of the ids of each element type"""
+
+        if element is None:
+            return dict((element, self.ids(k, value, element)) for element in ELEMENTS)
+
+        type_key = split_key(k)
+        if value is not None:
+            return self.postings(element, type_key + (value,))
+        lists = [self.postings(element, type_key + (v,)) for v in self.values.get(type_key, ())]
+        ids = []
+        for element_id in merge(*lists):
+            if not ids or ids[-1] != element_id:
+                ids.append(element_id)
+        return ids
+
+    def count(self, k, value=None, element=None):
+        """Number of elements with the tag k (and value, if given)"""
+
+        if element is None:
+            return sum(self.count(k, value, element) for element in ELEMENTS)
+        if value is not None:
+            return self.posting_count(element, split_key(k) + (value,))
+        return len(self.ids(k, element=element))
+
+    def value_counts(self, k, element=None):
+        """{value: number of elements} of the distinct values of the tag k"""
+
+        elements = ELEMENTS if element is None else (element,)
+        type_key = split_key(k)
+        counts = {}
+        for value in self.values.get(type_key, ()):
+            term = type_key + (value,)
+            counts[value] = sum(self.posting_count(e, term) for e in elements)
+        return dict((value, n) for value, n in counts.iteritems() if n)
+
+    def keys(self):
+        """The full OSM keys of all indexed tags"""
+
+        return sorted(full_key(tag_type, key) for tag_type, key in self.values)
+
+    def close(self):
+        if self.mode == 'w':
+            self.save()
+            self.postings = None
+        else:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
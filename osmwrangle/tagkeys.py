@@ -0,0 +1,104 @@
+"""
+Classification and splitting of OSM tag keys, shared by the audit and the export.
+"""
+
+import re
+
+# ================================================== #
+#         Tag Keys: Category, Type and Key           #
+# ================================================== #
+
+"""
+Every tag key is looked at twice: the audit sorts it into one of the four Udacity categories
+(lower, lower_colon, problemchars, other; see audit.py), and shape_element skips it if it has
+problem characters or splits it into its type and key. Both take a few regex searches per tag,
+but an extract has far fewer distinct keys than tags (a few thousand keys for millions of tags),
+so a TagKeyClassifier works each distinct key out once and caches the result:
+
+    (category, type, key, is_problem)
+
+for instance ('lower_colon', 'addr', 'street', False) for "addr:street". The type and key
+strings of the cached tuple are shared by every row with that key, rather than split into new
+strings per tag.
+
+classify_keys classifies a whole list of keys (e.g. all the tag keys of an element) in one go:
+the keys not cached yet are classified together, and the rest are plain dict lookups.
+
+The cache holds up to TAG_KEY_CACHE_SIZE keys. An extract with more distinct keys than that
+(usually keys holding data, like "name:xx" variants or import ids) empties it and starts over,
+which keeps memory bounded at the cost of classifying some keys again.
+"""
+
+TAG_KEY_CACHE_SIZE = 1 << 16  # Parameter: distinct keys cached by a TagKeyClassifier
+
+LOWER = re.compile(r'^([a-z]|_)*$')
+LOWER_COLON = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
+PROBLEMCHARS = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
+
+class TagKeyClassifier(object):
+    """Cached (category, type, key, is_problem) of tag keys"""
+
+    def __init__(self, problem_chars=PROBLEMCHARS, default_tag_type='regular',
+                 cache_size=TAG_KEY_CACHE_SIZE):
+        self.problem_chars = problem_chars
+        self.default_tag_type = default_tag_type
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def split(self, k):
+        """(type, key) of a full tag key: the type is the part before the first colon, if any"""
+
+        if ':' in k:
+            tag_type, key = k.split(':', 1)
+            return tag_type, key
+        return self.default_tag_type, k
+
+    def classify_new(self, k):
+        """(category, type, key, is_problem) of a key, without the cache"""
+
+        is_problem = re.search(self.problem_chars, k) is not None
+        if LOWER.search(k):
+            category = 'lower'
+        elif LOWER_COLON.search(k):
+            category = 'lower_colon'
+        elif is_problem:
+            category = 'problemchars'
+        else:
+            category = 'other'
+        tag_type, key = self.split(k)
+        return category, tag_type, key, is_problem
+
+    def classify(self, k):
+        """(category, type, key, is_problem) of a key"""
+
+        try:
+            return self.cache[k]
+        except KeyError:
+            pass
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        result = self.cache[k] = self.classify_new(k)
+        return result
+
+    def classify_keys(self, keys):
+        """The (category, type, key, is_problem) of each key of a list"""
+
+        cache = self.cache
+        missing = set(keys).difference(cache)
+        if missing:
+            if len(cache) + len(missing) > self.cache_size:
+                cache.clear()
+            for k in missing:
+                cache[k] = self.classify_new(k)
+        return map(cache.__getitem__, keys)
+
+CLASSIFIERS = {}
+
+def get_classifier(problem_chars=PROBLEMCHARS, default_tag_type='regular'):
+    """The shared TagKeyClassifier of a problem characters regex and default tag type"""
+
+    params = (problem_chars, default_tag_type)
+    classifier = CLASSIFIERS.get(params)
+    if classifier is None:
+        classifier = CLASSIFIERS[params] = TagKeyClassifier(problem_chars, default_tag_type)
+    return classifier
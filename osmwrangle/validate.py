@@ -0,0 +1,179 @@
+"""
+Validation of shaped elements against schema.py, either with cerberus or with the much faster
+compiled schema.
+"""
+
+import pprint
+
+from . import schema
+from .waynodes import RelationMembers, WayNodes
+
+SCHEMA = schema.schema
+
+class ValidationError(Exception):
+    """An element that does not match the schema; field is the table with the errors"""
+
+    def __init__(self, message, field=None, errors=None):
+        super(ValidationError, self).__init__(message)
+        self.field = field
+        self.errors = errors
+
+def validate_element(element, validator, schema=SCHEMA):
+    """Raise ValidationError if element does not match schema"""
+    if not isinstance(validator, CompiledValidator):
+        if isinstance(element.get('way_nodes'), WayNodes):
+            element = dict(element, way_nodes=element['way_nodes'].rows())
+        if isinstance(element.get('relation_members'), RelationMembers):
+            element = dict(element, relation_members=element['relation_members'].rows())
+    if validator.validate(element, schema) is not True:
+        field, errors = next(validator.errors.iteritems())
+        message_string = "\nElement of type '{0}' has the following errors:\n{1}"
+        error_string = pprint.pformat(errors)
+
+        raise ValidationError(message_string.format(field, error_string), field, errors)
+
+# ================================================== #
+#     Compiled Validator: fast path for cerberus     #
+# ================================================== #
+
+"""
+compile_schema turns schema.py into one checker function per table, built once at startup.
+The checkers only implement the rules schema.py uses (required, nullable, type and coerce, plus
+nested dict / list schemas) and report errors in the same format as cerberus, so CompiledValidator
+can be passed to validate_element in place of cerberus.Validator and raise the same messages.
+
+Like cerberus, the checkers do not modify the rows; coercion is only used to check the values.
+A value that fails coercion is also reported as null or of the wrong type, after the coercion
+error in a dict table, and before it in a row of a list table (the order cerberus 1.1 lists them
+in).
+"""
+
+# the types cerberus 1.1 accepts for each schema type (a 'float' field also accepts integers)
+SCHEMA_TYPES = {'integer': (int, long),
+                'float': (float, int, long),
+                'string': basestring,
+                'dict': dict,
+                'list': list}
+
+def compile_row_checker(row_schema, coerce_error_first=True):
+    """Return a function mapping a row dict to a {field: [errors]} dict (empty if valid)"""
+
+    fields = []
+    for field, rules in row_schema.iteritems():
+        unsupported = set(rules) - set(['required', 'nullable', 'type', 'coerce'])
+        if unsupported:
+            raise Exception("Unsupported schema rule(s) for field '{0}': {1}".format(field, sorted(unsupported)))
+        type_name = rules.get('type')
+        fields.append((field, rules.get('required', False), rules.get('nullable', False),
+                       rules.get('coerce'), SCHEMA_TYPES[type_name] if type_name else object,
+                       type_name))
+    known = set(row_schema)
+
+    def check_row(row):
+        errors = {}
+        for field, required, nullable, coerce, field_type, type_name in fields:
+            if field not in row:
+                if required:
+                    errors[field] = ['required field']
+                continue
+            value = row[field]
+            if value is None and nullable:
+                continue
+            field_errors = []
+            if coerce is not None:
+                try:
+                    value = coerce(value)
+                except (TypeError, ValueError) as e:
+                    field_errors.append("field '{0}' cannot be coerced: {1}".format(field, e))
+            if value is None:
+                field_errors.append('null value not allowed')
+            elif not isinstance(value, field_type):
+                field_errors.append('must be of {0} type'.format(type_name))
+            if field_errors:
+                if not coerce_error_first:
+                    field_errors.reverse()
+                errors[field] = field_errors
+        if len(row) > len(fields) or errors:
+            for field in row:
+                if field not in known:
+                    errors[field] = ['unknown field']
+        return errors
+
+    return check_row
+
+def compile_schema(schema=SCHEMA):
+    """Compile schema into {table: (table type, row checker)}"""
+
+    compiled = {}
+    for table, rules in schema.iteritems():
+        if rules['type'] == 'dict':
+            compiled[table] = ('dict', compile_row_checker(rules['schema']))
+        elif rules['type'] == 'list' and rules['schema']['type'] == 'dict':
+            compiled[table] = ('list', compile_row_checker(rules['schema']['schema'],
+                                                           coerce_error_first=False))
+        else:
+            raise Exception("Unsupported schema type for table '{0}'".format(table))
+    return compiled
+
+COMPILED_SCHEMA = compile_schema(SCHEMA)
+
+def table_type_error(value, type_name):
+    """The error of a table (or of a row of a list table) that is not a dict / list"""
+
+    if value is None:
+        return 'null value not allowed'
+    return 'must be of {0} type'.format(type_name)
+
+class CompiledValidator(object):
+    """Drop-in replacement for cerberus.Validator in validate_element, using compile_schema"""
+
+    def __init__(self, schema=SCHEMA):
+        self.schema = schema
+        self.compiled = COMPILED_SCHEMA if schema is SCHEMA else compile_schema(schema)
+        self.errors = {}
+
+    def validate_rows(self, table, rows):
+        """Validate a batch of rows of one list table; return {row index: errors}"""
+
+        check_row = self.compiled[table][1]
+        row_errors = {}
+        for i, row in enumerate(rows):
+            if not isinstance(row, dict):
+                row_errors[i] = [table_type_error(row, 'dict')]
+                continue
+            errors = check_row(row)
+            if errors:
+                row_errors[i] = [errors]
+        return row_errors
+
+    def validate(self, document, schema=None):
+        if schema is not None and schema is not self.schema:
+            self.__init__(schema)
+
+        self.errors = {}
+        for table, value in document.iteritems():
+            if table not in self.compiled:
+                self.errors[table] = ['unknown field']
+                continue
+            table_type, check_row = self.compiled[table]
+            if table_type == 'dict':
+                if not isinstance(value, dict):
+                    self.errors[table] = [table_type_error(value, 'dict')]
+                    continue
+                errors = check_row(value)
+            else:
+                if not isinstance(value, (list, WayNodes, RelationMembers)):
+                    self.errors[table] = [table_type_error(value, 'list')]
+                    continue
+                errors = self.validate_rows(table, value)
+            if errors:
+                self.errors[table] = [errors]
+        return not self.errors
+
+def get_validator(use_cerberus=False):
+    """Validator for validate_element; cerberus is only imported when it is requested"""
+
+    if use_cerberus:
+        import cerberus
+        return cerberus.Validator()
+    return CompiledValidator()
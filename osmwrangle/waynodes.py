@@ -0,0 +1,143 @@
+"""
+Compact representation of the way_nodes (and relation_members) tables.
+
+way_nodes is by far the largest table, and building one dict per nd reference is the biggest
+memory and garbage collection cost of the export. shape_element therefore returns a WayNodes
+object for each way: the way id plus the list of node refs. It can still be used as the list
+of {'id', 'node_id', 'position'} dicts (iteration, indexing, rows()) where needed.
+
+write_elements collects the WayNodes of many ways into a WayNodesBatch, which stores the way
+ids, node ids and positions as typed arrays. A writer with a write_way_nodes(batch) method
+writes a whole batch at once from the arrays; any other writer gets the rows as dicts.
+
+The members of a relation are kept the same way, as a RelationMembers object: the relation id
+plus parallel lists of the member types, refs and roles, so that route and boundary relations
+with thousands of members cost three lists rather than a dict per member. A writer with a
+write_tuples(rows) method (TableWriter) gets the rows as tuples.
+"""
+
+from array import array
+from itertools import count, izip, repeat
+
+# 'l' is 64 bit on 64 bit Linux / OS X, as needed for OSM ids; fall back to Python lists elsewhere
+ID_ARRAY = (lambda: array('l')) if array('l').itemsize >= 8 else list
+
+WAY_NODES_BATCH_SIZE = 100000  # way node rows per batch
+
+class WayNodes(object):
+    """The way_nodes rows of one way"""
+
+    __slots__ = ('way_id', 'refs')
+
+    def __init__(self, way_id, refs):
+        self.way_id = way_id
+        self.refs = refs
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __getitem__(self, position):
+        return {'id': self.way_id, 'node_id': self.refs[position], 'position': position}
+
+    def __iter__(self):
+        way_id = self.way_id
+        for position, ref in enumerate(self.refs):
+            yield {'id': way_id, 'node_id': ref, 'position': position}
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.rows())
+
+    def rows(self):
+        """The rows as a list of dicts (the original shape_element format)"""
+        return list(self)
+
+class WayNodesBatch(object):
+    """Way node rows of many ways, as typed arrays"""
+
+    def __init__(self):
+        self.way_ids = ID_ARRAY()
+        self.node_ids = ID_ARRAY()
+        self.positions = array('l')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def append(self, way_nodes):
+        # the ids are converted before any array is extended: a bad one leaves the batch as it was
+        way_id, node_ids = int(way_nodes.way_id), map(int, way_nodes.refs)
+        n = len(node_ids)
+        self.way_ids.extend(repeat(way_id, n))
+        self.node_ids.extend(node_ids)
+        self.positions.extend(xrange(n))
+
+    def tuples(self):
+        return izip(self.way_ids, self.node_ids, self.positions)
+
+    def rows(self):
+        for way_id, node_id, position in self.tuples():
+            yield {'id': way_id, 'node_id': node_id, 'position': position}
+
+class RelationMembers(object):
+    """The relation_members rows of one relation"""
+
+    __slots__ = ('relation_id', 'types', 'refs', 'roles')
+
+    def __init__(self, relation_id, types, refs, roles):
+        self.relation_id = relation_id
+        self.types = types
+        self.refs = refs
+        self.roles = roles
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __getitem__(self, position):
+        return {'id': self.relation_id, 'member_type': self.types[position],
+                'member_id': self.refs[position], 'role': self.roles[position],
+                'position': position}
+
+    def __iter__(self):
+        for position in xrange(len(self.refs)):
+            yield self[position]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.rows())
+
+    def rows(self):
+        """The rows as a list of dicts"""
+        return list(self)
+
+    def tuples(self):
+        """The rows as (id, member_type, member_id, role, position) tuples"""
+        return izip(repeat(self.relation_id), self.types, self.refs, self.roles, count())
+
+def write_way_nodes(writer, batch):
+    """Write a WayNodesBatch with the writer's batch method if it has one, row by row otherwise"""
+
+    if len(batch):
+        if hasattr(writer, 'write_way_nodes'):
+            writer.write_way_nodes(batch)
+        else:
+            writer.writerows(batch.rows())
+
+def write_relation_members(writer, members):
+    """Write a RelationMembers with the writer's write_tuples method if it has one, row by row
+    otherwise"""
+
+    if len(members):
+        if hasattr(writer, 'write_tuples'):
+            writer.write_tuples(list(members.tuples()))
+        else:
+            writer.writerows(members)
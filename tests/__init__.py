@@ -0,0 +1,3 @@
+"""
+Regression tests of the osmwrangle package: python -m unittest discover (from the top directory)
+"""
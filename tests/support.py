@@ -0,0 +1,58 @@
+"""
+Fixtures shared by the tests: a small synthetic OSM file (see synthetic.py), a temporary
+directory for the exports and helpers reading their output back.
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from osmwrangle.export import EXPORT_TABLES
+from osmwrangle.metrics import Metrics, NullSink, set_metrics
+from osmwrangle.synthetic import generate_osm
+
+FIXTURE_MB = 0.5  # size of the synthetic OSM file of each test case
+FIXTURE_SEED = 1
+
+class ExportTestCase(unittest.TestCase):
+    """A temporary directory with a synthetic OSM file (osm_file); the metrics are silenced"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.previous_metrics = set_metrics(Metrics(NullSink()))
+        cls.tmp = tempfile.mkdtemp(prefix='osmwrangle-test-')
+        cls.osm_file = os.path.join(cls.tmp, 'synthetic.osm')
+        generate_osm(cls.osm_file, FIXTURE_MB, seed=FIXTURE_SEED)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+        set_metrics(cls.previous_metrics)
+
+    @classmethod
+    def out_dir(cls, name):
+        """A new, empty directory for an export"""
+
+        path = os.path.join(cls.tmp, name)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        return path
+
+def read_csvs(out_dir):
+    """{file name: contents} of the .csv files of an export"""
+
+    contents = {}
+    for path, _ in EXPORT_TABLES:
+        with open(os.path.join(out_dir, path), 'rb') as f:
+            contents[path] = f.read()
+    return contents
+
+def read_csv_rows(path):
+    """The rows of a .csv file, as dicts of unicode values"""
+
+    with open(path, 'rb') as f:
+        return [dict((k, v.decode('utf-8')) for k, v in row.iteritems())
+                for row in csv.DictReader(f)]
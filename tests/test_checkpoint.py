@@ -0,0 +1,109 @@
+"""
+A checkpointed export that stops part way resumes to the same .csv files as an export in one go.
+"""
+
+import json
+import os
+import unittest
+
+from osmwrangle import checkpoint
+from osmwrangle.checkpoint import CHECKPOINT_PATH, process_map_checkpointed
+from osmwrangle.export import process_map
+from osmwrangle.geometry import NODE_INDEX_PATH
+
+from .support import ExportTestCase, read_csv_rows, read_csvs
+
+class Interrupted(Exception):
+    pass
+
+class CheckpointTest(ExportTestCase):
+
+    EVERY = 500        # elements between checkpoints
+    STOP_AFTER = 1250  # elements written before the export is interrupted
+
+    @classmethod
+    def setUpClass(cls):
+        super(CheckpointTest, cls).setUpClass()
+        cls.serial_dir = cls.out_dir('serial')
+        process_map(cls.osm_file, validate=True, out_dir=cls.serial_dir)
+        cls.geometry_dir = cls.out_dir('geometry')
+        process_map(cls.osm_file, validate=True, out_dir=cls.geometry_dir, geometry=True)
+
+    def patch_write_shaped(self, stop_after=None):
+        """Count the elements written by checkpointed exports in self.written, and interrupt them
+        once stop_after are (part way between checkpoints, with rows written since the last
+        one); returns the function that undoes it"""
+
+        write_shaped = checkpoint.write_shaped
+        self.written = 0
+
+        def counted_write_shaped(elements, *args, **kwargs):
+            elements = list(elements)
+            if stop_after is not None:
+                elements = elements[:stop_after - self.written]
+            write_shaped(elements, *args, **kwargs)
+            self.written += len(elements)
+            if self.written == stop_after:
+                raise Interrupted()
+
+        checkpoint.write_shaped = counted_write_shaped
+        return lambda: setattr(checkpoint, 'write_shaped', write_shaped)
+
+    def assert_resumes(self, out_dir, stop_after, geometry=False):
+        undo = self.patch_write_shaped(stop_after)
+        try:
+            with self.assertRaises(Interrupted):
+                process_map_checkpointed(self.osm_file, validate=True, out_dir=out_dir,
+                                         every=self.EVERY, geometry=geometry)
+        finally:
+            undo()
+        with open(os.path.join(out_dir, CHECKPOINT_PATH)) as f:
+            checkpointed = json.load(f)['elements']
+        self.assertEqual(checkpointed, stop_after // self.EVERY * self.EVERY)
+
+        undo = self.patch_write_shaped()
+        try:
+            process_map_checkpointed(self.osm_file, validate=True, out_dir=out_dir,
+                                     every=self.EVERY, geometry=geometry)
+        finally:
+            undo()
+        self.assertFalse(os.path.exists(os.path.join(out_dir, CHECKPOINT_PATH)))
+        expected_dir = self.geometry_dir if geometry else self.serial_dir
+        self.assertEqual(read_csvs(out_dir), read_csvs(expected_dir))
+
+        # the elements before the checkpoint were not exported again
+        elements = sum(len(read_csv_rows(os.path.join(self.serial_dir, path)))
+                       for path in ('nodes.csv', 'ways.csv', 'relations.csv'))
+        self.assertEqual(self.written, elements - checkpointed)
+
+    def test_resume(self):
+        self.assert_resumes(self.out_dir('resume'), self.STOP_AFTER)
+
+    def test_resume_geometry(self):
+        nodes = len(read_csv_rows(os.path.join(self.serial_dir, 'nodes.csv')))
+        # interrupted while the node index is built, and after a checkpoint past the first way,
+        # which finished it
+        for stop_after in (self.STOP_AFTER, (nodes // self.EVERY + 1) * self.EVERY + 50):
+            out_dir = self.out_dir('resume-geometry')
+            self.assert_resumes(out_dir, stop_after, geometry=True)
+            for suffix in ('.ids', '.coords'):
+                with open(os.path.join(out_dir, NODE_INDEX_PATH + suffix), 'rb') as f:
+                    resumed = f.read()
+                with open(os.path.join(self.geometry_dir, NODE_INDEX_PATH + suffix), 'rb') as f:
+                    self.assertEqual(resumed, f.read(), suffix)
+
+    def test_geometry_mismatch(self):
+        out_dir = self.out_dir('mismatch')
+        undo = self.patch_write_shaped(self.STOP_AFTER)
+        try:
+            with self.assertRaises(Interrupted):
+                process_map_checkpointed(self.osm_file, validate=True, out_dir=out_dir,
+                                         every=self.EVERY)
+        finally:
+            undo()
+        with self.assertRaises(Exception):
+            process_map_checkpointed(self.osm_file, validate=True, out_dir=out_dir,
+                                     every=self.EVERY, geometry=True)
+
+if __name__ == '__main__':
+    unittest.main()
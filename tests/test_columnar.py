@@ -0,0 +1,62 @@
+"""
+Columnar files read back as the same rows as the .csv files.
+"""
+
+import os
+import unittest
+
+from osmwrangle.columnar import COLUMNAR_TABLES, ColumnarSink, table_columns
+from osmwrangle.export import process_map, write_elements
+
+from .support import ExportTestCase, read_csv_rows
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class ColumnarTest(ExportTestCase):
+
+    BATCH_SIZE = 1000  # rows per record batch, so that the larger tables take several
+
+    @classmethod
+    def setUpClass(cls):
+        super(ColumnarTest, cls).setUpClass()
+        cls.csv_dir = cls.out_dir('csv')
+        process_map(cls.osm_file, validate=False, out_dir=cls.csv_dir)
+
+    def read_table(self, path, fmt):
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.read_table(path)
+        return pyarrow.ipc.open_file(pyarrow.OSFile(path)).read_all()
+
+    def assert_same_as_csv(self, fmt):
+        out_dir = self.out_dir(fmt)
+        with ColumnarSink(out_dir, fmt, batch_size=self.BATCH_SIZE) as sink:
+            write_elements(self.osm_file, sink.writers, validate=False)
+
+        batches = 0
+        for table, schema_table, fields in COLUMNAR_TABLES:
+            rows = read_csv_rows(os.path.join(self.csv_dir, table + '.csv'))
+            columns = self.read_table(os.path.join(out_dir, table + '.' + fmt), fmt).to_pydict()
+            batches = max(batches, len(rows) // self.BATCH_SIZE + 1)
+            for field, _, coerce in table_columns(schema_table, fields):
+                expected = [coerce(row[field]) if coerce else row[field] for row in rows]
+                self.assertEqual(columns[field], expected, '{0}.{1}'.format(table, field))
+        self.assertGreater(batches, 2)
+
+    def test_arrow(self):
+        self.assert_same_as_csv('arrow')
+
+    def test_parquet(self):
+        self.assert_same_as_csv('parquet')
+
+    def test_arrow_compression(self):
+        with self.assertRaises(Exception):
+            with ColumnarSink(self.out_dir('arrow-snappy'), 'arrow', 'snappy'):
+                pass
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+"""
+Compressed .csv output reads back as written, at the level asked for.
+"""
+
+import gzip
+import os
+import unittest
+
+from osmwrangle.compression import CompressingWriter
+
+from .support import ExportTestCase
+
+class CompressingWriterTest(ExportTestCase):
+
+    DATA = 'id,lat,lon\n' + '1,21.3069,-157.8583\n' * 5000
+
+    def write(self, name, level=None):
+        path = os.path.join(self.out_dir('compression'), name)
+        with CompressingWriter(path, 'gz', level=level) as f:
+            f.write(self.DATA)
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+        return os.path.getsize(path)
+
+    def test_level(self):
+        # level 0 stores the data as it is, rather than falling back to the default level
+        self.assertGreater(self.write('stored.csv.gz', level=0), len(self.DATA))
+        self.assertLess(self.write('default.csv.gz'), len(self.DATA) // 10)
+
+if __name__ == '__main__':
+    unittest.main()
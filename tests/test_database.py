@@ -0,0 +1,68 @@
+"""
+The SQLite load holds the same rows as the .csv files, and a failed load leaves no partial tables.
+"""
+
+import os
+import sqlite3
+import unittest
+
+from osmwrangle.database import SQL_TABLES, process_map_sqlite
+from osmwrangle.export import process_map
+
+from .support import ExportTestCase, read_csv_rows
+
+class SQLiteTest(ExportTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(SQLiteTest, cls).setUpClass()
+        cls.csv_dir = cls.out_dir('csv')
+        process_map(cls.osm_file, validate=True, out_dir=cls.csv_dir)
+
+        # a node without coordinates, after all the other elements: shaping it fails
+        with open(cls.osm_file, 'rb') as f:
+            osm = f.read()
+        cls.bad_file = os.path.join(cls.tmp, 'bad.osm')
+        with open(cls.bad_file, 'wb') as f:
+            f.write(osm.replace('</osm>', ' <node id="1" version="1" changeset="1" '
+                                'timestamp="2014-12-20T11:43:00Z" uid="1" user="user1"/>\n'
+                                '</osm>'))
+
+    def table_names(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return set(name for name, in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"))
+        finally:
+            conn.close()
+
+    def test_load(self):
+        db_path = os.path.join(self.out_dir('load'), 'osm.db')
+        process_map_sqlite(self.osm_file, db_path, validate=True)
+        conn = sqlite3.connect(db_path)
+        try:
+            for table, _, _ in SQL_TABLES:
+                rows = read_csv_rows(os.path.join(self.csv_dir, table + '.csv'))
+                (count,), = conn.execute('SELECT COUNT(*) FROM {0}'.format(table))
+                self.assertEqual(count, len(rows), table)
+        finally:
+            conn.close()
+
+    def test_failed_load(self):
+        # a database the load created is removed
+        db_path = os.path.join(self.out_dir('failed'), 'osm.db')
+        with self.assertRaises(KeyError):
+            process_map_sqlite(self.bad_file, db_path, validate=True)
+        self.assertFalse(os.path.exists(db_path))
+
+        # from an existing database, the tables of the export are dropped, and only those
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE notes (id INTEGER)')
+        conn.commit()
+        conn.close()
+        with self.assertRaises(KeyError):
+            process_map_sqlite(self.bad_file, db_path, validate=True)
+        self.assertEqual(self.table_names(db_path), set(['notes']))
+
+if __name__ == '__main__':
+    unittest.main()
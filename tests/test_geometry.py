@@ -0,0 +1,95 @@
+"""
+The node index, the way geometry resolved from it, and exports whose nodes do not all come first.
+"""
+
+import json
+import os
+import re
+import unittest
+
+from osmwrangle.export import process_map
+from osmwrangle.geometry import NodeIndex, way_geometry
+from osmwrangle.quarantine import QUARANTINE_PATH
+
+from .support import ExportTestCase, read_csv_rows
+
+TINY_OSM = os.path.join(os.path.dirname(__file__), 'data', 'tiny.osm')
+
+class NodeIndexTest(ExportTestCase):
+
+    def node_index(self):
+        return NodeIndex(os.path.join(self.out_dir('index'), 'nodes.idx'), mode='w', block=2)
+
+    def test_lookup(self):
+        with self.node_index() as index:
+            for node_id in range(1, 10):
+                index.add(node_id * 10, node_id / 10.0, -node_id / 10.0)
+            self.assertEqual(index.get(30), (0.3, -0.3))
+            self.assertEqual(index.get(90), (0.9, -0.9))
+            self.assertIsNone(index.get(35))
+            self.assertIsNone(index.get(5))
+
+    def test_sorted_ids(self):
+        with self.node_index() as index:
+            index.add(2, 0.0, 0.0)
+            with self.assertRaises(Exception):
+                index.add(1, 0.0, 0.0)
+
+    def test_add_after_lookup(self):
+        with self.node_index() as index:
+            index.add(1, 0.0, 0.0)
+            index.get(1)
+            with self.assertRaises(Exception):
+                index.add(2, 0.0, 0.0)
+
+    def test_centroid(self):
+        # a closed way through one of its nodes twice: each distinct point counts once
+        with self.node_index() as index:
+            for node_id, lat, lon in [(1, 0.0, 0.0), (2, 0.0, 2.0), (3, 2.0, 2.0), (4, 2.0, 0.0),
+                                      (5, 2.0, 8.0)]:
+                index.add(node_id, lat, lon)
+            geometry = way_geometry(index, ['1', '2', '3', '5', '3', '4', '1'])
+            self.assertEqual((geometry['centroid_lat'], geometry['centroid_lon']), (1.2, 2.4))
+            self.assertEqual((geometry['min_lat'], geometry['max_lon']), (0.0, 8.0))
+            self.assertIsNone(way_geometry(index, ['6'])['centroid_lat'])
+
+class NodesAfterWaysTest(ExportTestCase):
+
+    LATE_NODE = '1010'  # moved after the ways
+
+    @classmethod
+    def setUpClass(cls):
+        super(NodesAfterWaysTest, cls).setUpClass()
+        with open(TINY_OSM, 'rb') as f:
+            osm = f.read()
+        node = re.search(r' <node id="{0}" [^>]*/>\n'.format(cls.LATE_NODE), osm).group()
+        osm = osm.replace(node, '').replace(' <relation ', node + ' <relation ', 1)
+        cls.late_file = os.path.join(cls.tmp, 'late-node.osm')
+        with open(cls.late_file, 'wb') as f:
+            f.write(osm)
+
+    def test_error(self):
+        with self.assertRaises(Exception) as raised:
+            process_map(self.late_file, validate=True, out_dir=self.out_dir('error'),
+                        geometry=True)
+        self.assertIn('before the ways', str(raised.exception))
+
+    def test_quarantine(self):
+        out_dir = self.out_dir('quarantine')
+        process_map(self.late_file, validate=True, out_dir=out_dir, geometry=True,
+                    quarantine=True)
+        with open(os.path.join(out_dir, QUARANTINE_PATH), 'rb') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([(r['stage'], r['element']['attrib']['id']) for r in records],
+                         [('index', self.LATE_NODE)])
+        ways = read_csv_rows(os.path.join(out_dir, 'ways.csv'))
+        self.assertEqual([way['id'] for way in ways if way['centroid_lat']], ['5001', '5002'])
+
+    def test_without_geometry(self):
+        out_dir = self.out_dir('plain')
+        process_map(self.late_file, validate=True, out_dir=out_dir)
+        nodes = read_csv_rows(os.path.join(out_dir, 'nodes.csv'))
+        self.assertEqual(nodes[-1]['id'], self.LATE_NODE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Progress records: the rate and ETA count from the start of the progress clock.
+"""
+
+import unittest
+
+from osmwrangle import metrics
+from osmwrangle.metrics import Metrics
+
+class RecordingSink(object):
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+class ProgressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.timer = metrics.timer
+        metrics.timer = lambda: self.now
+
+    def tearDown(self):
+        metrics.timer = self.timer
+
+    def test_eta(self):
+        sink = RecordingSink()
+        m = Metrics(sink, timing=True)
+        # a pass before the input is read (such as the node index of a parallel export)
+        self.now = 100.0
+        m.start(1000)
+        self.now = 110.0
+        m.progress(250)
+        progress, = sink.records
+        self.assertEqual(progress['event'], 'progress')
+        self.assertAlmostEqual(progress['percent'], 25.0)
+        self.assertAlmostEqual(progress['elapsed'], 10.0)
+        self.assertAlmostEqual(progress['mb_per_sec'], 25.0 / 1048576)
+        self.assertAlmostEqual(progress['eta'], 30.0)
+        # the summary still has the time of the whole run
+        self.assertAlmostEqual(m.summary()['elapsed'], 110.0)
+
+    def test_progress_seconds(self):
+        sink = RecordingSink()
+        m = Metrics(sink, timing=True, progress_seconds=10)
+        self.now = 50.0
+        m.start(1000)
+        self.now = 59.0
+        m.progress(100)
+        self.assertEqual(sink.records, [])
+        self.now = 60.0
+        m.progress(100)
+        self.now = 65.0
+        m.progress(200, force=True)
+        self.assertEqual([record['eta'] for record in sink.records], [90.0, 60.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+"""
+The parallel export writes the same .csv files as the serial one.
+"""
+
+import unittest
+
+from osmwrangle.export import process_map, process_map_parallel
+
+from .support import ExportTestCase, read_csvs
+
+class ParallelTest(ExportTestCase):
+
+    def assert_same_as_serial(self, **options):
+        serial_dir = self.out_dir('serial')
+        process_map(self.osm_file, validate=True, out_dir=serial_dir, **options)
+        for processes in (2, 3):
+            parallel_dir = self.out_dir('parallel-{0}'.format(processes))
+            process_map_parallel(self.osm_file, validate=True, processes=processes,
+                                 out_dir=parallel_dir, **options)
+            self.assertEqual(read_csvs(parallel_dir), read_csvs(serial_dir),
+                             '{0} processes'.format(processes))
+
+    def test_csv(self):
+        self.assert_same_as_serial()
+
+    def test_geometry(self):
+        self.assert_same_as_serial(geometry=True)
+
+if __name__ == '__main__':
+    unittest.main()
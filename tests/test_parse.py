@@ -0,0 +1,46 @@
+"""
+Every parser backend gives the same export.
+"""
+
+import unittest
+
+from osmwrangle import parse
+from osmwrangle.export import process_map
+
+from .support import ExportTestCase, read_csvs
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+class ParserBackendTest(ExportTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(ParserBackendTest, cls).setUpClass()
+        cls.etree_dir = cls.out_dir('etree')
+        process_map(cls.osm_file, validate=True, out_dir=cls.etree_dir)
+
+    def assert_same_as_etree(self, backend):
+        out_dir = self.out_dir(backend)
+        parse.set_parser_backend(backend)
+        try:
+            process_map(self.osm_file, validate=True, out_dir=out_dir)
+        finally:
+            parse.set_parser_backend('etree')
+        self.assertEqual(read_csvs(out_dir), read_csvs(self.etree_dir))
+
+    def test_expat(self):
+        self.assert_same_as_etree('expat')
+
+    @unittest.skipIf(lxml is None, "lxml is not installed")
+    def test_lxml(self):
+        self.assert_same_as_etree('lxml')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(Exception):
+            parse.set_parser_backend('sax')
+
+if __name__ == '__main__':
+    unittest.main()
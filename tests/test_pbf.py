@@ -0,0 +1,66 @@
+"""
+A PBF file gives the same elements, and the same export, as its XML twin.
+"""
+
+import os
+import unittest
+
+from osmwrangle import pbf
+from osmwrangle.export import process_map, process_map_parallel
+from osmwrangle.parse import get_element
+
+from .support import ExportTestCase, read_csvs
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+TINY_OSM = os.path.join(DATA_DIR, 'tiny.osm')
+# tiny.osm encoded with DenseNodes, and with plain Nodes, two elements per block
+TINY_PBFS = [os.path.join(DATA_DIR, 'tiny.osm.pbf'), os.path.join(DATA_DIR, 'tiny-plain.osm.pbf')]
+
+def element_tuples(osm_file):
+    return [(element.tag, dict(element.attrib), [(child.tag, dict(child.attrib))
+                                                 for child in element])
+            for element in get_element(osm_file)]
+
+class PBFTest(ExportTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(PBFTest, cls).setUpClass()
+        cls.xml_dir = cls.out_dir('xml')
+        process_map(TINY_OSM, validate=True, out_dir=cls.xml_dir)
+
+    def test_is_pbf(self):
+        self.assertFalse(pbf.is_pbf(TINY_OSM))
+        for pbf_file in TINY_PBFS:
+            self.assertTrue(pbf.is_pbf(pbf_file))
+
+    def test_elements(self):
+        expected = element_tuples(TINY_OSM)
+        self.assertEqual(len(expected), 9)
+        for pbf_file in TINY_PBFS:
+            self.assertEqual(element_tuples(pbf_file), expected, pbf_file)
+
+    def test_export(self):
+        for pbf_file in TINY_PBFS:
+            out_dir = self.out_dir('pbf')
+            process_map(pbf_file, validate=True, out_dir=out_dir)
+            self.assertEqual(read_csvs(out_dir), read_csvs(self.xml_dir), pbf_file)
+
+    def test_workers(self):
+        workers = pbf.PBF_WORKERS
+        pbf.set_pbf_workers(2)
+        try:
+            for pbf_file in TINY_PBFS:
+                self.assertEqual(element_tuples(pbf_file), element_tuples(TINY_OSM), pbf_file)
+        finally:
+            pbf.set_pbf_workers(workers)
+
+    def test_parallel(self):
+        self.assertGreater(len(pbf.pbf_shards(TINY_PBFS[0], 3)), 1)
+        for pbf_file in TINY_PBFS:
+            out_dir = self.out_dir('pbf-parallel')
+            process_map_parallel(pbf_file, validate=True, processes=3, out_dir=out_dir)
+            self.assertEqual(read_csvs(out_dir), read_csvs(self.xml_dir), pbf_file)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+The pipelined export writes the same .csv files as the serial one, in threads or processes.
+"""
+
+import os
+import unittest
+
+from osmwrangle.export import process_map
+from osmwrangle.pipeline import process_map_pipelined
+
+from .support import ExportTestCase, read_csvs
+
+class PipelineTest(ExportTestCase):
+
+    def assert_same_as_serial(self, **options):
+        serial_dir = self.out_dir('serial')
+        process_map(self.osm_file, validate=True, out_dir=serial_dir, **options)
+        for workers in ('thread', 'process'):
+            pipeline_dir = self.out_dir('pipeline-' + workers)
+            process_map_pipelined(self.osm_file, validate=True, out_dir=pipeline_dir,
+                                  workers=workers, **options)
+            self.assertEqual(read_csvs(pipeline_dir), read_csvs(serial_dir), workers)
+
+    def test_csv(self):
+        self.assert_same_as_serial()
+
+    def test_geometry(self):
+        self.assert_same_as_serial(geometry=True)
+
+    def test_error(self):
+        # a node without coordinates: the error of the shape stage stops the whole pipeline
+        bad_file = os.path.join(self.tmp, 'no-coordinates.osm')
+        with open(bad_file, 'wb') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n'
+                    ' <node id="1" version="1" timestamp="2014-12-20T11:43:00Z" '
+                    'changeset="1" uid="1" user="user1"/>\n</osm>\n')
+        for workers in ('thread', 'process'):
+            with self.assertRaises(Exception):
+                process_map_pipelined(bad_file, validate=True, out_dir=self.out_dir('error'),
+                                      workers=workers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Elements that fail are quarantined, and the rest exported the same way, by every kind of export.
+"""
+
+import json
+import os
+import re
+import unittest
+
+from osmwrangle.checkpoint import process_map_checkpointed
+from osmwrangle.export import process_map, process_map_parallel
+from osmwrangle.pipeline import process_map_pipelined
+from osmwrangle.quarantine import QUARANTINE_PATH
+
+from .support import ExportTestCase, read_csv_rows, read_csvs
+
+class QuarantineTest(ExportTestCase):
+
+    BAD_WAY = 100  # the way given a node ref that is not a number (half way through the ways)
+
+    @classmethod
+    def setUpClass(cls):
+        super(QuarantineTest, cls).setUpClass()
+        with open(cls.osm_file, 'rb') as f:
+            osm = f.read()
+        way = re.search(r'<way id="{0}" [^>]*>\s*<nd ref="\d+"'.format(cls.BAD_WAY), osm)
+        start, end = way.span()
+        cls.bad_file = os.path.join(cls.tmp, 'bad.osm')
+        with open(cls.bad_file, 'wb') as f:
+            f.write(osm[:start] + re.sub(r'ref="\d+"', 'ref="xx"', osm[start:end]) + osm[end:])
+
+        cls.expected_dir = cls.out_dir('serial')
+        process_map(cls.bad_file, validate=False, out_dir=cls.expected_dir, quarantine=True)
+
+    def test_serial(self):
+        records = []
+        with open(os.path.join(self.expected_dir, QUARANTINE_PATH), 'rb') as f:
+            for line in f:
+                records.append(json.loads(line))
+        self.assertEqual([(r['type'], r['element']['attrib']['id']) for r in records],
+                         [('shape.ValueError', str(self.BAD_WAY))])
+
+        # nothing of the way is written, all the rest is
+        for table in ('ways.csv', 'ways_nodes.csv', 'ways_tags.csv'):
+            ids = set(row['id'] for row in read_csv_rows(os.path.join(self.expected_dir, table)))
+            self.assertNotIn(unicode(self.BAD_WAY), ids, table)
+            self.assertIn(unicode(self.BAD_WAY + 1), ids, table)
+
+    def test_no_quarantine(self):
+        with self.assertRaises(ValueError):
+            process_map(self.bad_file, validate=False, out_dir=self.out_dir('stop'))
+
+    def assert_same_as_serial(self, out_dir):
+        self.assertEqual(read_csvs(out_dir), read_csvs(self.expected_dir))
+        with open(os.path.join(out_dir, QUARANTINE_PATH), 'rb') as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_parallel(self):
+        out_dir = self.out_dir('parallel')
+        process_map_parallel(self.bad_file, validate=False, processes=3, out_dir=out_dir,
+                             quarantine=True)
+        self.assert_same_as_serial(out_dir)
+
+    def test_pipelined(self):
+        for workers in ('thread', 'process'):
+            out_dir = self.out_dir('pipeline-' + workers)
+            process_map_pipelined(self.bad_file, validate=False, out_dir=out_dir,
+                                  workers=workers, quarantine=True)
+            self.assert_same_as_serial(out_dir)
+
+    def test_checkpointed(self):
+        out_dir = self.out_dir('checkpoint')
+        process_map_checkpointed(self.bad_file, validate=False, out_dir=out_dir, every=500,
+                                 quarantine=True)
+        self.assert_same_as_serial(out_dir)
+
+class IndexQuarantineTest(ExportTestCase):
+
+    BAD_NODE = 50  # the node given a latitude that is not a number
+
+    @classmethod
+    def setUpClass(cls):
+        super(IndexQuarantineTest, cls).setUpClass()
+        with open(cls.osm_file, 'rb') as f:
+            osm = f.read()
+        cls.bad_file = os.path.join(cls.tmp, 'bad-node.osm')
+        with open(cls.bad_file, 'wb') as f:
+            f.write(re.sub(r'(<node id="{0}" lat=)"[^"]*"'.format(cls.BAD_NODE), r'\1"abc"', osm))
+
+    def assert_node_quarantined(self, out_dir):
+        with open(os.path.join(out_dir, QUARANTINE_PATH), 'rb') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([(r['type'], r['element']['attrib']['id']) for r in records],
+                         [('index.ValueError', str(self.BAD_NODE))])
+        ids = set(row['id'] for row in read_csv_rows(os.path.join(out_dir, 'nodes.csv')))
+        self.assertNotIn(unicode(self.BAD_NODE), ids)
+        self.assertIn(unicode(self.BAD_NODE + 1), ids)
+
+    def test_geometry(self):
+        out_dir = self.out_dir('geometry')
+        process_map(self.bad_file, validate=False, out_dir=out_dir, geometry=True,
+                    quarantine=True)
+        self.assert_node_quarantined(out_dir)
+
+        parallel_dir = self.out_dir('geometry-parallel')
+        process_map_parallel(self.bad_file, validate=False, processes=3, out_dir=parallel_dir,
+                             geometry=True, quarantine=True)
+        self.assert_node_quarantined(parallel_dir)
+        self.assertEqual(read_csvs(parallel_dir), read_csvs(out_dir))
+
+    def test_spatial(self):
+        out_dir = self.out_dir('spatial')
+        process_map(self.bad_file, validate=False, out_dir=out_dir, spatial=True,
+                    quarantine=True)
+        self.assert_node_quarantined(out_dir)
+
+    def test_no_quarantine(self):
+        with self.assertRaises(ValueError):
+            process_map(self.bad_file, validate=False, out_dir=self.out_dir('stop'),
+                        geometry=True)
+
+if __name__ == '__main__':
+    unittest.main()
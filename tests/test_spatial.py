@@ -0,0 +1,50 @@
+"""
+Nearest node queries over the tile index find the same nodes as a scan of the .csv files.
+"""
+
+import os
+import unittest
+
+from osmwrangle.export import process_map
+from osmwrangle.geometry import distance
+from osmwrangle.spatial import SpatialQuery
+
+from .support import ExportTestCase, read_csv_rows
+
+class NearestTest(ExportTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(NearestTest, cls).setUpClass()
+        cls.spatial_dir = cls.out_dir('spatial')
+        process_map(cls.osm_file, validate=True, out_dir=cls.spatial_dir, spatial=True)
+        cls.nodes = dict((row['id'], row) for row in
+                         read_csv_rows(os.path.join(cls.spatial_dir, 'nodes.csv')))
+        cls.tags = read_csv_rows(os.path.join(cls.spatial_dir, 'nodes_tags.csv'))
+
+    def scan(self, lat, lon, key, value, n):
+        """The ids of the n nodes nearest to a point with a regular key (and value)"""
+
+        ids = set(tag['id'] for tag in self.tags if tag['type'] == 'regular' and
+                  tag['key'] == key and (value is None or tag['value'] == value))
+        ranked = sorted((distance(lat, lon, float(self.nodes[i]['lat']),
+                                  float(self.nodes[i]['lon'])), i) for i in ids)
+        return [node_id for _, node_id in ranked[:n]]
+
+    def test_nearest(self):
+        query = SpatialQuery(self.spatial_dir)
+        try:
+            # inside the extract, at its edge, and far away from it (the whole index is searched)
+            for lat, lon in [(21.35, -157.75), (21.2739, -157.7068), (40.0, -100.0),
+                             (-33.9, 151.2)]:
+                for value, n in [('cafe', 1), ('restaurant', 5), (None, 200),
+                                 ('no such value', 3)]:
+                    found = query.nearest(lat, lon, key='amenity', value=value, n=n)
+                    self.assertEqual([node['id'] for _, node in found],
+                                     self.scan(lat, lon, 'amenity', value, n),
+                                     (lat, lon, value, n))
+        finally:
+            query.close()
+
+if __name__ == '__main__':
+    unittest.main()
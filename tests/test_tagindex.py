@@ -0,0 +1,41 @@
+"""
+The tag index stores and looks up the ids of each tag, negative ids included.
+"""
+
+import os
+import unittest
+
+from osmwrangle.tagindex import TagIndex, decode_postings, encode_postings
+
+from .support import ExportTestCase
+
+class PostingsTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for ids in ([5], [0], [-1], [-3, -2, -1, 4, 7], [-(1 << 40), 1 << 40],
+                    [1, 2, 3, 250, 100000], [(1 << 62) + 1]):
+            typecode, data = encode_postings(list(reversed(ids)))
+            self.assertEqual(decode_postings(typecode, data), ids)
+
+    def test_small_deltas(self):
+        typecode, _ = encode_postings(range(1000, 1200))
+        self.assertEqual(typecode, 'H')
+
+class TagIndexTest(ExportTestCase):
+
+    def test_negative_ids(self):
+        # new elements of OSM editor output
+        path = os.path.join(self.out_dir('tags'), 'tags.idx')
+        index = TagIndex(path, mode='w')
+        tags = [{'type': 'regular', 'key': 'amenity', 'value': 'cafe'}]
+        for node_id in (-3, -2, 5):
+            index.add('node', str(node_id), tags)
+        index.add('way', '-1', [{'type': 'addr', 'key': 'street', 'value': 'Paki Avenue'}])
+        index.save()
+
+        with TagIndex(path) as index:
+            self.assertEqual(index.ids('amenity', 'cafe', 'node'), [-3, -2, 5])
+            self.assertEqual(index.ids('addr:street', element='way'), [-1])
+
+if __name__ == '__main__':
+    unittest.main()
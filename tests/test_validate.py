@@ -0,0 +1,78 @@
+"""
+The compiled validator reports the same errors as cerberus.
+"""
+
+import unittest
+
+from osmwrangle.schema import schema
+from osmwrangle.validate import CompiledValidator, ValidationError, validate_element
+from osmwrangle.waynodes import WayNodes
+
+try:
+    import cerberus
+except ImportError:
+    cerberus = None
+
+NODE = {'id': '1', 'lat': '21.3', 'lon': '-157.8', 'user': 'u', 'uid': '3', 'version': '1',
+        'changeset': '4', 'timestamp': '2017-01-01T00:00:00Z'}
+WAY = {'id': '1', 'user': 'u', 'uid': '3', 'version': '1', 'changeset': '4',
+       'timestamp': '2017-01-01T00:00:00Z'}
+TAG = {'id': '1', 'key': 'k', 'value': 'v', 'type': 'regular'}
+
+def changed(row, field, value):
+    row = dict(row)
+    if value is KeyError:
+        del row[field]
+    else:
+        row[field] = value
+    return row
+
+def bad_elements():
+    """Elements with errors in the dict tables, the rows of the list tables and the tables"""
+
+    for field, value in [('id', None), ('id', 'x'), ('id', True), ('lat', None), ('lat', 'y'),
+                         ('lat', 3), ('lat', [1]), ('user', None), ('user', 5), ('version', 1),
+                         ('uid', ''), ('lat', KeyError), ('extra', 1)]:
+        yield {'node': changed(NODE, field, value), 'node_tags': []}
+    for field, value in [('id', None), ('id', 'x'), ('key', None), ('key', 3), ('key', KeyError),
+                         ('more', 'x')]:
+        yield {'node': NODE, 'node_tags': [TAG, changed(TAG, field, value)]}
+    for rows in ['x', None, [None], ['x']]:
+        yield {'node': NODE, 'node_tags': rows}
+    yield {'node': None, 'node_tags': []}
+    yield {'node': NODE, 'node_tags': [], 'bogus': 1}
+    for field, value in [('min_lat', None), ('min_lat', 3), ('min_lat', 'x'), ('length', 2.5)]:
+        yield {'way': changed(WAY, field, value), 'way_nodes': [], 'way_tags': []}
+    yield {'way': WAY, 'way_nodes': WayNodes('1', ['5', 'z']), 'way_tags': []}
+
+@unittest.skipIf(cerberus is None, "cerberus is not installed")
+class CompiledValidatorTest(unittest.TestCase):
+
+    def test_same_errors_as_cerberus(self):
+        for element in bad_elements():
+            expected, compiled = cerberus.Validator(), CompiledValidator()
+            if isinstance(element.get('way_nodes'), WayNodes):
+                valid = expected.validate(dict(element, way_nodes=element['way_nodes'].rows()),
+                                          schema)
+            else:
+                valid = expected.validate(element, schema)
+            self.assertEqual(compiled.validate(element, schema), valid, element)
+            self.assertEqual(compiled.errors, expected.errors, element)
+
+    def test_same_message(self):
+        element = {'node': changed(NODE, 'lat', None), 'node_tags': []}
+        messages = []
+        for validator in (cerberus.Validator(), CompiledValidator()):
+            with self.assertRaises(ValidationError) as raised:
+                validate_element(element, validator)
+            self.assertEqual(raised.exception.field, 'node')
+            messages.append(str(raised.exception))
+        self.assertEqual(messages[0], messages[1])
+
+    def test_valid(self):
+        element = {'node': NODE, 'node_tags': [TAG]}
+        self.assertTrue(CompiledValidator().validate(element, schema))
+        self.assertTrue(cerberus.Validator().validate(element, schema))
+
+if __name__ == '__main__':
+    unittest.main()